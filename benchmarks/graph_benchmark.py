@@ -0,0 +1,71 @@
+#  Copyright 2024 Switch
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Measures building, writing and opening a co-author graph and the latency of neighborhood queries on the memory-mapped graph.
+
+Run from the repository root: python -m benchmarks.graph_benchmark [publications] [orcids]
+"""
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from pid_resolver_lib.coauthor_graph import build_coauthor_graph, open_coauthor_graph, write_coauthor_graph
+from pid_resolver_lib.pid_analyzer import AuthorInfo, PublicationInfo
+
+
+def _make_publications(number_of_publications: int, number_of_orcids: int):
+    orcids = [f'0000-{idx // 10000:04d}-{idx % 10000:04d}-000X' for idx in range(number_of_orcids)]
+
+    return [PublicationInfo(f'10.1/{idx}', None, [AuthorInfo('Given', 'Family', orcid, 'doi', None)
+                                                  for orcid in random.sample(orcids, random.randint(1, 8))])
+            for idx in range(number_of_publications)]
+
+
+def main():
+    args = list(map(int, sys.argv[1:]))
+    number_of_publications, number_of_orcids = args + [200000, 200000][len(args):]
+
+    publications = _make_publications(number_of_publications, number_of_orcids)
+
+    start = time.perf_counter()
+    graph = build_coauthor_graph(publications)
+    print(f'build:                {time.perf_counter() - start:6.2f}s ({graph.number_of_nodes} nodes, {graph.number_of_edges} edges)')
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        start = time.perf_counter()
+        write_coauthor_graph(graph, Path(tmp_dir))
+        print(f'write:                {time.perf_counter() - start:6.2f}s')
+
+        queries = random.sample(list(graph.nodes), min(10000, graph.number_of_nodes))
+
+        start = time.perf_counter()
+        with open_coauthor_graph(Path(tmp_dir)) as mapped:
+            print(f'open:                 {(time.perf_counter() - start) * 1000:6.2f}ms')
+
+            start = time.perf_counter()
+            for orcid in queries:
+                mapped.neighbors(orcid)
+            print(f'{len(queries)} neighbor queries: {time.perf_counter() - start:6.2f}s')
+
+            start = time.perf_counter()
+            for orcid in queries[:1000]:
+                mapped.neighborhood([orcid], 2)
+            print(f'1000 two-hop queries: {time.perf_counter() - start:6.2f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+#  Copyright 2024 Switch
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Compares the standard library's json module with orjson (requires orjson) for decoding DataCite records and ORCID profiles
+and for encoding the resolved DOIs.
+
+Run from the repository root: python -m benchmarks.json_benchmark [repetitions]
+"""
+import sys
+import time
+from typing import Callable
+
+from pid_resolver_lib import json_backend
+from pid_resolver_lib.pid_analyzer import normalize_doi_record_datacite
+
+
+def _measure(label: str, work: Callable[[], object]) -> None:
+    orjson = json_backend.orjson
+
+    results = []
+    for backend in [None, orjson]:
+        json_backend.orjson = backend
+        start = time.perf_counter()
+        work()
+        results.append(time.perf_counter() - start)
+
+    json_backend.orjson = orjson
+
+    print(f'{label:16} json: {results[0]:6.2f}s, orjson: {results[1]:6.2f}s, speedup: {results[0] / results[1]:4.1f}x')
+
+
+def main():
+    repetitions = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    if json_backend.orjson is None:
+        print('orjson is not installed or disabled, install pid_resolver_lib[orjson]')
+        exit(1)
+
+    with open('tests/testdata/datacite_test.json') as f:
+        datacite_json = f.read()
+
+    with open('tests/testdata/orcid_test.json') as f:
+        orcid_json = f.read()
+
+    publication = normalize_doi_record_datacite('10.5281/zenodo.7908081', datacite_json)
+    resolved_dois = {f'10.5281/zenodo.{idx}': publication for idx in range(repetitions * 10)}
+
+    _measure('DataCite records', lambda: [normalize_doi_record_datacite('10.5281/zenodo.7908081', datacite_json) for _ in range(repetitions)])
+    _measure('ORCID profiles', lambda: [json_backend.loads(orcid_json) for _ in range(repetitions)])
+    _measure('results', lambda: json_backend.dumps(resolved_dois))
+
+
+if __name__ == '__main__':
+    main()
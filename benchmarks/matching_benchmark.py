@@ -0,0 +1,56 @@
+#  Copyright 2024 Switch
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Compares matching authors against ORCID profiles author by author (match_orcid_profiles) with the batch matcher (requires numpy).
+
+Run from the repository root: python -m benchmarks.matching_benchmark [publications] [profiles_per_publication] [authors_per_publication]
+"""
+import random
+import sys
+import time
+
+from pid_resolver_lib.batch_matcher import match_orcid_profiles_batch
+from pid_resolver_lib.pid_analyzer import AuthorInfo, OrcidProfile, PublicationInfo, match_orcid_profiles
+
+
+def main():
+    args = list(map(int, sys.argv[1:]))
+    number_of_publications, profiles_per_publication, authors_per_publication = args + [200, 500, 200][len(args):]
+
+    given_names = [f'Given{idx}' for idx in range(300)] + ['J.', 'M', 'A. B.']
+    family_names = [f'Family{idx}' for idx in range(50)] + ['van der Berg', 'Di Nucci']
+
+    orcid_info = {}
+    publications = []
+    for pub_idx in range(number_of_publications):
+        doi = f'10.1/{pub_idx}'
+        orcid_info[doi] = [OrcidProfile(f'https://orcid.org/0000-0000-{pub_idx:04d}-{idx:04d}', random.choice(given_names), random.choice(family_names))
+                           for idx in range(profiles_per_publication)]
+        publications.append(PublicationInfo(doi, None, [AuthorInfo(random.choice(given_names), random.choice(family_names), None, None, None)
+                                                        for _ in range(authors_per_publication)]))
+
+    start = time.perf_counter()
+    by_author = list(map(lambda pub: match_orcid_profiles(pub, orcid_info), publications))
+    print(f'author by author: {time.perf_counter() - start:6.2f}s')
+
+    start = time.perf_counter()
+    batch = list(map(lambda pub: match_orcid_profiles_batch(pub, orcid_info, min_profiles=0), publications))
+    print(f'batch:            {time.perf_counter() - start:6.2f}s')
+
+    assert batch == by_author
+
+
+if __name__ == '__main__':
+    main()
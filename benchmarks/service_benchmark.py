@@ -0,0 +1,121 @@
+#  Copyright 2024 Switch
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Measures the throughput of the resolver service against a local mock upstream (doi.org and its /ra endpoint).
+
+Compares resolving each request with a fresh Resolver and cleared memos (as a worker spawning a CLI run does)
+with a single ResolverService that keeps caches, the session and the ORCID index warm and coalesces requests.
+
+Run from the repository root: python -m benchmarks.service_benchmark [requests] [distinct_dois] [clients] [latency_ms]
+"""
+import asyncio
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, List
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from pid_resolver_lib.memo import clear_memos
+from pid_resolver_lib.resolver import Resolver
+from pid_resolver_lib.service import ResolverService
+
+
+class MockUpstream:
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.requests = 0
+
+        with open('tests/testdata/datacite_test.json') as f:
+            self.datacite_json = f.read()
+
+    async def _handle_ra(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        return web.json_response([{'DOI': request.match_info['prefix'], 'RA': 'DataCite'}])
+
+    async def _handle_doi(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        return web.Response(text=self.datacite_json, content_type='application/ld+json')
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.add_routes([web.get('/ra/{prefix}', self._handle_ra), web.get('/{doi:.+}', self._handle_doi)])
+        return app
+
+
+async def _run_clients(workload: List[str], clients: int, resolve: Callable[[str], Awaitable[None]]) -> float:
+    queue: asyncio.Queue = asyncio.Queue()
+    for doi in workload:
+        queue.put_nowait(doi)
+
+    async def client():
+        while not queue.empty():
+            await resolve(queue.get_nowait())
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(clients)])
+    return time.perf_counter() - start
+
+
+async def benchmark(number_of_requests: int, distinct_dois: int, clients: int, latency: float) -> None:
+    dois = [f'10.5281/zenodo.{idx}' for idx in range(distinct_dois)]
+    workload = [random.choice(dois) for _ in range(number_of_requests)]
+
+    upstream = MockUpstream(latency)
+
+    async with TestServer(upstream.make_app()) as upstream_server:
+        base_url = str(upstream_server.make_url('')).rstrip('/')
+
+        # cold: a fresh resolver per request, in-process memos are lost as with a new CLI run
+        with tempfile.TemporaryDirectory() as cache_root:
+            async def resolve_cold(doi: str) -> None:
+                clear_memos()
+                resolver = Resolver(cache_root=Path(cache_root), doi_base_url=base_url)
+                [pub async for pub in resolver.resolve([doi])]
+
+            upstream.requests = 0
+            elapsed = await _run_clients(workload, clients, resolve_cold)
+            print(f'per-request resolver: {number_of_requests / elapsed:8.1f} requests/s, {upstream.requests} upstream requests')
+
+        # warm: one service answering all clients over HTTP
+        with tempfile.TemporaryDirectory() as cache_root:
+            clear_memos()
+            service = ResolverService(Resolver(cache_root=Path(cache_root), doi_base_url=base_url))
+
+            async with TestClient(TestServer(service.make_app())) as client:
+                async def resolve_service(doi: str) -> None:
+                    async with client.get(f'/doi/{doi}') as response:
+                        await response.read()
+
+                upstream.requests = 0
+                elapsed = await _run_clients(workload, clients, resolve_service)
+                print(f'service:              {number_of_requests / elapsed:8.1f} requests/s, {upstream.requests} upstream requests, {service.stats}')
+
+
+def main():
+    args = list(map(float, sys.argv[1:]))
+    number_of_requests, distinct_dois, clients, latency_ms = args + [500, 50, 20, 50][len(args):]
+
+    asyncio.run(benchmark(int(number_of_requests), int(distinct_dois), int(clients), latency_ms / 1000))
+
+
+if __name__ == '__main__':
+    main()
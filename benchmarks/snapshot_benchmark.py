@@ -0,0 +1,78 @@
+#  Copyright 2024 Switch
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Compares loading resolved DOIs from results.json with loading them from a binary snapshot.
+
+Run from the repository root: python -m benchmarks.snapshot_benchmark [publications]
+"""
+import json
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from pid_resolver_lib.pid_analyzer import AuthorInfo, PublicationInfo, parse_resolved_dois_from_json
+from pid_resolver_lib.snapshot import get_snapshot_file, load_resolved_dois, open_snapshot, write_snapshot
+
+
+def _make_publications(number_of_publications: int):
+    names = [f'Name{idx}' for idx in range(number_of_publications // 10 + 1)]
+
+    def make_author(idx: int) -> AuthorInfo:
+        orcid = random.choice([None, f'0000-0001-{idx % 10000:04d}-000X'])
+        return AuthorInfo(random.choice(names), random.choice(names), orcid, None if orcid is None else 'doi',
+                          random.choice([None, ['https://ror.org/02p0gd045']]))
+
+    return {f'10.{idx % 500}/{idx}': PublicationInfo(f'10.{idx % 500}/{idx}', f'Title of publication {idx}',
+                                                      [make_author(idx) for _ in range(random.randint(1, 8))])
+            for idx in range(number_of_publications)}
+
+
+def main():
+    number_of_publications = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+
+    resolved_dois = _make_publications(number_of_publications)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        results_json = Path(tmp_dir) / 'results.json'
+
+        with open(results_json, 'w') as f:
+            f.write(json.dumps(resolved_dois))
+
+        start = time.perf_counter()
+        write_snapshot(resolved_dois, get_snapshot_file(results_json))
+        print(f'write snapshot:       {time.perf_counter() - start:6.2f}s')
+
+        print(f'size JSON / snapshot: {results_json.stat().st_size / 1e6:.1f} MB / {get_snapshot_file(results_json).stat().st_size / 1e6:.1f} MB')
+
+        start = time.perf_counter()
+        from_json = parse_resolved_dois_from_json(results_json)
+        print(f'load JSON:            {time.perf_counter() - start:6.2f}s')
+
+        start = time.perf_counter()
+        from_snapshot = load_resolved_dois(results_json)
+        print(f'load snapshot:        {time.perf_counter() - start:6.2f}s')
+
+        assert from_json == from_snapshot
+
+        start = time.perf_counter()
+        with open_snapshot(get_snapshot_file(results_json)) as snapshot:
+            snapshot[next(iter(resolved_dois))]
+        print(f'open and look up one: {time.perf_counter() - start:6.2f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -13,7 +13,46 @@
 #  limitations under the License.
 #
 
-from .pid_resolver import *
-from .pid_analyzer import *
-from .doi_ra_handler import *
-__all__ = ['pid_resolver', 'pid_analyzer', 'doi_ra_handler']
+import importlib
+import importlib.util
+import pkgutil
+from typing import Any, List
+
+# the names exported by these modules are available from the package, the modules (and aiohttp, lxml, diskcache)
+# are imported on first access, so a command like pid_resolver_infer does not import them unless it needs them
+_REEXPORTING_MODULES = ['pid_resolver', 'pid_analyzer', 'doi_ra_handler']
+
+
+def _get_exported_names() -> List[str]:
+    """
+    Returns the modules re-exporting names and the names they export, imports the modules.
+    """
+
+    modules = list(map(lambda module_name: importlib.import_module(f'.{module_name}', __name__), _REEXPORTING_MODULES))
+
+    return list(dict.fromkeys(_REEXPORTING_MODULES + [name for module in modules for name in getattr(module, '__all__', [])]))
+
+
+def __getattr__(name: str) -> Any:
+    # computed on first access, e.g., by `from pid_resolver_lib import *`, like the names of the former star imports
+    if name == '__all__':
+        return _get_exported_names()
+
+    # submodules, e.g., `from . import json_backend`
+    if name in _REEXPORTING_MODULES or importlib.util.find_spec(f'.{name}', __name__) is not None:
+        return importlib.import_module(f'.{name}', __name__)
+
+    # later modules take precedence like with star imports
+    for module_name in reversed(_REEXPORTING_MODULES):
+        module = importlib.import_module(f'.{module_name}', __name__)
+
+        if name in getattr(module, '__all__', []):
+            return getattr(module, name)
+
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def __dir__() -> List[str]:
+    submodules = list(map(lambda module: module.name, pkgutil.iter_modules(__path__)))
+
+    return sorted(set(globals()) | set(submodules) | set(_get_exported_names()))
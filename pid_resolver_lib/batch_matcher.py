@@ -0,0 +1,184 @@
+#  Copyright 2024 Switch
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import logging
+from collections import Counter
+from typing import Any, Dict, List, NamedTuple, Tuple
+
+from .doi_reader import canonical_doi
+from .pid_analyzer import AuthorInfo, NameKey, OrcidProfile, PublicationInfo, make_name_key, match_orcid_profiles
+
+try:
+    import numpy as np # type: ignore
+except ImportError:  # numpy is an optional dependency, install pid_resolver_lib[numpy]
+    np = None # type: ignore
+
+BATCH_MATCHER = 'BATCH MATCHER:'
+
+# publications with fewer ORCID profiles are matched author by author, building the arrays would not pay off
+MIN_PROFILES = 64
+
+logger = logging.getLogger(__name__)
+
+
+class BatchMatchResult(NamedTuple):
+    """
+    Represents the outcome of matching all authors of a publication against its ORCID profiles at once.
+    """
+
+    authors: List[AuthorInfo] # 0 the authors, with the ORCIDs of profiles they uniquely match
+    ambiguous: List[int] # 1 indices of authors matching several profiles, no ORCID is assigned to them
+    shared: Dict[str, List[int]] # 2 ORCIDs assigned to several authors (many-to-one), indices of these authors
+
+
+def is_available() -> bool:
+    """
+    Returns True if numpy is installed.
+    """
+    return np is not None
+
+
+class _NameKeyArrays(NamedTuple):
+    """
+    Represents the name keys of several names as arrays of integer codes, one entry per name.
+    """
+
+    given_name: Any # 0 code of the normalized given name
+    first_surname: Any # 1 code of the first token of the family name
+    first_given_name: Any # 2 code of the first token of the given name
+    first_char: Any # 3 code of the first character of the given name
+    length: Any # 4 length of the given name
+    abbreviated: Any # 5 True if the given name's second character is a dot or a space, e.g., "j. m."
+
+
+def _encode(values: List[str], codes: Dict[str, int]) -> Any:
+    # equal strings get equal codes, so strings are compared as integers
+    return np.fromiter(map(lambda value: codes.setdefault(value, len(codes)), values), dtype=np.int64, count=len(values))
+
+
+def _to_arrays(keys: List[NameKey], codes: Dict[str, int]) -> _NameKeyArrays:
+    return _NameKeyArrays(given_name=_encode(list(map(lambda key: key.given_name, keys)), codes),
+                          first_surname=_encode(list(map(lambda key: key.first_surname, keys)), codes),
+                          first_given_name=_encode(list(map(lambda key: key.first_given_name, keys)), codes),
+                          first_char=_encode(list(map(lambda key: key.given_name[:1], keys)), codes),
+                          length=np.fromiter(map(lambda key: len(key.given_name), keys), dtype=np.int64, count=len(keys)),
+                          abbreviated=np.fromiter(map(lambda key: key.given_name[1:2] in ('.', ' '), keys), dtype=bool, count=len(keys)))
+
+
+def match_name_keys(authors: List[NameKey], profiles: List[NameKey]) -> Any:
+    """
+    Compares each author's name key with each profile's name key, see names_match.
+
+    @param authors: Name keys of n authors.
+    @param profiles: Name keys of m profiles.
+    @return: Boolean array of shape (n, m), True where an author matches a profile.
+    """
+
+    codes: Dict[str, int] = {}
+    author = _to_arrays(authors, codes)
+    profile = _to_arrays(profiles, codes)
+
+    def pairwise(author_values: Any, profile_values: Any) -> Any:
+        return author_values[:, None] == profile_values[None, :]
+
+    # abbreviated given names, e.g., "j. m." or "j" match "jose maria"
+    abbreviation = pairwise(author.first_char, profile.first_char) & \
+        (((author.length > 1) & author.abbreviated)[:, None] & (profile.length > 1)[None, :] |
+         (author.length == 1)[:, None] & (profile.length > 0)[None, :])
+
+    # equal family names have equal first surnames, so equal full names are covered
+    return pairwise(author.first_surname, profile.first_surname) & \
+        (pairwise(author.given_name, profile.given_name) | abbreviation | pairwise(author.first_given_name, profile.first_given_name))
+
+
+def match_authors(authors: List[AuthorInfo], orcid_info: List[OrcidProfile]) -> BatchMatchResult:
+    """
+    Assigns ORCIDs to the authors of a publication whose ORCID is not contained in the DOI metadata, comparing all authors
+    with all ORCID profiles at once. An ORCID is assigned if an author matches exactly one profile, like match_orcid_profiles does.
+
+    @param authors: The publication's authors.
+    @param orcid_info: ORCID profiles associated with the publication.
+    """
+
+    if np is None:
+        raise ImportError('batch matching requires numpy, install pid_resolver_lib[numpy]')
+
+    profile_keys: List[Tuple[OrcidProfile, NameKey]] = []
+    for profile in orcid_info:
+        key = make_name_key(profile.given_name, profile.family_name)
+        if key is not None:
+            profile_keys.append((profile, key))
+
+    author_keys: List[Tuple[int, NameKey]] = []
+    for idx, author in enumerate(authors):
+        if author.orcid is not None or len(orcid_info) == 0:
+            continue
+
+        key = make_name_key(author.given_name, author.family_name)
+        if key is None:
+            logging.error(f'Name part has zero length: {author.given_name}, {author.family_name}')
+        else:
+            author_keys.append((idx, key))
+
+    assigned: Dict[int, str] = {}
+    ambiguous: List[int] = []
+
+    if len(author_keys) > 0 and len(profile_keys) > 0:
+        matches = match_name_keys(list(map(lambda item: item[1], author_keys)), list(map(lambda item: item[1], profile_keys)))
+        counts = matches.sum(axis=1).tolist()
+
+        for (idx, _), count, profile_idx in zip(author_keys, counts, matches.argmax(axis=1).tolist()):
+            if count == 1:
+                # get ORCID ID from URL
+                assigned[idx] = profile_keys[profile_idx][0].id.rsplit('/', 1)[-1]
+            elif count > 1:
+                ambiguous.append(idx)
+
+    authors_per_orcid = Counter(assigned.values())
+    shared = {orcid: [idx for idx, assigned_orcid in assigned.items() if assigned_orcid == orcid]
+              for orcid, count in authors_per_orcid.items() if count > 1}
+
+    # authors without ORCID in the DOI metadata get the assigned ORCID or none
+    return BatchMatchResult(list(map(lambda item: item[1] if item[1].orcid is not None else
+                                     item[1]._replace(orcid=assigned.get(item[0]), origin_orcid='orcid' if item[0] in assigned else None),
+                                     enumerate(authors))), ambiguous, shared)
+
+
+def match_orcid_profiles_batch(publication: PublicationInfo, orcid_info: Dict[str, List[OrcidProfile]],
+                               min_profiles: int = MIN_PROFILES) -> PublicationInfo:
+    """
+    Like match_orcid_profiles with identical results, but matches publications with many ORCID profiles using match_authors.
+
+    @param publication: Normalized publication, only containing ORCIDs from the DOI metadata.
+    @param orcid_info: ORCID profiles organized by canonical DOI, see group_orcids_per_doi.
+    @param min_profiles: Publications with fewer profiles are matched author by author.
+    """
+
+    profiles = orcid_info.get(canonical_doi(publication.doi), [])
+
+    if len(profiles) < min_profiles:
+        return match_orcid_profiles(publication, orcid_info)
+
+    result = match_authors(publication.authors, profiles)
+
+    if len(result.shared) > 0:
+        logger.info(f'{BATCH_MATCHER} {publication.doi}: ORCIDs assigned to several authors {result.shared}')
+
+    if len(result.ambiguous) > 0:
+        logger.debug(f'{BATCH_MATCHER} {publication.doi}: authors matching several profiles {result.ambiguous}')
+
+    return publication._replace(authors=result.authors)
+
+
+__all__ = ['match_authors', 'match_orcid_profiles_batch', 'match_name_keys', 'BatchMatchResult', 'is_available', 'MIN_PROFILES']
@@ -0,0 +1,180 @@
+#  Copyright 2024 Switch
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import asyncio
+import logging
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Set
+
+import aiohttp # type: ignore
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
+
+from . import json_backend
+from .pid_resolver import ResolvedRecord, _CacheWriter, read_text, records_not_in_cache
+
+BULK_FETCH = 'BULK FETCH:'
+
+# maximum number of DOIs packed into a request
+DOIS_PER_REQUEST = 100
+
+logger = logging.getLogger(__name__)
+
+
+class BulkEndpoint(NamedTuple):
+    """
+    Represents a REST API of an RA that returns the records of several DOIs per request.
+    """
+
+    url: str # 0
+    get_params: Callable[[List[str]], Dict[str, str]] # 1 query parameters requesting the records of the given DOIs
+    get_items: Callable[[Any], List[Dict]] # 2 records contained in a decoded response
+    get_doi: Callable[[Dict], str] # 3 DOI of a record
+    can_pack: Callable[[str], bool] # 4 False for DOIs that cannot be expressed in a query, they are fetched one by one
+
+
+def _crossref_params(dois: List[str]) -> Dict[str, str]:
+    # only the fields needed by normalize_doi_record_crossref_rest are requested
+    return {'filter': ','.join(map(lambda doi: f'doi:{doi}', dois)), 'rows': str(len(dois)), 'select': 'DOI,title,author'}
+
+
+def _datacite_params(dois: List[str]) -> Dict[str, str]:
+    # DOIs are indexed in lower case
+    query = ' OR '.join(map(lambda doi: f'"{doi.lower()}"', dois))
+
+    return {'query': f'doi:({query})', 'page[size]': str(len(dois)), 'affiliation': 'true'}
+
+
+BULK_ENDPOINTS: Dict[str, BulkEndpoint] = {
+    # https://api.crossref.org/swagger-ui/index.html#/Works/get_works
+    'Crossref': BulkEndpoint('https://api.crossref.org/works', _crossref_params, lambda res: res['message']['items'], lambda item: item['DOI'],
+                             lambda doi: ',' not in doi),
+    # https://support.datacite.org/docs/api-queries
+    'DataCite': BulkEndpoint('https://api.datacite.org/dois', _datacite_params, lambda res: res['data'], lambda item: item['attributes']['doi'],
+                             lambda doi: '"' not in doi and '\\' not in doi)
+}
+
+
+async def _make_bulk_request(session: ClientSession, dois: List[str], endpoint: BulkEndpoint, base_url: str) -> List[ResolvedRecord]:
+    """
+    Requests the records of several DOIs at once. DOIs missing from the response are omitted.
+
+    @param session: The aiohttp session to be used.
+    @param dois: DOIs to be requested.
+    @param endpoint: The REST API of the DOIs' RA.
+    @param base_url: URL of the API's endpoint.
+    """
+
+    try:
+        async with session.get(base_url, params=endpoint.get_params(dois)) as request:
+            if request.status != 200:
+                raise Exception(f'status {request.status}')
+
+            text = await read_text(request)
+
+        # a response contains many records, they are decoded and encoded in a thread to not block the event loop
+        return await asyncio.get_running_loop().run_in_executor(None, _parse_bulk_response, text, dois, endpoint)
+
+    except Exception as e:
+        logging.error(f'{BULK_FETCH} Error when resolving {len(dois)} DOIs starting with {dois[0]} {e}')
+        return []
+
+
+def _parse_bulk_response(text: str, dois: List[str], endpoint: BulkEndpoint) -> List[ResolvedRecord]:
+    items = endpoint.get_items(json_backend.loads(text))
+
+    # the API may return DOIs in another case than requested, records are cached under the requested DOIs
+    requested: Dict[str, List[str]] = {}
+    for doi in dois:
+        requested.setdefault(doi.lower(), []).append(doi)
+
+    return [ResolvedRecord(doi, json_backend.dumps(item)) for item in items for doi in requested.get(endpoint.get_doi(item).lower(), [])]
+
+
+async def _request_bulk_records(session: ClientSession, requests: List[List[str]], endpoint: BulkEndpoint, base_url: str) -> List[ResolvedRecord]:
+    results = await asyncio.gather(*map(lambda dois: _make_bulk_request(session, dois, endpoint, base_url), requests))
+
+    return [rec for result in results for rec in result]
+
+
+async def _fetch_bulk_batch(requests: List[List[str]], endpoint: BulkEndpoint, base_url: str, concurrency: int = 5,
+                            session: Optional[ClientSession] = None) -> List[ResolvedRecord]:
+    """
+    Given a batch of requests, each listing several DOIs, fetches them. See _fetch_record_batch.
+    """
+
+    if session is not None:
+        return await _request_bulk_records(session, requests, endpoint, base_url)
+
+    conn = TCPConnector(limit=concurrency)
+    time_out = ClientTimeout(total=60 * 60 * 24)
+    async with aiohttp.ClientSession(connector=conn, raise_for_status=True, timeout=time_out) as new_session:
+        return await _request_bulk_records(new_session, requests, endpoint, base_url)
+
+
+async def fetch_records_bulk(record_ids: List[str], cache_dir: Path, ra: str, sleep_per_batch: int = 0,
+                             post_fetch: Optional[Callable[[List[ResolvedRecord], Path], None]] = None, concurrency: int = 5,
+                             batch_size: int = 500, dois_per_request: int = DOIS_PER_REQUEST, session: Optional[ClientSession] = None,
+                             base_url: Optional[str] = None) -> List[str]:
+    """
+    Like fetch_records, but fetches DOIs from the REST API of their RA, packing up to dois_per_request DOIs into a request
+    instead of making a content negotiation request per DOI. The records are cached as returned by the API,
+    the normalizers in RECORD_NORMALIZERS accept both representations.
+
+    @param record_ids: DOIs of the RA to be fetched.
+    @param cache_dir: Directory the results are written to.
+    @param ra: The RA of the DOIs, see BULK_ENDPOINTS.
+    @param sleep_per_batch: Sleep in seconds after each batch to respect rate limits, if any.
+    @param post_fetch: Optional hook called with each batch of fetched records after they have been written to the cache.
+    @param concurrency: Maximum number of simultaneous connections.
+    @param batch_size: Number of requests per batch.
+    @param dois_per_request: Maximum number of DOIs per request.
+    @param session: An open session to be reused, see _fetch_record_batch.
+    @param base_url: URL of the API's endpoint, overriding the URL in BULK_ENDPOINTS.
+    @return: DOIs that are not cached after fetching, e.g., because the API does not know them. They can be fetched with fetch_records.
+    """
+
+    endpoint = BULK_ENDPOINTS[ra]
+    url = base_url if base_url is not None else endpoint.url
+
+    # DOIs are packed in the order they are given
+    not_cached = set(records_not_in_cache(record_ids, cache_dir))
+    records_not_cached = list(filter(lambda doi: doi in not_cached, dict.fromkeys(record_ids)))
+
+    packable = list(filter(endpoint.can_pack, records_not_cached))
+    requests = [packable[offset:offset + dois_per_request] for offset in range(0, len(packable), dois_per_request)]
+
+    logging.info(f'{BULK_FETCH} fetching number of records for {cache_dir}: {len(packable)} in {len(requests)} requests')
+
+    fetched: Set[str] = set()
+
+    # records are written while the next batch is fetched, see fetch_records
+    async with _CacheWriter(cache_dir, post_fetch, log_prefix=BULK_FETCH) as writer:
+        for offset in range(0, len(requests), batch_size):
+            logging.info(f'{BULK_FETCH} fetching batch: {offset}, {min(offset + batch_size, len(requests))}')
+
+            results = await _fetch_bulk_batch(requests[offset:offset + batch_size], endpoint, url, concurrency, session)
+
+            logging.info(f'{BULK_FETCH} results {len(results)}')
+            fetched.update(map(lambda rec: rec.rec_id, results))
+            await writer.put(results)
+
+            if offset + batch_size < len(requests):
+                # sleep because of rate limits
+                await asyncio.sleep(sleep_per_batch)
+
+    # records that could not be written are left to be fetched
+    return list(filter(lambda doi: doi not in fetched or doi in writer.failed, records_not_cached))
+
+
+__all__ = ['fetch_records_bulk', 'BulkEndpoint', 'BULK_ENDPOINTS', 'DOIS_PER_REQUEST']
@@ -13,32 +13,386 @@
 #  limitations under the License.
 #
 
+# annotations are not evaluated, so diskcache is only imported when a cache is opened
+from __future__ import annotations
+
+import logging
+import threading
+from contextlib import nullcontext
 from pathlib import Path
-from typing import List, Dict, Union
+from typing import List, Dict, Union, NamedTuple, Set, Iterable, Optional, ContextManager, Callable, cast, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from diskcache import Cache # type: ignore
 
-from diskcache import Cache # type: ignore
+from .memo import RECORD_MEMO
 
 CACHE_MAX_SIZE = int(4e9)
 
+CACHE = 'CACHE:'
+
+logger = logging.getLogger(__name__)
+
+# suffix of the side store holding normalized records next to a cache directory
+NORMALIZED_CACHE_SUFFIX = '_normalized'
+
+# suffix of the side store holding HTTP validators (ETag, Last-Modified) and content hashes next to a cache directory
+METADATA_CACHE_SUFFIX = '_meta'
+
+
+class CachePolicy(NamedTuple):
+    """
+    Represents the size limit and eviction policy of a cache directory.
+
+    Supported eviction policies are 'least-recently-stored', 'least-recently-used', 'least-frequently-used' and 'none' (never evict).
+    See https://grantjenks.com/docs/diskcache/tutorial.html#eviction-policies.
+    """
+
+    size_limit: int = CACHE_MAX_SIZE # 0
+    eviction_policy: str = 'least-recently-stored' # 1
+
+
+# policies configured per cache directory, caches not contained use the default policy
+_cache_policies: Dict[str, CachePolicy] = {}
+
+# number of pins per record that must not be evicted per cache directory, e.g., records used by the current request
+_pinned_records: Dict[str, Dict[str, int]] = {}
+
+# number of evicted records per cache directory since the last reset
+_evictions: Dict[str, int] = {}
+
+# caches kept open by a long-running process, see keep_caches_open
+_open_caches: Optional[Dict[str, Cache]] = None
+
+# caches are opened by the event loop and by the thread writing fetched records, see pid_resolver._CacheWriter
+_open_caches_lock = threading.Lock()
+
+
+def configure_cache(cache_dir: Path, size_limit: int = CACHE_MAX_SIZE, eviction_policy: str = 'least-recently-stored') -> None:
+    """
+    Sets the size limit and eviction policy of a cache directory.
+
+    @param cache_dir: The cache directory.
+    @param size_limit: Size limit in bytes. Records are evicted when the cache grows beyond this limit.
+    @param eviction_policy: One of 'least-recently-stored', 'least-recently-used', 'least-frequently-used', 'none'.
+    """
+
+    from diskcache.core import EVICTION_POLICY # type: ignore
+
+    if eviction_policy not in EVICTION_POLICY:
+        raise ValueError(f'Unknown eviction policy {eviction_policy}, expected one of {list(EVICTION_POLICY)}')
+
+    _cache_policies[str(cache_dir)] = CachePolicy(size_limit=size_limit, eviction_policy=eviction_policy)
+
+    # an open cache is reopened with the new policy
+    if _open_caches is not None and str(cache_dir) in _open_caches:
+        _open_caches.pop(str(cache_dir)).close()
+
+
+def get_cache_policy(cache_dir: Path) -> CachePolicy:
+    return _cache_policies.get(str(cache_dir), CachePolicy())
+
+
+def pin_records(keys: Iterable[str], cache_dir: Path) -> None:
+    """
+    Protects records from eviction until they are unpinned. Keys not (yet) contained in the cache may be pinned, too.
+    Pins are counted, so a record pinned several times, e.g., by concurrent requests, stays pinned until each pin is removed.
+
+    @param keys: Keys of the records to be pinned.
+    @param cache_dir: The cache directory.
+    """
+
+    pinned = _pinned_records.setdefault(str(cache_dir), {})
+
+    for key in set(keys):
+        pinned[key] = pinned.get(key, 0) + 1
+
+
+def unpin_records(cache_dir: Path, keys: Optional[Iterable[str]] = None) -> None:
+    """
+    Removes a pin of the given records, see pin_records.
+
+    @param cache_dir: The cache directory.
+    @param keys: Keys of the records to be unpinned as given to pin_records. If not given, all pins of the cache directory are removed.
+    """
+
+    if keys is None:
+        _pinned_records.pop(str(cache_dir), None)
+        return
+
+    pinned = _pinned_records.get(str(cache_dir), {})
+
+    for key in set(keys):
+        if pinned.get(key, 0) > 1:
+            pinned[key] -= 1
+        else:
+            pinned.pop(key, None)
+
+
+def get_eviction_report() -> Dict[str, int]:
+    """
+    Returns the number of evicted records per cache directory since the last reset.
+    """
+    return dict(_evictions)
+
+
+def reset_eviction_report() -> None:
+    _evictions.clear()
+
+
+def keep_caches_open() -> None:
+    """
+    Keeps caches open once they have been opened instead of opening them for every access, e.g., in a long-running service.
+    """
+    global _open_caches
+
+    if _open_caches is None:
+        _open_caches = {}
+
+
+def close_caches() -> None:
+    """
+    Closes the caches kept open and opens caches for every access again.
+    """
+    global _open_caches
+
+    if _open_caches is not None:
+        for cache_ref in _open_caches.values():
+            cache_ref.close()
+
+    _open_caches = None
+
+
+def _create_cache(cache_dir: Path) -> Cache:
+    from diskcache import Cache # type: ignore
+
+    policy = get_cache_policy(cache_dir)
+
+    # automatic culling is disabled (cull_limit=0) since diskcache does not know about pinned records, see _evict
+    # the eviction policy is still passed so diskcache keeps track of access times and counts
+    return Cache(directory=str(cache_dir), size_limit=policy.size_limit, eviction_policy=policy.eviction_policy, cull_limit=0)
+
+
+def _open_cache(cache_dir: Path) -> ContextManager[Cache]:
+    """
+    Opens a cache to be used in a with statement. Caches kept open are not closed when the statement exits.
+    """
+
+    if _open_caches is None:
+        return _create_cache(cache_dir)
+
+    with _open_caches_lock:
+        if str(cache_dir) not in _open_caches:
+            _open_caches[str(cache_dir)] = _create_cache(cache_dir)
+
+        return nullcontext(_open_caches[str(cache_dir)])
+
+
+def _evict(cache_ref: Cache, cache_dir: Path) -> int:
+    """
+    Evicts records in the order given by the cache's eviction policy until its volume is below the size limit.
+    Pinned records are skipped.
+
+    @param cache_ref: The opened cache.
+    @param cache_dir: The cache directory.
+    @return: The number of evicted records.
+    """
+
+    from diskcache.core import EVICTION_POLICY # type: ignore
+
+    policy = get_cache_policy(cache_dir)
+
+    select_policy = EVICTION_POLICY[policy.eviction_policy]['cull']
+
+    if select_policy is None or cache_ref.volume() <= policy.size_limit:
+        return 0
+
+    pinned = _pinned_records.get(str(cache_dir), {})
+
+    # LIMIT -1: select all records ordered by the policy
+    rows = cache_ref._sql(select_policy.format(fields='key, raw', now=0), (-1,)).fetchall()
+
+    evicted = 0
+
+    for db_key, raw in rows:
+        key = cache_ref._disk.get(db_key, raw)
+
+        if key in pinned:
+            continue
+
+        if cache_ref.delete(key):
+            RECORD_MEMO.invalidate((str(cache_dir), key))
+            evicted += 1
+
+        # checking the volume requires a query, only check every few records like diskcache does
+        if evicted % 10 == 0 and cache_ref.volume() <= policy.size_limit:
+            break
+
+    if evicted > 0:
+        _evictions[str(cache_dir)] = _evictions.get(str(cache_dir), 0) + evicted
+        logging.info(f'{CACHE} evicted {evicted} records from {cache_dir}, pinned {len(pinned)}')
+
+    if cache_ref.volume() > policy.size_limit:
+        logging.warning(f'{CACHE} {cache_dir} exceeds its size limit {policy.size_limit} after eviction, pinned {len(pinned)}')
+
+    return evicted
+
+
+def get_normalized_cache_dir(cache_dir: Path) -> Path:
+    """
+    Returns the directory of the side store holding the normalized records for a cache directory,
+    e.g., `Crossref_normalized` for `Crossref`.
+
+    @param cache_dir: The cache directory containing the raw records.
+    """
+    return Path(f'{cache_dir}{NORMALIZED_CACHE_SUFFIX}')
+
+
+def get_metadata_cache_dir(cache_dir: Path) -> Path:
+    """
+    Returns the directory of the side store holding the HTTP validators and content hashes of the records in a cache directory,
+    e.g., `Crossref_meta` for `Crossref`.
+
+    @param cache_dir: The cache directory containing the raw records.
+    """
+    return Path(f'{cache_dir}{METADATA_CACHE_SUFFIX}')
+
 
 def get_keys(cache_dir: Path) -> List[str]:
-    with Cache(directory=str(cache_dir), size_limit=CACHE_MAX_SIZE) as cache_ref:
+    with _open_cache(cache_dir) as cache_ref:
         return list(cache_ref.iterkeys())
 
 
+def get_contained_keys(keys: Iterable[str], cache_dir: Path) -> Set[str]:
+    """
+    Returns the given keys that are contained in the cache.
+    Each key is looked up, so the cache is not scanned, e.g., when checking the few records of a request against a large cache.
+
+    @param keys: The keys to be looked up.
+    @param cache_dir: The cache directory.
+    """
+
+    with _open_cache(cache_dir) as cache_ref:
+        return set(filter(lambda key: key in cache_ref, keys))
+
+
 def write_record_to_cache(key: str, value: str, cache_dir: Path) -> None:
-    with Cache(directory=str(cache_dir), size_limit=CACHE_MAX_SIZE) as cache_ref:
+    with _open_cache(cache_dir) as cache_ref:
         cache_ref.set(key, value)
+        RECORD_MEMO.invalidate((str(cache_dir), key))
+        _evict(cache_ref, cache_dir)
 
 
 def write_records_to_cache(records: List, key: Union[str, int], value: Union[str, int], cache_dir: Path):
-    with Cache(directory=str(cache_dir), size_limit=CACHE_MAX_SIZE) as cache_ref:
-        for rec in records:
-            write_record_to_cache(rec[key], rec[value], cache_dir)
+    with _open_cache(cache_dir) as cache_ref:
+        with cache_ref.transact():
+            for rec in records:
+                cache_ref.set(rec[key], rec[value])
+                RECORD_MEMO.invalidate((str(cache_dir), rec[key]))
+
+        _evict(cache_ref, cache_dir)
+
+
+def _memoize(cache_dir: Path, key: str, value: Optional[str]) -> None:
+    if value is not None:
+        RECORD_MEMO.put((str(cache_dir), key), value, len(value))
 
 
 def read_from_cache(key: str, cache_dir: Path) -> str:
-    with Cache(directory=str(cache_dir), size_limit=CACHE_MAX_SIZE) as cache_ref:
-        return cache_ref.get(key)
+    # records are memoized in memory, see memo.RECORD_MEMO
+    value = RECORD_MEMO.get((str(cache_dir), key))
+
+    if value is None:
+        with _open_cache(cache_dir) as cache_ref:
+            value = cache_ref.get(key)
+
+        _memoize(cache_dir, key, value)
+
+    return value
+
+
+def read_records_from_cache(keys: List[str], cache_dir: Path) -> Dict[str, str]:
+    """
+    Reads several records opening the cache only once. Keys not contained in the cache are omitted.
+
+    @param keys: Keys of the records to be read.
+    @param cache_dir: The cache directory.
+    """
+
+    memoized = map(lambda key: (key, RECORD_MEMO.get((str(cache_dir), key))), keys)
+
+    records: Dict[str, str] = cast(Dict[str, str], dict(filter(lambda rec: rec[1] is not None, memoized)))
+
+    missing = list(filter(lambda key: key not in records, keys))
+
+    if len(missing) == 0:
+        return records
+
+    with _open_cache(cache_dir) as cache_ref:
+        for key in missing:
+            value = cache_ref.get(key)
+
+            if value is not None:
+                _memoize(cache_dir, key, value)
+                records[key] = value
+
+    return records
+
+
+def delete_records(keys: Iterable[str], cache_dir: Path) -> int:
+    """
+    Deletes records from a cache. Keys not contained in the cache are ignored.
+
+    @param keys: Keys of the records to be deleted.
+    @param cache_dir: The cache directory.
+    @return: The number of deleted records.
+    """
+
+    deleted = 0
+
+    with _open_cache(cache_dir) as cache_ref:
+        with cache_ref.transact():
+            for key in keys:
+                if cache_ref.delete(key):
+                    deleted += 1
+
+                RECORD_MEMO.invalidate((str(cache_dir), key))
+
+    return deleted
+
+
+def migrate_keys(cache_dir: Path, canonical_key: Callable[[str], str]) -> Dict[str, str]:
+    """
+    Rewrites the keys of a cache to their canonical form, e.g., DOIs cached before they were canonicalized.
+    Records whose keys have the same canonical form are merged: a record stored under the canonical key is kept, otherwise the first one is moved.
+
+    @param cache_dir: The cache directory.
+    @param canonical_key: Returns the canonical form of a key, e.g., doi_reader.canonical_doi.
+    @return: The canonical keys indexed by the rewritten keys.
+    """
+
+    with _open_cache(cache_dir) as cache_ref:
+        keys: Set[str] = set(cache_ref.iterkeys())
+
+        migrated: Dict[str, str] = dict(filter(lambda item: item[0] != item[1], map(lambda key: (key, canonical_key(key)), sorted(keys))))
+
+        with cache_ref.transact():
+            for key, canonical in migrated.items():
+                if canonical not in keys:
+                    cache_ref.set(canonical, cache_ref.get(key))
+                    keys.add(canonical)
+
+                cache_ref.delete(key)
+
+                RECORD_MEMO.invalidate((str(cache_dir), key))
+                RECORD_MEMO.invalidate((str(cache_dir), canonical))
+
+    if len(migrated) > 0:
+        logging.info(f'{CACHE} rewrote {len(migrated)} keys of {cache_dir} to their canonical form')
+
+    return migrated
+
 
-__all__ = ['get_keys', 'write_record_to_cache', 'read_from_cache', 'write_records_to_cache']
\ No newline at end of file
+__all__ = ['get_keys', 'get_contained_keys', 'write_record_to_cache', 'read_from_cache', 'write_records_to_cache', 'read_records_from_cache',
+           'get_normalized_cache_dir', 'get_metadata_cache_dir', 'CachePolicy', 'configure_cache', 'get_cache_policy', 'pin_records', 'unpin_records',
+           'get_eviction_report', 'reset_eviction_report', 'keep_caches_open', 'close_caches', 'delete_records', 'migrate_keys']
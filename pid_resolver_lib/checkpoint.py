@@ -0,0 +1,91 @@
+#  Copyright 2024 Switch
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from . import json_backend
+
+CHECKPOINT = 'CHECKPOINT:'
+
+CHECKPOINT_FILE = Path('pid_resolver_checkpoint.json')
+
+logger = logging.getLogger(__name__)
+
+
+class CrawlState(NamedTuple):
+    """
+    Represents the state of a crawl after a completed iteration.
+    """
+
+    iteration: int # 0 last completed iteration, 0 if none has been completed yet
+    number_of_iterations: int # 1
+    frontier: List[str] # 2 DOIs to be resolved in the next iteration
+    visited_dois: List[str] # 3 DOIs requested in completed iterations
+    visited_orcids: List[str] # 4 ORCIDs requested in completed iterations
+    failed_dois: List[str] # 5 DOIs that could not be resolved, retried in the next iteration
+    failed_orcids: List[str] # 6 ORCIDs that could not be resolved, retried in the next iteration
+    # the following fields are only set by crawls with a priority frontier, older checkpoints do not contain them
+    seed_orcids: List[str] = [] # 7 ORCIDs of the authors of the DOIs the crawl started with
+    records_taken: int = 0 # 8 DOIs taken from the frontier in completed iterations
+    requests_per_ra: Dict[str, int] = {} # 9 DOIs that were not cached taken from the frontier per RA in completed iterations
+    elapsed_seconds: float = 0 # 10 wall time of completed iterations
+    frontier_entries: List[List[Any]] = [] # 11 [DOI, depth, linked ORCIDs, RA] per DOI of the frontier, see FrontierEntry
+
+
+def write_checkpoint(state: CrawlState, checkpoint_file: Path = CHECKPOINT_FILE) -> None:
+    """
+    Writes the crawl state atomically: the state is written to a temporary file that replaces the checkpoint file,
+    so a crash never leaves a partially written checkpoint behind.
+
+    @param state: The state of the crawl.
+    @param checkpoint_file: The checkpoint file.
+    """
+
+    directory = checkpoint_file.parent
+
+    with tempfile.NamedTemporaryFile('w', dir=directory, prefix=f'.{checkpoint_file.name}.', delete=False) as f:
+        tmp_file = f.name
+        try:
+            f.write(json_backend.dumps(state._asdict()))
+            f.flush()
+            os.fsync(f.fileno())
+        except Exception:
+            os.remove(tmp_file)
+            raise
+
+    os.replace(tmp_file, checkpoint_file)
+
+    logging.info(f'{CHECKPOINT} wrote iteration {state.iteration}, frontier {len(state.frontier)}')
+
+
+def read_checkpoint(checkpoint_file: Path = CHECKPOINT_FILE) -> Optional[CrawlState]:
+    """
+    Reads the crawl state from the checkpoint file. Returns None if there is no checkpoint.
+
+    @param checkpoint_file: The checkpoint file.
+    """
+
+    if not checkpoint_file.is_file():
+        return None
+
+    with open(checkpoint_file) as f:
+        return CrawlState(**json_backend.load(f))
+
+
+__all__ = ['CrawlState', 'write_checkpoint', 'read_checkpoint', 'CHECKPOINT_FILE']
@@ -17,94 +17,272 @@ import sys
 import getopt
 import os
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, NamedTuple, Optional, Set
 import asyncio
-import json
-from .doi_ra_handler import group_dois_by_ra, RAs
-from .pid_resolver import fetch_records
-from .pid_analyzer import analyze_dois, analyze_doi_record_crossref, analyze_doi_record_datacite, \
-    get_orcids_from_resolved_dois, get_dois_per_orcid, analyze_doi_record_medra
-
-logging.basicConfig(filename='pid_resolver.log',
-                    filemode='a',
-                    format='%(module)s %(levelname)s: %(asctime)s %(message)s',
-                    datefmt='%H:%M:%S',
-                    encoding='utf-8',
-                    level=logging.DEBUG)
+from . import json_backend
+from .pid_analyzer import get_orcids_from_resolved_dois, match_orcid_profiles
+from .resolver import Resolver, canonical_doi
+from .doi_reader import read_doi_file
+from .checkpoint import CrawlState, write_checkpoint, read_checkpoint, CHECKPOINT_FILE
+from .memo import get_memo_stats
+from .cache_handler import configure_cache, get_eviction_report
+from .snapshot import write_snapshot, get_snapshot_file
+from .graph_store import CoauthorGraphStore
+from .frontier import BudgetUsage, PriorityFrontier, NO_BUDGET
 
 logger = logging.getLogger(__name__)
 
+# file the analyzed publications are written to after each iteration, e.g., read by pid_resolver_infer
+RESULTS_FILE = 'results.json'
 
-def normalize_doi(doi: str) -> str:
-    # remove backslashes
-    return doi.replace('\\', '')
 
+class IterationResult(NamedTuple):
+    """
+    Represents the outcome of an iteration.
+    """
 
-async def fetch_dois(dois: List[str], ) -> List[str]:
-    if len(dois) == 0:
-        return []
+    dois_to_harvest: List[str] # 0 DOIs extracted from the ORCID profiles
+    orcids: List[str] # 1 ORCIDs contained in the resolved DOIs and retried ORCIDs
 
-    # group the DOIs by registration agency
-    org_dois: Dict = await group_dois_by_ra(dois)
 
-    # for each RA, create a cache dir if not already existent
-    for ra in org_dois.keys():
+async def fetch_dois(dois: List[str], refresh: bool = False, resolver: Optional[Resolver] = None, snapshot: bool = False,
+                     graph_store: Optional[CoauthorGraphStore] = None, retry_orcids: Optional[List[str]] = None,
+                     output_dir: Optional[Path] = None) -> IterationResult:
+    if resolver is None:
+        resolver = Resolver()
 
-        # for each RA, resolve the DOIs
-        if ra in RAs:
-            mime: str = str(RAs[ra]['mime'])
-            sleep: int = int(RAs[ra]['sleep'])
-            await fetch_records(org_dois[ra], Path(ra), 'https://doi.org', mime, sleep)
+    # results are written alongside the caches unless an output directory is given
+    results_file = (output_dir if output_dir is not None else resolver.cache_root) / RESULTS_FILE
 
-    resolved_dois_crossref = analyze_dois(Path('Crossref'),
-                                                           analyze_doi_record_crossref)
+    if len(dois) == 0 and not retry_orcids:
+        return IterationResult([], [])
 
-    resolved_dois_datacite = analyze_dois(Path('DataCite'),
-                                                           analyze_doi_record_datacite)
+    if refresh:
+        reports = await resolver.refresh_dois(dois)
+        for ra, report in reports.items():
+            print(f'refreshed {ra}: {report.changed} of {report.requested} records changed')
 
-    resolved_dois_medra = analyze_dois(Path('mEDRA'),
-                                                           analyze_doi_record_medra)
+    await resolver.fetch_dois(dois)
 
     # combined resolved DOIs
-    resolved_dois = {**resolved_dois_crossref, **resolved_dois_datacite, **resolved_dois_medra}
+    resolved_dois = resolver.analyze()
 
-    with open('results.json', 'w') as f:
-        f.write(json.dumps(resolved_dois))
+    with open(results_file, 'w') as f:
+        f.write(json_backend.dumps(resolved_dois))
 
-    orcids = get_orcids_from_resolved_dois(resolved_dois)
+    if snapshot:
+        write_snapshot(resolved_dois, get_snapshot_file(results_file))
 
-    await fetch_records(orcids, Path('orcid'), 'https://orcid.org', 'application/ld+json')
+    if graph_store is not None:
+        # only the edges of new and changed publications are updated
+        update = graph_store.update_publications(resolved_dois.values())
+        print(f'co-author graph: {update.added} publications added, {update.updated} updated')
 
-    dois_for_orcid = get_dois_per_orcid(Path('orcid'))
+    # ORCIDs that could not be resolved in the previous iteration are retried
+    orcids = list(dict.fromkeys(get_orcids_from_resolved_dois(resolved_dois) + (retry_orcids or [])))
 
-    new_dois = list(map(lambda doi: doi['dois'], dois_for_orcid))
+    dois_to_harvest = await resolver.expand_orcids(orcids, refresh)
 
-    dois_to_harvest = [item for sublist in new_dois for item in sublist]
+    return IterationResult(list(map(canonical_doi, dois_to_harvest)), orcids)
 
-    return list(map(normalize_doi, dois_to_harvest))
 
+async def extend_frontier(frontier: PriorityFrontier, resolver: Resolver, orcids: List[str], visited_dois: Set[str], depth: int) -> None:
+    """
+    Adds the DOIs listed in ORCID profiles to a frontier, together with the ORCIDs linking them and their RAs.
 
-async def start(dois_to_harvest: List[str], number_of_iterations: int):
+    @param frontier: The frontier.
+    @param resolver: The resolver the profiles have been fetched with.
+    @param orcids: ORCIDs whose profiles are cached.
+    @param visited_dois: DOIs already taken from the frontier, they are not added again.
+    @param depth: The current iteration.
+    """
+
+    linked_orcids: Dict[str, List[str]] = {}
+    for orcid, dois in resolver.get_profile_dois(orcids).items():
+        for doi in filter(lambda doi: doi not in visited_dois, map(canonical_doi, dois)):
+            linked_orcids.setdefault(doi, []).append(orcid)
+
+    ras = await resolver.get_ras(list(linked_orcids))
+
+    for doi, doi_orcids in linked_orcids.items():
+        frontier.add(doi, depth, doi_orcids, ras.get(doi))
+
+
+async def start(dois_to_harvest: List[str], number_of_iterations: int, resume_state: Optional[CrawlState] = None, refresh: bool = False,
+                resolver: Optional[Resolver] = None, snapshot: bool = False, graph_store: Optional[CoauthorGraphStore] = None,
+                priority_frontier: Optional[PriorityFrontier] = None, output_dir: Optional[Path] = None):
+    """
+    Crawls DOIs and the ORCIDs linked to them iteration by iteration, writing a checkpoint after each iteration.
+    The results and the checkpoint are written to the output directory, the resolver's cache root if not given.
+
+    Without a priority frontier, all DOIs found in an iteration are resolved in the next one. With a priority frontier,
+    each iteration takes the DOIs with the highest scores the frontier's budget allows and the crawl stops when the budget is used up.
+    """
+
+    if resolver is None:
+        resolver = Resolver()
+
+    if output_dir is None:
+        output_dir = resolver.cache_root
+
+    checkpoint_file = output_dir / CHECKPOINT_FILE
+
+    if resume_state is not None:
+        # checkpoints written before DOIs were canonicalized contain DOIs as listed in the ORCID profiles
+        state = resume_state._replace(number_of_iterations=number_of_iterations,
+                                      frontier=list(dict.fromkeys(map(canonical_doi, resume_state.frontier))),
+                                      visited_dois=sorted(set(map(canonical_doi, resume_state.visited_dois))),
+                                      failed_dois=list(dict.fromkeys(map(canonical_doi, resume_state.failed_dois))))
+        print(f'resuming after iteration {state.iteration}')
+    else:
+        state = CrawlState(iteration=0, number_of_iterations=number_of_iterations, frontier=dois_to_harvest,
+                           visited_dois=[], visited_orcids=[], failed_dois=[], failed_orcids=[])
+        write_checkpoint(state, checkpoint_file)
+
+    visited_dois: Set[str] = set(state.visited_dois)
+    visited_orcids: Set[str] = set(state.visited_orcids)
+
+    if priority_frontier is not None:
+        # when resuming, the seed ORCIDs and the budget used so far are restored
+        priority_frontier.set_seed_orcids(state.seed_orcids)
+        priority_frontier.restore_budget_usage(BudgetUsage(state.records_taken, state.requests_per_ra, state.elapsed_seconds))
+
+        # the checkpointed entries keep the ORCIDs linking their DOIs and their RAs, so scores and request budgets are the same as before
+        for doi, depth, linked_orcids, ra in state.frontier_entries:
+            priority_frontier.add(doi, depth, linked_orcids, ra)
+
+        # the DOIs the crawl starts with and frontiers of older checkpoints, their RAs are resolved to count them against the request budgets
+        dois = list(filter(lambda doi: doi not in priority_frontier, dict.fromkeys(state.frontier + state.failed_dois)))
+        ras = await resolver.get_ras(dois) if len(dois) > 0 else {}
+
+        for doi in dois:
+            priority_frontier.add(doi, state.iteration, ra=ras.get(doi))
 
     # range's end is exclusive
-    for idx in range(1, number_of_iterations+1):
+    for idx in range(state.iteration + 1, number_of_iterations+1):
         print(f'iteration {idx}')
 
-        dois_to_harvest = await fetch_dois(dois_to_harvest)
+        if priority_frontier is None:
+            # DOIs that could not be resolved in the previous iteration are retried
+            dois = list(dict.fromkeys(state.frontier + state.failed_dois))
+        else:
+            if priority_frontier.is_exhausted():
+                print(f'stopping: frontier empty or crawl budget used up, {len(priority_frontier)} DOIs left')
+                break
+
+            taken = priority_frontier.pop()
+            dois = list(map(lambda entry: entry.doi, taken))
+
+        result = await fetch_dois(dois, refresh, resolver, snapshot, graph_store, state.failed_orcids, output_dir)
+
+        visited_dois.update(dois)
+        visited_orcids.update(result.orcids)
+
+        failed_dois = resolver.dois_not_in_cache(dois)
+
+        if priority_frontier is None:
+            # DOIs requested in previous iterations are either cached or among the failed DOIs
+            frontier = list(dict.fromkeys(filter(lambda doi: doi not in visited_dois, result.dois_to_harvest)))
+        else:
+            if idx == 1:
+                # ORCIDs of the DOIs the crawl started with
+                priority_frontier.set_seed_orcids(get_orcids_from_resolved_dois(resolver.analyze(dois)))
+
+            await extend_frontier(priority_frontier, resolver, result.orcids, visited_dois, idx)
+
+            # failed DOIs compete with the DOIs found in this iteration
+            for entry in filter(lambda entry: entry.doi in failed_dois, taken):
+                priority_frontier.add(entry.doi, entry.depth, entry.linked_orcids, entry.ra)
+
+            frontier = priority_frontier.get_dois()
+            failed_dois = []
+
+        state = CrawlState(iteration=idx, number_of_iterations=number_of_iterations, frontier=frontier,
+                           visited_dois=sorted(visited_dois), visited_orcids=sorted(visited_orcids),
+                           failed_dois=failed_dois, failed_orcids=resolver.orcids_not_in_cache(result.orcids))
+
+        if priority_frontier is not None:
+            usage = priority_frontier.get_budget_usage()
+            state = state._replace(seed_orcids=sorted(priority_frontier.seed_orcids), records_taken=usage.records,
+                                   requests_per_ra=usage.requests_per_ra, elapsed_seconds=usage.seconds,
+                                   frontier_entries=list(map(lambda entry: [entry.doi, entry.depth, sorted(entry.linked_orcids), entry.ra],
+                                                             priority_frontier.get_entries())))
+
+        write_checkpoint(state, checkpoint_file)
+
+    evictions = get_eviction_report()
+    logging.info(f'evicted records per cache: {evictions}')
+    print(f'evicted records: {sum(evictions.values())} {evictions}')
+
+    logging.info(f'in-memory memo statistics: {get_memo_stats()}')
+
+
+def parse_cache_policy(arg: str, cache_root: Path = Path('.')) -> None:
+    """
+    Configures a cache directory from an argument of the form <cache_dir>:<size_limit>:<eviction_policy>.
+
+    @param arg: The argument, a relative <cache_dir> is resolved against the cache root, e.g., "Crossref".
+    @param cache_root: The directory the cache directories are created in.
+    """
+
+    cache_dir, size_limit, eviction_policy = arg.rsplit(':', 2)
+
+    configure_cache(cache_root / cache_dir, int(float(size_limit)), eviction_policy)
 
 
 def usage() -> None:
-    print('Usage: ' + sys.argv[0] + ' -i <number_of_iterations> -d <doi_input_file>')
+    print('Usage: ' + sys.argv[0] + ' -i <number_of_iterations> -d <doi_input_file> [-r <cache_root>] [-o <output_dir>] [-c <cache_policy>] [--resume] [--refresh] [--snapshot] [-g <graph_store>]')
+    print('       [--batch-matching] [--bulk] [--lean-orcid] [--prioritize] [--max-records <n>] [--max-per-iteration <n>] [--max-requests <ra>:<n>] [--max-time <seconds>]')
+    print('       ' + sys.argv[0] + ' --migrate-cache [-r <cache_root>]')
     print('Resolves DOIs and related ORCIDs.')
     print('-i <number_of_iterations>: positive integer')
-    print('-d <doi_input_file>: path to JSON file containing an array of DOIs, e.g. ["10.1007/978-3-031-47243-5_6"]')
+    print('-d <doi_input_file>: path to JSON file containing an array of DOIs, e.g. ["10.1007/978-3-031-47243-5_6"], or to a file containing a DOI per line (plain or JSON string)')
+    print('-r <cache_root>: directory the cache directories are created in, defaults to the working directory')
+    print(f'-o <output_dir>: directory {RESULTS_FILE} and the checkpoint are written to, defaults to the cache root')
+    print('-c <cache_policy>: size limit in bytes and eviction policy of a cache directory relative to the cache root, may be repeated, e.g. Crossref:4e9:least-recently-used')
+    print('   eviction policies: least-recently-stored (default), least-recently-used, least-frequently-used, none')
+    print('--refresh: refresh cached DOIs and ORCIDs using conditional requests, only changed records are rewritten')
+    print('--snapshot: also write results.snapshot, a binary snapshot of results.json that loads faster, e.g., in pid_resolver_infer')
+    print('-g <graph_store>: update a co-author graph store (SQLite) with the analyzed publications, see pid_resolver_infer -g')
+    print('--batch-matching: match authors of publications with many ORCID profiles against all profiles at once (requires numpy)')
+    print('--bulk: fetch Crossref and DataCite DOIs from their REST APIs, many DOIs per request')
+    print('--lean-orcid: fetch only names and DOIs of ORCID records from the public API instead of the full profiles')
+    print('--prioritize: resolve the DOIs linked to most ORCIDs of the input DOIs first, then those linked to most ORCIDs, closest to the input DOIs')
+    print('   and cheapest to request. Implied by the following budgets, which stop the crawl when used up:')
+    print('--max-records <n>: maximum number of DOIs to resolve')
+    print('--max-per-iteration <n>: maximum number of DOIs to resolve per iteration')
+    print('--max-requests <ra>:<n>: maximum number of DOIs to request from an RA, may be repeated, e.g. DataCite:1000')
+    print('--max-time <seconds>: maximum wall time, checked before each iteration')
+    print(f'--resume: continue the crawl after the last completed iteration recorded in {CHECKPOINT_FILE} (output directory), -d and -i are optional')
+    print('--migrate-cache: rewrite the keys of DOI caches written by earlier versions to canonical DOIs (lower case, without resolver URL)')
+    print('   before crawling, merging records cached under several spellings of a DOI. -d and -i are optional')
     exit(1)
 
 
 def main():
+    # configured by the CLI only, library users configure logging themselves
+    logging.basicConfig(filename='pid_resolver.log',
+                        filemode='a',
+                        format='%(module)s %(levelname)s: %(asctime)s %(message)s',
+                        datefmt='%H:%M:%S',
+                        encoding='utf-8',
+                        level=logging.DEBUG)
 
     iterations = 0
     dois = []
+    resume = False
+    refresh = False
+    snapshot = False
+    cache_root = Path('.')
+    output_dir = None
+    graph_store_file = None
+    prioritize = False
+    budget = NO_BUDGET
+    matcher = match_orcid_profiles
+    bulk_fetch = False
+    lean_orcid_profiles = False
+    migrate_cache = False
+    cache_policies = []
 
     argv = sys.argv[1:]
 
@@ -113,7 +291,7 @@ def main():
         usage()
 
     try:
-        opts, args = getopt.getopt(argv, "i:d:")
+        opts, args = getopt.getopt(argv, "i:d:c:r:o:g:", ["resume", "refresh", "snapshot", "batch-matching", "bulk", "lean-orcid", "prioritize", "max-records=", "max-per-iteration=", "max-requests=", "max-time=", "migrate-cache"])
 
         for opt, arg in opts:
             if opt in ['-i']:
@@ -125,19 +303,96 @@ def main():
             elif opt in ['-d']:
                 doi_file = arg
                 if os.path.isfile(doi_file):
-                    with open(doi_file) as f:
-                        dois = json.load(f)
+                    # streamed, normalized and without duplicates
+                    dois = read_doi_file(Path(doi_file))
                 else:
-                    print('-d is expected to be a JSON file name', file=sys.stderr)
+                    print('-d is expected to be a file name', file=sys.stderr)
+                    usage()
+            elif opt in ['-c']:
+                # configured once the cache root is known
+                cache_policies.append(arg)
+            elif opt in ['-r']:
+                cache_root = Path(arg)
+            elif opt in ['-o']:
+                output_dir = Path(arg)
+            elif opt in ['-g']:
+                graph_store_file = Path(arg)
+            elif opt in ['--resume']:
+                resume = True
+            elif opt in ['--refresh']:
+                refresh = True
+            elif opt in ['--snapshot']:
+                snapshot = True
+            elif opt in ['--batch-matching']:
+                from .batch_matcher import is_available, match_orcid_profiles_batch
+
+                if not is_available():
+                    print('--batch-matching requires numpy, install pid_resolver_lib[numpy]', file=sys.stderr)
                     usage()
 
+                matcher = match_orcid_profiles_batch
+            elif opt in ['--bulk']:
+                bulk_fetch = True
+            elif opt in ['--lean-orcid']:
+                lean_orcid_profiles = True
+            elif opt in ['--prioritize']:
+                prioritize = True
+            elif opt in ['--max-records']:
+                budget = budget._replace(max_records=int(arg))
+                prioritize = True
+            elif opt in ['--max-per-iteration']:
+                budget = budget._replace(max_records_per_iteration=int(arg))
+                prioritize = True
+            elif opt in ['--max-requests']:
+                ra, max_requests = arg.rsplit(':', 1)
+                budget = budget._replace(max_requests_per_ra={**budget.max_requests_per_ra, ra: int(max_requests)})
+                prioritize = True
+            elif opt in ['--max-time']:
+                budget = budget._replace(max_seconds=float(arg))
+                prioritize = True
+            elif opt in ['--migrate-cache']:
+                migrate_cache = True
+
+        for cache_policy in cache_policies:
+            parse_cache_policy(cache_policy, cache_root)
 
     except Exception as err:
         print(err, file=sys.stderr)
         usage()
 
-    # check for empty values (still initialised to empty strings)
-    if not iterations or not dois:
+    resolver = Resolver(cache_root, matcher=matcher, bulk_fetch=bulk_fetch, lean_orcid_profiles=lean_orcid_profiles)
+
+    if migrate_cache:
+        report = resolver.migrate_doi_caches()
+        print(f'migrated DOI caches: {sum(report.values())} keys rewritten {report}')
+
+        if not resume and not dois:
+            return
+
+    if output_dir is None:
+        output_dir = cache_root
+
+    resume_state = read_checkpoint(output_dir / CHECKPOINT_FILE) if resume else None
+
+    if resume and resume_state is None:
+        print(f'no checkpoint found in {output_dir / CHECKPOINT_FILE}, starting a new crawl', file=sys.stderr)
+
+    if resume_state is None and (not iterations or not dois):
+        # check for empty values (still initialised to empty strings)
         usage()
 
-    asyncio.run(start(dois, iterations))
+    graph_store = CoauthorGraphStore(graph_store_file) if graph_store_file is not None else None
+    priority_frontier = PriorityFrontier(budget=budget) if prioritize else None
+
+    try:
+        if resume_state is not None:
+            if not iterations:
+                iterations = resume_state.number_of_iterations
+
+            asyncio.run(start([], iterations, resume_state, refresh, resolver, snapshot, graph_store, priority_frontier, output_dir))
+        else:
+            asyncio.run(start(dois, iterations, refresh=refresh, resolver=resolver, snapshot=snapshot, graph_store=graph_store,
+                              priority_frontier=priority_frontier, output_dir=output_dir))
+    finally:
+        if graph_store is not None:
+            graph_store.close()
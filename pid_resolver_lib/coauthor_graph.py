@@ -0,0 +1,431 @@
+#  Copyright 2024 Switch
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import bisect
+import getopt
+import logging
+import mmap
+import os
+import sys
+import tempfile
+import uuid
+from array import array
+from collections import Counter
+from itertools import accumulate, combinations
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple, cast
+
+from . import json_backend
+from .pid_analyzer import PublicationInfo
+from .snapshot import load_resolved_dois
+
+GRAPH = 'GRAPH:'
+
+GRAPH_VERSION = 2
+
+GRAPH_META_FILE = 'graph.json'
+
+logger = logging.getLogger(__name__)
+
+'''
+A co-author graph has a node per ORCID and an edge between two ORCIDs that are authors of the same publication.
+The weight of an edge is the number of publications the two ORCIDs share.
+
+The adjacency is stored in compressed sparse row (CSR) format: the neighbors of node i are indices[indptr[i]:indptr[i + 1]]
+(sorted by node), the weights of the edges are weights[indptr[i]:indptr[i + 1]]. Each edge is stored for both of its nodes.
+Nodes are numbered in the lexical order of their ORCIDs.
+
+On disk, a graph is a directory with a file per array (node string offsets and table, indptr, indices, weights)
+and graph.json describing them. The arrays are memory-mapped when the graph is opened.
+
+The files of the arrays are suffixed with the generation of the graph they belong to. Writing a graph writes the files of a new generation
+and then replaces graph.json, so a reader maps the arrays of exactly one generation, never a mix of an old and a new graph.
+'''
+
+_ARRAYS = {
+    # file: type code of the array
+    'nodes.offsets': 'Q',
+    'indptr': 'Q',
+    'indices': 'I',
+    'weights': 'I'
+}
+
+_NODES_TABLE = 'nodes.strings'
+
+_MASK = 0xFFFFFFFF
+
+# attempts to open a graph whose files are replaced in the meantime
+_OPEN_ATTEMPTS = 3
+
+
+class _StringTable(Sequence[str]):
+    """
+    Strings of a memory-mapped table, decoded when accessed.
+    """
+
+    def __init__(self, table: Any, offsets: Any):
+        self._table = table
+        self._offsets = offsets
+
+    def __getitem__(self, idx: Any) -> Any:
+        if isinstance(idx, slice):
+            return list(map(self.__getitem__, range(len(self))[idx]))
+
+        return self._table[self._offsets[idx]:self._offsets[idx + 1]].decode('utf-8')
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+
+class CoauthorGraph:
+    """
+    A co-author graph in CSR format, either built in memory or opened from a directory (memory-mapped).
+    """
+
+    def __init__(self, nodes: Sequence[str], indptr: Sequence[int], indices: Sequence[int], weights: Sequence[int],
+                 resources: Optional[List[Any]] = None):
+        """
+        @param nodes: ORCIDs in lexical order.
+        @param indptr: Start of each node's neighbors in indices, followed by the number of entries in indices.
+        @param indices: Neighbors of the nodes.
+        @param weights: Number of shared publications per entry in indices.
+        @param resources: Views and memory maps to be released when the graph is closed.
+        """
+        self.nodes = nodes
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        self._resources = resources if resources is not None else []
+
+    def close(self) -> None:
+        # views have to be released before the memory maps they point into
+        for resource in reversed(self._resources):
+            if isinstance(resource, memoryview):
+                resource.release()
+            else:
+                resource.close()
+
+        self._resources = []
+
+    def __enter__(self) -> 'CoauthorGraph':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    @property
+    def number_of_nodes(self) -> int:
+        return len(self.nodes)
+
+    @property
+    def number_of_edges(self) -> int:
+        # each edge is stored for both of its nodes
+        return len(self.indices) // 2
+
+    def find(self, orcid: str) -> Optional[int]:
+        """
+        Returns the node of an ORCID, None if the ORCID is not contained in the graph.
+        """
+
+        idx = bisect.bisect_left(self.nodes, orcid)
+
+        if idx < len(self.nodes) and self.nodes[idx] == orcid:
+            return idx
+
+        return None
+
+    def _neighbor_range(self, orcid: str) -> Tuple[int, int]:
+        node = self.find(orcid)
+
+        if node is None:
+            return 0, 0
+
+        return self.indptr[node], self.indptr[node + 1]
+
+    def degree(self, orcid: str) -> int:
+        """
+        Returns the number of co-authors of an ORCID.
+        """
+
+        start, end = self._neighbor_range(orcid)
+
+        return end - start
+
+    def neighbors(self, orcid: str) -> List[Tuple[str, int]]:
+        """
+        Returns the co-authors of an ORCID and the number of publications shared with each of them.
+
+        @param orcid: The ORCID without base URL.
+        @return: Pairs of co-author ORCID and number of shared publications, empty if the ORCID is not contained in the graph.
+        """
+
+        start, end = self._neighbor_range(orcid)
+
+        return list(zip(map(self.nodes.__getitem__, self.indices[start:end]), self.weights[start:end]))
+
+    def weight(self, orcid: str, co_author_orcid: str) -> int:
+        """
+        Returns the number of publications two ORCIDs share.
+        """
+
+        start, end = self._neighbor_range(orcid)
+        co_author = self.find(co_author_orcid)
+
+        if co_author is None:
+            return 0
+
+        # the neighbors of a node are sorted
+        idx = bisect.bisect_left(self.indices, co_author, start, end)
+
+        return self.weights[idx] if idx < end and self.indices[idx] == co_author else 0
+
+    def neighborhood(self, orcids: Iterable[str], hops: int = 1) -> Set[str]:
+        """
+        Returns the ORCIDs that can be reached from the given ORCIDs within a number of hops (including the given ORCIDs).
+
+        @param orcids: ORCIDs without base URL.
+        @param hops: Maximum distance.
+        """
+
+        frontier: Set[int] = cast(Set[int], set(filter(lambda node: node is not None, map(self.find, orcids))))
+        reached: Set[int] = set(frontier)
+
+        for _ in range(hops):
+            frontier = set(node for current in frontier for node in self.indices[self.indptr[current]:self.indptr[current + 1]]) - reached
+            reached.update(frontier)
+
+        return set(map(self.nodes.__getitem__, reached))
+
+
+def _publication_orcids(pub: PublicationInfo) -> List[str]:
+    # an ORCID assigned to several authors of a publication is counted once
+    return cast(List[str], list(dict.fromkeys(filter(lambda orcid: orcid is not None, map(lambda author: author.orcid, pub.authors)))))
+
+
+def _edge_key(first: int, second: int) -> int:
+    return (first << 32) | second
+
+
+def _reverse_edge_key(key: int) -> int:
+    return ((key & _MASK) << 32) | (key >> 32)
+
+
+def build_coauthor_graph(publications: Iterable[PublicationInfo], max_authors: Optional[int] = None) -> CoauthorGraph:
+    """
+    Builds the co-author graph of publications.
+
+    @param publications: Resolved publications, e.g., the values of results.json.
+    @param max_authors: Publications with more ORCIDs are skipped, e.g., to keep large collaborations from adding a clique each.
+    """
+
+    author_orcids: List[List[str]] = list(filter(lambda orcids: max_authors is None or len(orcids) <= max_authors,
+                                                 map(_publication_orcids, publications)))
+
+    nodes: List[str] = sorted(set(orcid for orcids in author_orcids for orcid in orcids))
+    node_ids: Dict[str, int] = dict(zip(nodes, range(len(nodes))))
+
+    # edges are keyed by (smaller node << 32 | larger node)
+    pair_weights: Counter = Counter(
+        _edge_key(first, second) for orcids in author_orcids for first, second in combinations(sorted(map(node_ids.__getitem__, orcids)), 2))
+
+    return make_csr(nodes, pair_weights)
+
+
+def make_csr(nodes: List[str], pair_weights: Dict[int, int]) -> CoauthorGraph:
+    """
+    Creates the CSR arrays from the weights of the edges.
+
+    @param nodes: ORCIDs in lexical order.
+    @param pair_weights: Weights of the edges keyed by (smaller node << 32 | larger node).
+    """
+
+    # each edge is stored for both of its nodes
+    directed_weights: Dict[int, int] = dict(pair_weights)
+    directed_weights.update(zip(map(_reverse_edge_key, pair_weights.keys()), pair_weights.values()))
+
+    # integer keys sort by node, then by neighbor
+    directed: List[int] = sorted(directed_weights.keys())
+
+    indices = array('I', map(_MASK.__and__, directed))
+    weights = array('I', map(directed_weights.__getitem__, directed))
+
+    degrees = Counter(key >> 32 for key in directed)
+    indptr = array('Q', accumulate(map(lambda node: degrees.get(node, 0), range(len(nodes))), initial=0))
+
+    return CoauthorGraph(nodes, indptr, indices, weights)
+
+
+def _write_file(graph_dir: Path, name: str, write) -> None:
+    with tempfile.NamedTemporaryFile('wb', dir=graph_dir, prefix=f'.{name}.', delete=False) as f:
+        tmp_file = f.name
+        try:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        except Exception:
+            os.remove(tmp_file)
+            raise
+
+    os.replace(tmp_file, graph_dir / name)
+
+
+def _remove_other_generations(graph_dir: Path, generation: str) -> None:
+    names = set(_ARRAYS) | {_NODES_TABLE}
+
+    # files of previous graphs (without suffix if written by version 1), readers that mapped them keep their contents
+    for path in graph_dir.iterdir():
+        name, _, suffix = path.name.rpartition('.')
+
+        if (name in names and suffix != generation) or path.name in names:
+            path.unlink(missing_ok=True)
+
+
+def write_coauthor_graph(graph: CoauthorGraph, graph_dir: Path) -> None:
+    """
+    Writes a co-author graph to a directory, replacing a graph written before.
+    The arrays are written to the files of a new generation, graph.json is replaced last, see open_coauthor_graph.
+
+    @param graph: The graph.
+    @param graph_dir: The directory, created if it does not exist.
+    """
+
+    graph_dir.mkdir(parents=True, exist_ok=True)
+
+    encoded = list(map(lambda node: node.encode('utf-8'), graph.nodes))
+
+    arrays = {
+        'nodes.offsets': array('Q', accumulate(map(len, encoded), initial=0)),
+        'indptr': array('Q', graph.indptr),
+        'indices': array('I', graph.indices),
+        'weights': array('I', graph.weights)
+    }
+
+    generation = uuid.uuid4().hex
+
+    for name, values in arrays.items():
+        _write_file(graph_dir, f'{name}.{generation}', values.tofile)
+
+    _write_file(graph_dir, f'{_NODES_TABLE}.{generation}', lambda f: f.writelines(encoded))
+
+    meta = {'version': GRAPH_VERSION, 'generation': generation, 'byte_order': sys.byteorder, 'number_of_nodes': graph.number_of_nodes,
+            'number_of_edges': graph.number_of_edges}
+
+    _write_file(graph_dir, GRAPH_META_FILE, lambda f: f.write(json_backend.dumps(meta).encode('utf-8')))
+
+    _remove_other_generations(graph_dir, generation)
+
+    logging.info(f'{GRAPH} wrote {meta} to {graph_dir}')
+
+
+def _map_file(path: Path, resources: List[Any]) -> Any:
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            # empty files cannot be memory-mapped
+            return b''
+
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    resources.append(mapped)
+
+    return mapped
+
+
+def _open_generation(graph_dir: Path, meta: Dict[str, Any], resources: List[Any]) -> CoauthorGraph:
+    generation = meta['generation']
+    arrays: Dict[str, Any] = {}
+
+    for name, typecode in _ARRAYS.items():
+        mapped = _map_file(graph_dir / f'{name}.{generation}', resources)
+
+        if meta['byte_order'] == sys.byteorder:
+            # no copy, the integers are read from the mapped file
+            view = memoryview(mapped)
+            arrays[name] = view.cast(typecode)  # type: ignore[call-overload]
+            resources.extend([view, arrays[name]])
+        else:
+            arrays[name] = array(typecode, mapped)
+            arrays[name].byteswap()
+
+    nodes = _StringTable(_map_file(graph_dir / f'{_NODES_TABLE}.{generation}', resources), arrays['nodes.offsets'])
+
+    return CoauthorGraph(nodes, arrays['indptr'], arrays['indices'], arrays['weights'], resources)
+
+
+def open_coauthor_graph(graph_dir: Path) -> CoauthorGraph:
+    """
+    Opens a co-author graph written to a directory. The arrays are memory-mapped, not read.
+    A graph being replaced while it is opened is opened again, the arrays always belong to the same graph.
+
+    @param graph_dir: The directory.
+    """
+
+    attempt = 1
+
+    while True:
+        with open(graph_dir / GRAPH_META_FILE) as f:
+            meta = json_backend.load(f)
+
+        if meta['version'] != GRAPH_VERSION:
+            raise ValueError(f'{graph_dir} has version {meta["version"]}, expected {GRAPH_VERSION}')
+
+        resources: List[Any] = []
+
+        try:
+            return _open_generation(graph_dir, meta, resources)
+        except FileNotFoundError:
+            # the files of this generation have been removed by a writer that replaced graph.json in the meantime
+            CoauthorGraph([], [], [], [], resources).close()
+
+            if attempt == _OPEN_ATTEMPTS:
+                raise
+
+            logging.info(f'{GRAPH} {graph_dir} was replaced while opening it, opening it again')
+            attempt += 1
+
+
+def usage() -> None:
+    print('Usage: ' + sys.argv[0] + ' [-o <graph_dir>] [-m <max_authors>]')
+    print('Builds the co-author graph of the ORCIDs in results.json (working directory).')
+    print('-o <graph_dir>: directory the graph is written to, defaults to coauthor_graph')
+    print('-m <max_authors>: skip publications with more ORCIDs, e.g., large collaborations')
+    exit(1)
+
+
+def main():
+    graph_dir = Path('coauthor_graph')
+    max_authors = None
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "o:m:h")
+
+        for opt, arg in opts:
+            if opt in ['-o']:
+                graph_dir = Path(arg)
+            elif opt in ['-m']:
+                max_authors = int(arg)
+            elif opt in ['-h']:
+                usage()
+
+    except Exception as err:
+        print(err, file=sys.stderr)
+        usage()
+
+    graph = build_coauthor_graph(load_resolved_dois(Path('results.json')).values(), max_authors)
+
+    write_coauthor_graph(graph, graph_dir)
+
+    print(f'nodes: {graph.number_of_nodes}, edges: {graph.number_of_edges}, written to {graph_dir}')
+
+
+__all__ = ['CoauthorGraph', 'build_coauthor_graph', 'write_coauthor_graph', 'open_coauthor_graph']
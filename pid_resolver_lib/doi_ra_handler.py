@@ -13,12 +13,14 @@
 #  limitations under the License.
 #
 from pathlib import Path
-from typing import List, Dict, Union, cast, Any
-from functools import reduce
+from typing import List, Dict, Union, cast, Any, Optional, Iterable, Iterator
 import asyncio
+from itertools import islice
 from aiohttp import ClientSession, TCPConnector, ClientTimeout # type: ignore
-import jq # type: ignore
-from .cache_handler import get_keys
+from . import json_backend
+from .cache_handler import get_contained_keys
+from .doi_reader import bucket_dois_by_prefix, canonical_doi
+from .memo import RA_MEMO
 import logging
 
 RAs: Dict[str, Dict[str, Union[str, int]]] = {
@@ -29,33 +31,35 @@ RAs: Dict[str, Dict[str, Union[str, int]]] = {
 
 REGISTRATION_AGENCY = 'RA:'
 
-logger = logging.getLogger(__name__)
-
-def get_registration_agency_prefixes(dois: List[str]) -> List[str]:
-    """
-    Given a list of DOIS, returns their agency prefixes (no duplicates).
+# number of DOI prefixes whose RAs are resolved at once, see group_dois_by_ra
+PREFIX_CHUNK_SIZE = 1000
 
-    :param dois: A list of DOIs without base URL, e.g., 10.1016/j.jtherbio.2015.06.009.
-    """
-    agencies: List[str] = jq.compile('[.[] | .[0:index("/")]] | unique').input_value(dois).first()
-
-    return agencies
+# number of DOIs looked up in the caches at once, see group_dois_by_ra
+CACHED_DOI_CHUNK_SIZE = 10000
 
+logger = logging.getLogger(__name__)
 
-async def _make_registration_agency_prefix_request(session: ClientSession, doi_prefix: str) -> Union[Dict[str, str], None]:
+async def _make_registration_agency_prefix_request(session: ClientSession, doi_prefix: str,
+                                                   base_url: str = 'https://doi.org') -> Union[Dict[str, str], None]:
     """
     Given a DOI prefix, fetches information about the RA.
 
     @param session: The aiohttp session to be used.
     @param doi_prefix: The DOI prefix to be fetched.
+    @param base_url: Base URL of the DOI resolver providing the /ra endpoint.
     """
 
-    base_url = 'https://doi.org/ra'
+    # prefixes are resolved once per process and DOI resolver
+    memoized: Optional[Dict[str, str]] = RA_MEMO.get((base_url, doi_prefix))
+
+    if memoized is not None:
+        return memoized
 
     try:
-        async with session.get(f'{base_url}/{doi_prefix}') as request:
-            res = await request.json()
+        async with session.get(f'{base_url}/ra/{doi_prefix}') as request:
+            res = await request.json(loads=json_backend.loads)
             if isinstance(res, list) and len(res) == 1:
+                RA_MEMO.put((base_url, doi_prefix), res[0])
                 return res[0]
             else:
                 raise Exception(f'DOI RA result is not a list: {res}')
@@ -65,84 +69,82 @@ async def _make_registration_agency_prefix_request(session: ClientSession, doi_p
         return None
 
 
-async def resolve_registration_agency_prefixes(doi_prefixes: List[str]) -> List[Dict[str, str]]:
-    """
-    Given a list of DOI prefixes, resolves them to get the registration agencies.
-
-    @param doi_prefixes: DOI prefixes to be resolved.
-    """
-
-    conn = TCPConnector(limit=10)
-    # set raise_for_status
-    time_out = ClientTimeout(total=60 * 60 * 24)
-    async with ClientSession(connector=conn, raise_for_status=True, timeout=time_out) as session:
+async def _request_registration_agency_prefixes(session: ClientSession, doi_prefixes: List[str], base_url: str) -> List[Dict[str, str]]:
 
-        requests = [_make_registration_agency_prefix_request(session, doi_prefix) for doi_prefix in doi_prefixes]
+    requests = [_make_registration_agency_prefix_request(session, doi_prefix, base_url) for doi_prefix in doi_prefixes]
 
-        results = await asyncio.gather(*requests)
+    results = await asyncio.gather(*requests)
 
-        filtered: List[Dict[str, str]] = list(filter(lambda res: res is not None, cast(List[Union[Dict[str, str]]], results)))
+    filtered: List[Dict[str, str]] = list(filter(lambda res: res is not None, cast(List[Union[Dict[str, str]]], results)))
 
-        return filtered
+    return filtered
 
 
-def filter_prefixes_by_registration_agency(resolved_doi_registration_agencies:  List[Dict[str, str]], registration_agency: str) -> List[str]:
+async def resolve_registration_agency_prefixes(doi_prefixes: List[str], concurrency: int = 10, base_url: str = 'https://doi.org',
+                                               session: Optional[ClientSession] = None) -> List[Dict[str, str]]:
     """
-    Given a list of DOI prefix responses, filters them by a specific registration agency.
+    Given a list of DOI prefixes, resolves them to get the registration agencies.
 
-    @param resolved_doi_registration_agencies: Resolved DOI prefixes.
-    @param registration_agency: The registration agency to filter for, e.g., "Crossref"
+    @param doi_prefixes: DOI prefixes to be resolved.
+    @param concurrency: Maximum number of simultaneous connections.
+    @param base_url: Base URL of the DOI resolver providing the /ra endpoint.
+    @param session: An open session to be reused, e.g., by a long-running service.
     """
 
-    return jq.compile(f'[.[] | select(.RA == "{registration_agency}") | .DOI ]').input_value(
-        resolved_doi_registration_agencies).first()
+    if session is not None:
+        return await _request_registration_agency_prefixes(session, doi_prefixes, base_url)
 
+    conn = TCPConnector(limit=concurrency)
+    # set raise_for_status
+    time_out = ClientTimeout(total=60 * 60 * 24)
+    async with ClientSession(connector=conn, raise_for_status=True, timeout=time_out) as new_session:
+        return await _request_registration_agency_prefixes(new_session, doi_prefixes, base_url)
 
-def filter_dois_by_prefixes(dois: List[str], prefixes: List[str]) -> List[str]:
-    """
-    Given a list of DOIs, filters them by their prefix.
 
-    @param dois: Dois to be filtered.
-    @param prefixes: Prefixes to filter for.
+def _iter_uncached_dois(dois: Iterable[str], cache_root: Path) -> Iterator[str]:
+    """
+    Yields the canonical DOIs not contained in the caches of the RAs.
+    The DOIs are looked up in chunks, so the caches are not scanned and the DOIs may be streamed.
     """
 
-    filtered_dois = list(filter(lambda doi: doi[0:(doi.find('/'))] in prefixes, dois))
-    return list(set(filtered_dois))
-
+    canonical_dois = map(canonical_doi, dois)
 
-async def group_dois_by_ra(dois: List[str]) -> Dict[str, List[str]]:
-    """
-    Given a list of DOIs, groups them by RA.
+    while chunk := list(islice(canonical_dois, CACHED_DOI_CHUNK_SIZE)):
+        cached = set().union(*map(lambda ra: get_contained_keys(chunk, cache_root / ra), RAs))
 
-    @param dois: DOIs to be grouped.
-    """
+        yield from filter(lambda doi: doi not in cached, chunk)
 
-    existing_dois = list(map(lambda ra: get_keys(Path(ra)), RAs))
 
-    dois_to_harvest = list(set(dois) - set([item for sublist in existing_dois for item in sublist]))
+async def group_dois_by_ra(dois: Iterable[str], cache_root: Path = Path('.'), concurrency: int = 10, base_url: str = 'https://doi.org',
+                           session: Optional[ClientSession] = None, prefix_chunk_size: int = PREFIX_CHUNK_SIZE) -> Dict[str, List[str]]:
+    """
+    Given DOIs, groups those not contained in the caches by RA. DOIs are compared in canonical form (see canonical_doi).
+    The DOIs are bucketed by prefix in one pass (see bucket_dois_by_prefix), so they may be streamed, e.g., from iter_dois.
+
+    @param dois: DOIs to be grouped, in any spelling, e.g., with resolver URL.
+    @param cache_root: Directory containing the cache directories of the RAs.
+    @param concurrency: Maximum number of simultaneous connections when resolving the RAs of the DOI prefixes.
+    @param base_url: Base URL of the DOI resolver providing the /ra endpoint.
+    @param session: An open session to be reused, e.g., by a long-running service.
+    @param prefix_chunk_size: Number of prefixes whose RAs are resolved at once.
+    @return: Canonical DOIs (no duplicates, in the order given) indexed by RA, DOIs whose RA could not be resolved are omitted.
+    """
 
-    # return if list is empty
-    if len(dois_to_harvest) == 0:
-        return {}
+    dois_by_prefix: Dict[str, List[str]] = bucket_dois_by_prefix(_iter_uncached_dois(dois, cache_root))
 
-    # get prefixes from DOIs
-    doi_prefixes: List[str] = get_registration_agency_prefixes(dois_to_harvest)
+    doi_prefixes = list(dois_by_prefix)
 
-    # For each prefix, resolve its RA.
-    resolved_ras_for_doi_prefixes: List[Dict[str, str]] = await resolve_registration_agency_prefixes(doi_prefixes)
+    dois_by_ra: Dict[str, List[str]] = {}
 
-    # Make a list of available RAs
-    ras = set(map(lambda ra: ra['RA'], filter(lambda doi_info: 'RA' in doi_info, resolved_ras_for_doi_prefixes)))
+    # For each prefix, resolve its RA and add the prefix's DOIs to the RA's DOIs.
+    for offset in range(0, len(doi_prefixes), prefix_chunk_size):
+        resolved_ras_for_doi_prefixes: List[Dict[str, str]] = await resolve_registration_agency_prefixes(
+            doi_prefixes[offset:offset + prefix_chunk_size], concurrency, base_url, session)
 
-    # For each RA, get the associated prefixes and filter the DOIs by them
-    # For each RA, a dict with a list of associated DOIs is created
-    ra_list: List[Dict[str, List[str]]] = list(map(lambda reg_ag: {reg_ag: filter_dois_by_prefixes(dois,
-                                                                                                   filter_prefixes_by_registration_agency(
-                                                                                                       resolved_ras_for_doi_prefixes,
-                                                                                                       reg_ag))}, ras))
+        for doi_info in filter(lambda doi_info: 'RA' in doi_info and doi_info.get('DOI') in dois_by_prefix, resolved_ras_for_doi_prefixes):
+            dois_by_ra.setdefault(doi_info['RA'], []).extend(dois_by_prefix[doi_info['DOI']])
 
-    # Combine all dicts into one structure
-    return reduce(lambda a, b: {**a, **b}, ra_list)
+    return dois_by_ra
 
 
 __all__ = ['RAs', 'group_dois_by_ra']
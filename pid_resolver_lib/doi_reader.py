@@ -0,0 +1,176 @@
+#  Copyright 2024 Switch
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import io
+import json
+import logging
+import re
+from itertools import chain
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, TextIO, cast
+from urllib.parse import unquote
+
+from . import json_backend
+
+DOI_READER = 'DOI READER:'
+
+# characters read at once from a DOI file
+READ_CHUNK_SIZE = 1 << 20
+
+# maximum length of an element of a JSON array of DOIs
+MAX_ELEMENT_SIZE = 1 << 16
+
+# the comma separating the elements of a JSON array or its closing bracket, surrounded by whitespace
+_SEPARATOR = re.compile(r'\s*([,\]])\s*')
+
+_WHITESPACE = re.compile(r'\s*')
+
+# resolver URL or URI scheme preceding a DOI, e.g., https://doi.org/10.1000/abc, http://dx.doi.org/10.1000/abc or doi:10.1000/abc
+_DOI_PREFIX = re.compile(r'^(?:(?:https?://)?(?:dx\.|www\.)?doi\.org/|doi:)', re.IGNORECASE)
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_doi(doi: str) -> str:
+    # remove backslashes
+    return doi.replace('\\', '')
+
+
+def canonical_doi(doi: str) -> str:
+    """
+    Returns the canonical form of a DOI, used as key in the caches and results.
+    DOIs are case-insensitive, so they are lower-cased. Surrounding whitespace, a resolver URL or "doi:" prefix and backslashes are removed,
+    percent-encoded characters (e.g., %2F in a DOI URL) are decoded.
+
+    @param doi: The DOI, e.g., https://doi.org/10.1000/ABC.
+    @return: The canonical DOI, e.g., 10.1000/abc.
+    """
+
+    doi = _DOI_PREFIX.sub('', doi.strip())
+
+    if '%' in doi:
+        doi = unquote(doi)
+
+    return normalize_doi(doi).lower()
+
+
+def _iter_json_array(buffer: str, file: TextIO, chunk_size: int) -> Iterator[Any]:
+    """
+    Decodes the elements of a JSON array one by one, reading the rest of the file in chunks.
+
+    @param buffer: The beginning of the file, starting with the array's opening bracket.
+    """
+
+    decoder = json.JSONDecoder()
+
+    pos = cast(re.Match, _WHITESPACE.match(buffer, 1)).end()
+    eof = False
+
+    if buffer.startswith(']', pos):
+        return
+
+    while True:
+        try:
+            value, end = decoder.raw_decode(buffer, pos)
+            # the element is followed by a comma or the closing bracket, unless it continues in the next chunk (e.g., a number)
+            separator = _SEPARATOR.match(buffer, end)
+        except json.JSONDecodeError:
+            separator = None
+
+        if separator is None:
+            # elements are short, a longer remainder that cannot be decoded is not truncated, but invalid
+            if eof or len(buffer) - pos > MAX_ELEMENT_SIZE:
+                raise ValueError(f'invalid JSON array at {buffer[pos:pos + 100]!r}')
+
+            chunk = file.read(chunk_size)
+            eof = len(chunk) == 0
+            buffer = buffer[pos:] + chunk
+            pos = cast(re.Match, _WHITESPACE.match(buffer)).end()
+            continue
+
+        yield value
+
+        if separator.group(1) == ']':
+            return
+
+        pos = separator.end()
+
+
+def iter_dois(file: TextIO, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[str]:
+    """
+    Reads the DOIs contained in a file one by one without loading the file into memory.
+    The file contains a JSON array of DOIs, one JSON string per line (NDJSON) or one DOI per line (plain text).
+    The DOIs are returned in canonical form (see canonical_doi), empty lines and elements that are not strings are skipped, duplicates are kept.
+
+    @param file: The file, opened in text mode.
+    @param chunk_size: Number of characters of a JSON array read at once.
+    """
+
+    head = file.read(chunk_size).lstrip()
+
+    values: Iterator[Any]
+    if head.startswith('['):
+        values = _iter_json_array(head, file, chunk_size)
+    else:
+        # the beginning is completed to a line
+        lines = chain(io.StringIO(head + file.readline()), file)
+        values = map(lambda line: json_backend.loads(line) if line.startswith('"') else line, filter(None, map(str.strip, lines)))
+
+    for value in values:
+        if not isinstance(value, str):
+            logging.warning(f'{DOI_READER} skipping {value!r}, expected a DOI')
+            continue
+
+        doi = canonical_doi(value)
+
+        if len(doi) > 0:
+            yield doi
+
+
+def read_doi_file(doi_file: Path) -> List[str]:
+    """
+    Reads the DOIs of a file (JSON array, NDJSON or plain text) in canonical form, see iter_dois. Duplicates are removed, the order is kept.
+
+    @param doi_file: Path of the file.
+    """
+
+    with open(doi_file, encoding='utf-8') as f:
+        return list(dict.fromkeys(iter_dois(f)))
+
+
+def get_doi_prefix(doi: str) -> str:
+    # e.g., 10.1016 for 10.1016/j.jtherbio.2015.06.009
+    return doi.partition('/')[0]
+
+
+def bucket_dois_by_prefix(dois: Iterable[str], exclude: Optional[Set[str]] = None) -> Dict[str, List[str]]:
+    """
+    Groups DOIs by their prefix in one pass, removing duplicates. The order of the DOIs is kept.
+
+    @param dois: DOIs without base URL, e.g., as read by iter_dois.
+    @param exclude: DOIs to be skipped, e.g., DOIs that are cached already.
+    @return: DOIs indexed by prefix.
+    """
+
+    # dicts are used as ordered sets
+    buckets: Dict[str, Dict[str, None]] = {}
+
+    for doi in dois:
+        if exclude is None or doi not in exclude:
+            buckets.setdefault(get_doi_prefix(doi), {})[doi] = None
+
+    return {prefix: list(bucket) for prefix, bucket in buckets.items()}
+
+
+__all__ = ['iter_dois', 'read_doi_file', 'bucket_dois_by_prefix', 'get_doi_prefix', 'normalize_doi', 'canonical_doi', 'READ_CHUNK_SIZE']
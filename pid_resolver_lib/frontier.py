@@ -0,0 +1,236 @@
+#  Copyright 2024 Switch
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import logging
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, NamedTuple, Optional
+
+from .doi_ra_handler import RAs
+
+FRONTIER = 'FRONTIER:'
+
+logger = logging.getLogger(__name__)
+
+
+class FrontierEntry(NamedTuple):
+    """
+    Represents a DOI waiting in the frontier of a crawl.
+    """
+
+    doi: str # 0
+    depth: int # 1 iteration the DOI was found in, 0 for the DOIs the crawl started with
+    linked_orcids: FrozenSet[str] # 2 ORCIDs whose profiles list the DOI
+    linked_seed_orcids: FrozenSet[str] # 3 linked ORCIDs that are authors of the DOIs the crawl started with
+    ra: Optional[str] # 4 RA the DOI has to be requested from, None if it is cached or its RA is unknown
+
+
+class CrawlBudget(NamedTuple):
+    """
+    Represents hard limits of a crawl run. None stands for no limit.
+    """
+
+    max_records: Optional[int] # 0 DOIs taken from the frontier over the whole run
+    max_records_per_iteration: Optional[int] # 1 DOIs taken from the frontier per iteration
+    max_requests_per_ra: Dict[str, int] # 2 DOIs that are not cached yet taken from the frontier per RA
+    max_seconds: Optional[float] # 3 wall time of the run, checked before each iteration
+
+
+NO_BUDGET = CrawlBudget(None, None, {}, None)
+
+
+class BudgetUsage(NamedTuple):
+    """
+    Represents the part of a crawl budget that has been used, e.g., to be restored when a crawl is resumed.
+    """
+
+    records: int # 0 DOIs taken from the frontier
+    requests_per_ra: Dict[str, int] # 1 DOIs that were not cached taken from the frontier per RA
+    seconds: float # 2 wall time
+
+# a score is any comparable value, entries with higher scores are taken from the frontier first
+ScoreFunction = Callable[[FrontierEntry], Any]
+
+
+def get_ra_cost(ra: Optional[str]) -> float:
+    """
+    Returns the relative cost of requesting a record from an RA: one request plus the RA's sleep per batch in seconds.
+    Cached DOIs cost nothing.
+    """
+
+    if ra is None:
+        return 0
+
+    return 1 + float(RAs[ra]['sleep']) if ra in RAs else 1
+
+
+def score_by_linked_seed_orcids(entry: FrontierEntry) -> int:
+    return len(entry.linked_seed_orcids)
+
+
+def score_by_linked_orcids(entry: FrontierEntry) -> int:
+    return len(entry.linked_orcids)
+
+
+def score_by_depth(entry: FrontierEntry) -> int:
+    # DOIs closer to the DOIs the crawl started with come first
+    return -entry.depth
+
+
+def score_by_ra_cost(entry: FrontierEntry) -> float:
+    return -get_ra_cost(entry.ra)
+
+
+def combine_scores(*scores: ScoreFunction) -> ScoreFunction:
+    """
+    Combines score functions: entries are ordered by the first score, ties are broken by the following ones.
+    """
+    return lambda entry: tuple(map(lambda score: score(entry), scores))
+
+
+default_score: ScoreFunction = combine_scores(score_by_linked_seed_orcids, score_by_linked_orcids, score_by_depth, score_by_ra_cost)
+
+
+class PriorityFrontier:
+    """
+    The DOIs to be resolved by a crawl, taken in order of their scores and limited by a budget.
+
+    DOIs found in several ORCID profiles accumulate the ORCIDs linking them, so their scores rise as the crawl proceeds.
+    """
+
+    def __init__(self, score: ScoreFunction = default_score, budget: CrawlBudget = NO_BUDGET):
+        """
+        @param score: Scores entries, entries with higher scores are taken first. Entries with equal scores are taken in the order they were added.
+        @param budget: Limits of the crawl run, counted from the creation of the frontier unless the used budget is restored.
+        """
+
+        self.score = score
+        self.budget = budget
+        self.seed_orcids: FrozenSet[str] = frozenset()
+        # insertion ordered, so entries with equal scores keep the order they were found in
+        self._entries: Dict[str, FrontierEntry] = {}
+        self._records = 0
+        self._requests_per_ra: Counter = Counter()
+        self._started = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, doi: object) -> bool:
+        return doi in self._entries
+
+    def set_seed_orcids(self, orcids: Iterable[str]) -> None:
+        """
+        Sets the ORCIDs of the authors of the DOIs the crawl started with.
+        """
+
+        self.seed_orcids = frozenset(orcids)
+
+        self._entries = {doi: entry._replace(linked_seed_orcids=entry.linked_orcids & self.seed_orcids) for doi, entry in self._entries.items()}
+
+    def add(self, doi: str, depth: int, linked_orcids: Iterable[str] = (), ra: Optional[str] = None) -> None:
+        """
+        Adds a DOI to the frontier. If the DOI is already contained, the linked ORCIDs are merged and the smaller depth is kept.
+
+        @param doi: The DOI without base URL.
+        @param depth: The iteration the DOI was found in.
+        @param linked_orcids: ORCIDs whose profiles list the DOI.
+        @param ra: The RA the DOI has to be requested from, None if it is cached or its RA is unknown.
+        """
+
+        known = self._entries.get(doi)
+
+        orcids = frozenset(linked_orcids) | (known.linked_orcids if known is not None else frozenset())
+
+        self._entries[doi] = FrontierEntry(doi, min(depth, known.depth) if known is not None else depth, orcids, orcids & self.seed_orcids,
+                                           ra if ra is not None or known is None else known.ra)
+
+    def get_entries(self) -> List[FrontierEntry]:
+        """
+        Returns the entries in the order they would be taken.
+        """
+        return sorted(self._entries.values(), key=self.score, reverse=True)
+
+    def get_dois(self) -> List[str]:
+        return list(map(lambda entry: entry.doi, self.get_entries()))
+
+    def get_budget_usage(self) -> BudgetUsage:
+        return BudgetUsage(self._records, dict(self._requests_per_ra), time.monotonic() - self._started)
+
+    def restore_budget_usage(self, usage: BudgetUsage) -> None:
+        """
+        Continues counting from a budget usage, e.g., when a crawl is resumed from a checkpoint.
+        """
+
+        self._records = usage.records
+        self._requests_per_ra = Counter(usage.requests_per_ra)
+        self._started = time.monotonic() - usage.seconds
+
+    def is_out_of_time(self) -> bool:
+        return self.budget.max_seconds is not None and time.monotonic() - self._started >= self.budget.max_seconds
+
+    def is_exhausted(self) -> bool:
+        """
+        Returns True if no more DOIs can be taken: the budget of records or wall time has been used up,
+        or no DOI is left whose RA's request budget has not been used up.
+        """
+
+        return self.is_out_of_time() or (self.budget.max_records is not None and self._records >= self.budget.max_records) or \
+            not any(map(self._within_ra_budget, self._entries.values()))
+
+    def _within_ra_budget(self, entry: FrontierEntry) -> bool:
+        limit = self.budget.max_requests_per_ra.get(entry.ra) if entry.ra is not None else None
+
+        return limit is None or self._requests_per_ra[entry.ra] < limit
+
+    def pop(self) -> List[FrontierEntry]:
+        """
+        Takes the entries with the highest scores from the frontier, as many as the budget allows for an iteration.
+        Entries whose RA's request budget is used up stay in the frontier.
+        """
+
+        if self.is_out_of_time():
+            return []
+
+        limit = len(self._entries)
+        if self.budget.max_records_per_iteration is not None:
+            limit = min(limit, self.budget.max_records_per_iteration)
+        if self.budget.max_records is not None:
+            limit = min(limit, self.budget.max_records - self._records)
+
+        taken: List[FrontierEntry] = []
+
+        for entry in self.get_entries():
+            if len(taken) >= limit:
+                break
+
+            if not self._within_ra_budget(entry):
+                continue
+
+            taken.append(entry)
+            del self._entries[entry.doi]
+
+            if entry.ra is not None:
+                self._requests_per_ra[entry.ra] += 1
+
+        self._records += len(taken)
+
+        logging.info(f'{FRONTIER} took {len(taken)} DOIs, {len(self._entries)} left, {self._records} taken in total, '
+                     f'requests per RA {dict(self._requests_per_ra)}')
+
+        return taken
+
+
+__all__ = ['PriorityFrontier', 'FrontierEntry', 'CrawlBudget', 'BudgetUsage', 'NO_BUDGET', 'ScoreFunction', 'default_score', 'combine_scores',
+           'score_by_linked_seed_orcids', 'score_by_linked_orcids', 'score_by_depth', 'score_by_ra_cost', 'get_ra_cost']
@@ -0,0 +1,292 @@
+#  Copyright 2024 Switch
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import json
+import logging
+import sqlite3
+from collections import Counter
+from contextlib import contextmanager
+from itertools import combinations
+from pathlib import Path
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple, cast
+
+from .coauthor_graph import CoauthorGraph, make_csr, _edge_key
+from .pid_analyzer import PublicationInfo, normalize_name
+
+GRAPH_STORE = 'GRAPH STORE:'
+
+# kinds of changes recorded since the changes were last cleared
+DOI = 'doi'
+ORCID = 'orcid'
+NAME = 'name'
+
+logger = logging.getLogger(__name__)
+
+
+class GraphUpdate(NamedTuple):
+    """
+    Represents the outcome of adding or updating publications in a graph store.
+    """
+
+    added: int # 0 publications not stored before
+    updated: int # 1 stored publications whose authors changed
+    unchanged: int # 2 stored publications whose authors did not change
+    edges: int # 3 edge weights incremented or decremented (each edge counted once)
+
+
+class GraphChanges(NamedTuple):
+    """
+    Represents what changed in a graph store since the changes were last cleared.
+    """
+
+    dois: Set[str] # 0 publications that were added, updated or removed
+    orcids: Set[str] # 1 ORCIDs of these publications, their edges may have moved
+    names: Set[str] # 2 name keys (see get_name_key) of authors with an ORCID in these publications
+
+
+def get_name_key(given_name: Optional[str], family_name: Optional[str]) -> str:
+    """
+    Returns a key for an author's normalized name, equal for names that are considered the same when inferring ORCIDs.
+    """
+    return json.dumps([normalize_name(family_name), normalize_name(given_name)])
+
+
+def _publication_authors(pub: PublicationInfo) -> List[List[Optional[str]]]:
+    return list(map(lambda author: [author.given_name, author.family_name, author.orcid], pub.authors))
+
+
+def _author_orcids(authors: List[List[Optional[str]]]) -> List[str]:
+    # an ORCID assigned to several authors of a publication is counted once
+    return sorted(cast(Set[str], set(filter(lambda orcid: orcid is not None, map(lambda author: author[2], authors)))))
+
+
+def _author_name_keys(authors: List[List[Optional[str]]]) -> Set[str]:
+    return set(map(lambda author: get_name_key(author[0], author[1]), filter(lambda author: author[2] is not None, authors)))
+
+
+class CoauthorGraphStore:
+    """
+    A co-author graph stored in a SQLite database that is updated incrementally as publications are added, updated or removed.
+
+    Only the edges of publications whose ORCIDs changed are touched. The store records the changed publications,
+    ORCIDs and names until the changes are cleared, e.g., after ORCIDs have been inferred for the affected publications.
+    """
+
+    def __init__(self, store_file: Path):
+        """
+        @param store_file: The SQLite database file, created if it does not exist.
+        """
+
+        # autocommit mode, transactions are started explicitly where several statements must be atomic
+        self._con = sqlite3.connect(str(store_file), timeout=60, isolation_level=None)
+        self._con.execute('PRAGMA journal_mode=WAL')
+        # authors of a publication as a JSON array of [given name, family name, ORCID]
+        self._con.execute('CREATE TABLE IF NOT EXISTS publications (doi TEXT PRIMARY KEY, authors TEXT)')
+        self._con.execute('CREATE TABLE IF NOT EXISTS publication_orcids (orcid TEXT, doi TEXT, PRIMARY KEY (orcid, doi)) WITHOUT ROWID')
+        # each edge is stored for both of its ORCIDs
+        self._con.execute('CREATE TABLE IF NOT EXISTS edges (orcid TEXT, co_author TEXT, weight INTEGER, '
+                          'PRIMARY KEY (orcid, co_author)) WITHOUT ROWID')
+        self._con.execute('CREATE TABLE IF NOT EXISTS changes (kind TEXT, pid TEXT, PRIMARY KEY (kind, pid)) WITHOUT ROWID')
+
+    def close(self) -> None:
+        self._con.close()
+
+    def __enter__(self) -> 'CoauthorGraphStore':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    @contextmanager
+    def _transaction(self) -> Iterator[None]:
+        self._con.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except Exception:
+            self._con.execute('ROLLBACK')
+            raise
+
+        self._con.execute('COMMIT')
+
+    def _get_authors_json(self, doi: str) -> Optional[str]:
+        row = self._con.execute('SELECT authors FROM publications WHERE doi = ?', (doi,)).fetchone()
+
+        return None if row is None else row[0]
+
+    def _apply_edge_deltas(self, deltas: Counter) -> None:
+        # a pair of ORCIDs is incremented or decremented in both directions
+        rows = list(map(lambda item: (item[0][0], item[0][1], item[1]), deltas.items())) + \
+            list(map(lambda item: (item[0][1], item[0][0], item[1]), deltas.items()))
+
+        self._con.executemany('INSERT INTO edges VALUES (?, ?, ?) ON CONFLICT (orcid, co_author) DO UPDATE SET weight = weight + excluded.weight',
+                              rows)
+        self._con.executemany('DELETE FROM edges WHERE orcid = ? AND co_author = ? AND weight <= 0',
+                              map(lambda row: row[:2], filter(lambda row: row[2] < 0, rows)))
+
+    def _record_changes(self, doi: str, authors: Iterable[List[Optional[str]]]) -> None:
+        authors = list(authors)
+
+        self._con.executemany('INSERT OR IGNORE INTO changes VALUES (?, ?)',
+                              [(DOI, doi)] + list(map(lambda orcid: (ORCID, orcid), _author_orcids(authors))) +
+                              list(map(lambda name: (NAME, name), _author_name_keys(authors))))
+
+    def _replace_publication(self, doi: str, old_authors: List[List[Optional[str]]], new_authors: Optional[List[List[Optional[str]]]],
+                             new_authors_json: Optional[str], deltas: Counter) -> None:
+        old_orcids = _author_orcids(old_authors)
+        new_orcids = _author_orcids(new_authors) if new_authors is not None else []
+
+        if old_orcids != new_orcids:
+            deltas.subtract(combinations(old_orcids, 2))
+            deltas.update(combinations(new_orcids, 2))
+
+            self._con.executemany('DELETE FROM publication_orcids WHERE orcid = ? AND doi = ?', map(lambda orcid: (orcid, doi), old_orcids))
+            self._con.executemany('INSERT INTO publication_orcids VALUES (?, ?)', map(lambda orcid: (orcid, doi), new_orcids))
+
+        if new_authors is None:
+            self._con.execute('DELETE FROM publications WHERE doi = ?', (doi,))
+        else:
+            self._con.execute('INSERT OR REPLACE INTO publications VALUES (?, ?)', (doi, new_authors_json))
+
+        # both the old and the new authors may have changed the ORCIDs inferred for other publications
+        self._record_changes(doi, old_authors + (new_authors if new_authors is not None else []))
+
+    def update_publications(self, publications: Iterable[PublicationInfo]) -> GraphUpdate:
+        """
+        Adds publications or updates them if they are stored already, e.g., the results of Resolver.analyze.
+        Only the edges between ORCIDs added to or removed from a publication are changed.
+
+        @param publications: Resolved publications.
+        """
+
+        added = updated = unchanged = 0
+        # weight changes of pairs of ORCIDs (in lexical order)
+        deltas: Counter = Counter()
+
+        with self._transaction():
+            for pub in publications:
+                new_authors = _publication_authors(pub)
+                new_authors_json = json.dumps(new_authors)
+                # the serialized authors are compared, only changed publications are parsed
+                old_authors_json = self._get_authors_json(pub.doi)
+
+                if old_authors_json == new_authors_json:
+                    unchanged += 1
+                    continue
+
+                if old_authors_json is None:
+                    added += 1
+                else:
+                    updated += 1
+
+                self._replace_publication(pub.doi, json.loads(old_authors_json) if old_authors_json is not None else [], new_authors,
+                                          new_authors_json, deltas)
+
+            edges = Counter({pair: delta for pair, delta in deltas.items() if delta != 0})
+            self._apply_edge_deltas(edges)
+
+        result = GraphUpdate(added, updated, unchanged, len(edges))
+
+        logging.info(f'{GRAPH_STORE} {result}')
+
+        return result
+
+    def remove_publications(self, dois: Iterable[str]) -> int:
+        """
+        Removes publications and their edges.
+
+        @param dois: DOIs without base URL, DOIs that are not stored are ignored.
+        @return: The number of removed publications.
+        """
+
+        removed = 0
+        deltas: Counter = Counter()
+
+        with self._transaction():
+            for doi in dois:
+                old_authors_json = self._get_authors_json(doi)
+
+                if old_authors_json is None:
+                    continue
+
+                removed += 1
+                self._replace_publication(doi, json.loads(old_authors_json), None, None, deltas)
+
+            self._apply_edge_deltas(Counter({pair: delta for pair, delta in deltas.items() if delta != 0}))
+
+        return removed
+
+    def get_dois(self) -> List[str]:
+        return list(map(lambda row: row[0], self._con.execute('SELECT doi FROM publications')))
+
+    def get_dois_of_orcids(self, orcids: Iterable[str]) -> Set[str]:
+        """
+        Returns the publications ORCIDs are authors of.
+        """
+
+        return set(row[0] for orcid in orcids for row in self._con.execute('SELECT doi FROM publication_orcids WHERE orcid = ?', (orcid,)))
+
+    def neighbors(self, orcid: str) -> List[Tuple[str, int]]:
+        """
+        Returns the co-authors of an ORCID and the number of publications shared with each of them, ordered by co-author.
+        """
+
+        return list(map(tuple, self._con.execute('SELECT co_author, weight FROM edges WHERE orcid = ? ORDER BY co_author', (orcid,))))
+
+    def neighborhood(self, orcids: Iterable[str], hops: int = 1) -> Set[str]:
+        """
+        Returns the ORCIDs that can be reached from the given ORCIDs within a number of hops (including the given ORCIDs that are stored).
+        """
+
+        frontier: Set[str] = self._known_orcids(orcids)
+        reached: Set[str] = set(frontier)
+
+        for _ in range(hops):
+            frontier = set(co_author for orcid in frontier for co_author, _ in self.neighbors(orcid)) - reached
+            reached.update(frontier)
+
+        return reached
+
+    def _known_orcids(self, orcids: Iterable[str]) -> Set[str]:
+        return set(filter(lambda orcid: self._con.execute('SELECT 1 FROM publication_orcids WHERE orcid = ? LIMIT 1', (orcid,)).fetchone()
+                          is not None, orcids))
+
+    def get_changes(self) -> GraphChanges:
+        """
+        Returns the publications, ORCIDs and names that changed since the changes were last cleared.
+        """
+
+        changes: dict = {DOI: set(), ORCID: set(), NAME: set()}
+        for kind, pid in self._con.execute('SELECT kind, pid FROM changes'):
+            changes[kind].add(pid)
+
+        return GraphChanges(changes[DOI], changes[ORCID], changes[NAME])
+
+    def clear_changes(self) -> None:
+        self._con.execute('DELETE FROM changes')
+
+    def to_coauthor_graph(self) -> CoauthorGraph:
+        """
+        Returns the stored graph as an in-memory CSR graph, e.g., to be written with write_coauthor_graph.
+        """
+
+        nodes: List[str] = list(map(lambda row: row[0], self._con.execute('SELECT DISTINCT orcid FROM publication_orcids ORDER BY orcid')))
+        node_ids = dict(zip(nodes, range(len(nodes))))
+
+        pair_weights = {_edge_key(node_ids[orcid], node_ids[co_author]): weight for orcid, co_author, weight in
+                        self._con.execute('SELECT orcid, co_author, weight FROM edges WHERE orcid < co_author')}
+
+        return make_csr(nodes, pair_weights)
+
+
+__all__ = ['CoauthorGraphStore', 'GraphUpdate', 'GraphChanges', 'get_name_key']
@@ -12,21 +12,23 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 #
+import getopt
 import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import NamedTuple, List, Dict
-import json
-from .pid_analyzer import parse_resolved_dois_from_json, PublicationInfo, AuthorInfo
-
-logging.basicConfig(filename='pid_infer.log',
-                    filemode='a',
-                    format='%(module)s %(levelname)s: %(asctime)s %(message)s',
-                    datefmt='%H:%M:%S',
-                    encoding='utf-8',
-                    level=logging.DEBUG)
+from typing import NamedTuple, List, Dict, Optional, Set, Tuple
+from . import json_backend
+from .graph_store import CoauthorGraphStore, GraphChanges, get_name_key
+from .pid_analyzer import PublicationInfo, AuthorInfo, normalize_name, parse_resolved_dois_from_json
+from .snapshot import load_resolved_dois
 
 logger = logging.getLogger(__name__)
 
+# minimum number of publications per task of the process pool, small components are inferred together, see infer_orcids_parallel
+INFER_CHUNK_SIZE = 1000
+
 class ContextInfo(NamedTuple):
     author: AuthorInfo
     co_authors: List[AuthorInfo]
@@ -45,12 +47,25 @@ def make_context(pub: PublicationInfo) -> List[ContextInfo]:
 
 
 def search_author(given_name: str, family_name: str, with_ctx: List[ContextInfo]):
-    return list(filter(lambda ctx: ctx.author.given_name == given_name and ctx.author.family_name == family_name and ctx.author.orcid is not None, with_ctx))
+    # compare normalized names, e.g., "Ortuño" and "Ortuno" (normalized forms are memoized)
+    given_name_norm = normalize_name(given_name)
+    family_name_norm = normalize_name(family_name)
 
+    return list(filter(lambda ctx: ctx.author.orcid is not None and normalize_name(ctx.author.family_name) == family_name_norm and normalize_name(ctx.author.given_name) == given_name_norm, with_ctx))
 
 
-def main():
-    results: Dict[str, PublicationInfo] = parse_resolved_dois_from_json(Path('results.json'))
+
+def infer_orcids(results: Dict[str, PublicationInfo], dois: Optional[Set[str]] = None) -> Dict[str, PublicationInfo]:
+    """
+    Infers missing ORCIDs of authors from co-authors shared with an author of the same name in another publication.
+
+    @param results: Resolved publications indexed by DOI, all of them are searched for matching authors.
+    @param dois: Publications whose authors' ORCIDs are to be inferred, all publications if not given.
+    @return: The publications with inferred ORCIDs (origin "inferred") indexed by DOI.
+    """
+
+    # publications are replaced, the given results are not modified
+    results = dict(results)
 
     pubs: List[PublicationInfo] = list(results.values())
 
@@ -65,6 +80,9 @@ def main():
 
     for auth_ctx in flattened_context:
 
+        if dois is not None and auth_ctx.doi not in dois:
+            continue
+
         if auth_ctx.author.orcid is None:
             match = search_author(auth_ctx.author.given_name, auth_ctx.author.family_name, flattened_context)
 
@@ -101,5 +119,201 @@ def main():
                                                                                                           auth_ctx.idx + 1:]
                     )
 
+    return results
+
+
+def _name_key(author: AuthorInfo) -> Tuple[str, str]:
+    # authors are matched by their normalized names, see search_author
+    return normalize_name(author.given_name), normalize_name(author.family_name)
+
+
+def get_components(results: Dict[str, PublicationInfo]) -> List[List[str]]:
+    """
+    Partitions publications into components whose inferred ORCIDs do not depend on each other.
+    An ORCID is only inferred from an author with ORCID and the same name, so publications sharing the name of an author with ORCID
+    belong to the same component. Names no author with ORCID has do not connect publications.
+
+    @param results: Resolved publications indexed by DOI.
+    @return: The DOIs of each component in the order of results, the components are ordered by their first DOI.
+    """
+
+    dois = list(results)
+
+    # union-find over the publications' positions, a component's root is its first publication
+    parent = list(range(len(dois)))
+
+    def find(idx: int) -> int:
+        while parent[idx] != idx:
+            parent[idx] = parent[parent[idx]]
+            idx = parent[idx]
+        return idx
+
+    names_with_orcid: Set[Tuple[str, str]] = set(
+        _name_key(author) for pub in results.values() for author in pub.authors if author.orcid is not None)
+
+    # first publication per name
+    first_with_name: Dict[Tuple[str, str], int] = {}
+
+    for idx, doi in enumerate(dois):
+        for name in filter(lambda name: name in names_with_orcid, map(_name_key, results[doi].authors)):
+            root = find(first_with_name.setdefault(name, idx))
+            other_root = find(idx)
+
+            if root != other_root:
+                parent[max(root, other_root)] = min(root, other_root)
+
+    components: Dict[int, List[str]] = {}
+    for idx, doi in enumerate(dois):
+        components.setdefault(find(idx), []).append(doi)
+
+    return list(components.values())
+
+
+def _infer_chunk(chunk: Tuple[Dict[str, PublicationInfo], Optional[Set[str]]]) -> Dict[str, PublicationInfo]:
+    # runs in a worker process, only the publications with inferred ORCIDs are sent back
+    publications, dois = chunk
+
+    inferred = infer_orcids(publications, dois)
+
+    return {doi: pub for doi, pub in inferred.items() if pub is not publications[doi]}
+
+
+def infer_orcids_parallel(results: Dict[str, PublicationInfo], dois: Optional[Set[str]] = None, processes: Optional[int] = None,
+                          chunk_size: int = INFER_CHUNK_SIZE) -> Dict[str, PublicationInfo]:
+    """
+    Like infer_orcids with identical results, but infers the ORCIDs of independent components (see get_components) in a process pool.
+    Components are combined into chunks of at least chunk_size publications, the inferred ORCIDs are merged in the order of results.
+
+    @param results: Resolved publications indexed by DOI.
+    @param dois: Publications whose authors' ORCIDs are to be inferred, all publications if not given.
+    @param processes: Maximum number of worker processes, the number of CPUs if not given. With one process, the chunks are inferred
+                      one after another in the calling process.
+    @param chunk_size: Minimum number of publications per chunk.
+    @return: The publications with inferred ORCIDs (origin "inferred") indexed by DOI.
+    """
+
+    # components without publications to be inferred are not sent to the workers
+    components = filter(lambda component: dois is None or any(map(lambda doi: doi in dois, component)), get_components(results))
+
+    chunks: List[List[str]] = [[]]
+    for component in components:
+        if len(chunks[-1]) >= chunk_size:
+            chunks.append([])
+
+        chunks[-1].extend(component)
+
+    if len(chunks) == 1:
+        return infer_orcids(results, dois)
+
+    logging.info(f'inferring ORCIDs of {sum(map(len, chunks))} publications in {len(chunks)} chunks')
+
+    tasks = map(lambda chunk: ({doi: results[doi] for doi in chunk}, dois.intersection(chunk) if dois is not None else None), chunks)
+
+    updated = dict(results)
+
+    if processes == 1:
+        # authors are still only searched within a chunk
+        for inferred in map(_infer_chunk, tasks):
+            updated.update(inferred)
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            # chunks are disjoint and results are collected in the order the chunks were submitted
+            for inferred in executor.map(_infer_chunk, tasks):
+                updated.update(inferred)
+
+    return updated
+
+
+def get_affected_dois(results: Dict[str, PublicationInfo], changes: GraphChanges) -> Set[str]:
+    """
+    Returns the publications whose inferred ORCIDs may differ after the co-author graph changed: the changed publications
+    and publications with an author without ORCID whose name matches an author with ORCID of a changed publication.
+    The ORCID of an author is inferred from the first match by name, so other publications are not affected.
+
+    @param results: Resolved publications indexed by DOI.
+    @param changes: Changes recorded by the graph store.
+    """
+
+    same_names = set(map(lambda pub: pub.doi, filter(
+        lambda pub: any(map(lambda author: author.orcid is None and get_name_key(author.given_name, author.family_name) in changes.names,
+                            pub.authors)), results.values())))
+
+    return changes.dois | same_names
+
+
+def apply_inferred_orcids(pub: PublicationInfo, previous: PublicationInfo) -> PublicationInfo:
+    """
+    Applies the ORCIDs inferred for a publication in a previous run to the publication as resolved now.
+    Everything else, e.g., the title, RORs or origins, is taken from the current publication.
+
+    @param pub: The publication as resolved now.
+    @param previous: The publication with the ORCIDs inferred previously (origin "inferred"), its authors must be unchanged.
+    """
+
+    return PublicationInfo(doi=pub.doi, title=pub.title, authors=list(map(
+        lambda authors: authors[1] if authors[1].origin_orcid == 'inferred' else authors[0], zip(pub.authors, previous.authors))))
+
+
+def usage() -> None:
+    print('Usage: ' + sys.argv[0] + ' [-g <graph_store>] [-p <processes>]')
+    print('Infers missing ORCIDs in results.json (working directory) and writes updated.json.')
+    print('-g <graph_store>: co-author graph store (SQLite) updated with results.json, ORCIDs are only inferred again for publications')
+    print('   affected by changes since the last run, the others keep the ORCIDs inferred in updated.json')
+    print('-p <processes>: number of processes inferring independent groups of publications in parallel, defaults to the number of CPUs')
+    exit(1)
+
+
+def main():
+    logging.basicConfig(filename='pid_infer.log',
+                        filemode='a',
+                        format='%(module)s %(levelname)s: %(asctime)s %(message)s',
+                        datefmt='%H:%M:%S',
+                        encoding='utf-8',
+                        level=logging.DEBUG)
+
+    graph_store_file = None
+    processes = None
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "g:p:h")
+
+        for opt, arg in opts:
+            if opt in ['-g']:
+                graph_store_file = Path(arg)
+            elif opt in ['-p']:
+                processes = int(arg)
+            elif opt in ['-h']:
+                usage()
+
+    except Exception as err:
+        print(err, file=sys.stderr)
+        usage()
+
+    # read from the binary snapshot if it has been written alongside results.json
+    results: Dict[str, PublicationInfo] = load_resolved_dois(Path('results.json'))
+
+    if graph_store_file is None:
+        updated = infer_orcids_parallel(results, processes=processes)
+    else:
+        with CoauthorGraphStore(graph_store_file) as store:
+            store.update_publications(results.values())
+            store.remove_publications(set(store.get_dois()) - set(results))
+
+            previous = parse_resolved_dois_from_json(Path('updated.json')) if os.path.isfile('updated.json') else {}
+
+            # publications missing from the previous results are inferred as well
+            affected = get_affected_dois(results, store.get_changes()) | (set(results) - set(previous))
+
+            logging.info(f'inferring ORCIDs for {len(affected)} of {len(results)} publications')
+
+            updated = infer_orcids_parallel(results, affected, processes)
+            # the authors of unaffected publications did not change, other information may have
+            updated.update({doi: apply_inferred_orcids(results[doi], previous[doi]) for doi in results if doi not in affected})
+
     with open('updated.json', 'w') as f:
-        f.write(json.dumps(results))
+        f.write(json_backend.dumps(updated))
+
+    if graph_store_file is not None:
+        # inferred ORCIDs are up to date with the stored graph
+        with CoauthorGraphStore(graph_store_file) as store:
+            store.clear_changes()
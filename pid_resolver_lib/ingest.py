@@ -0,0 +1,317 @@
+#  Copyright 2024 Switch
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import getopt
+import gzip
+import logging
+import sys
+import tarfile
+from pathlib import Path
+from typing import IO, Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple, cast
+
+from lxml import etree # type: ignore
+
+from . import json_backend
+from .cache_handler import get_keys, write_records_to_cache
+from .doi_reader import canonical_doi, read_doi_file
+from .orcid_works import compact_orcid_record, compact_orcid_record_xml
+from .pid_analyzer import RECORD_NORMALIZERS, RecordNormalizer, normalize_orcid_profile, write_normalized_records
+from .pid_resolver import ResolvedRecord, write_metadata
+
+INGEST = 'INGEST:'
+
+# records written per transaction
+INGEST_BATCH_SIZE = 10000
+
+logger = logging.getLogger(__name__)
+
+
+class IngestSource(NamedTuple):
+    """
+    Represents a kind of data dump and the cache its records are written to.
+    """
+
+    cache_name: str # 0 cache directory below the cache root, e.g., "Crossref"
+    get_items: Callable[[Any], Iterable[Any]] # 1 items contained in a JSON document or XML root element
+    get_record: Callable[[Any], Tuple[str, str]] # 2 record (id, content) of an item
+    normalizer: RecordNormalizer # 3 normalizes the records' contents, see write_normalized_records
+    get_key: Callable[[str], str] # 4 cache key of an id, e.g., the canonical DOI
+
+
+class IngestReport(NamedTuple):
+    """
+    Represents the outcome of ingesting a dump.
+    """
+
+    records: int # 0 records read from the dump
+    ingested: int # 1 records written to the cache
+    cached: int # 2 records skipped since they were cached already
+    failed: int # 3 documents or records that could not be read
+
+
+def _items(document: Any, key: str) -> List[Dict]:
+    # a document contains an array of records (e.g., a saved API response) or is a single record (e.g., a line of a JSONL file)
+    if isinstance(document, list):
+        return document
+
+    if 'message' in document:
+        return document['message'][key]
+
+    return document[key] if key in document else [document]
+
+
+def _crossref_record(item: Dict) -> Tuple[str, str]:
+    # the fields requested by fetch_records_bulk, references and funders make up most of a record
+    return item['DOI'], json_backend.dumps({field: item[field] for field in ['DOI', 'title', 'author'] if field in item})
+
+
+def _datacite_record(item: Dict) -> Tuple[str, str]:
+    attributes = {field: item['attributes'][field] for field in ['doi', 'titles', 'creators'] if field in item['attributes']}
+
+    return item['attributes']['doi'], json_backend.dumps({'id': item.get('id'), 'type': item.get('type'), 'attributes': attributes})
+
+
+def _orcid_record(item: Any) -> Tuple[str, str]:
+    # the public data file contains a record per ORCID in XML
+    profile = compact_orcid_record_xml(item) if isinstance(item, etree._Element) else compact_orcid_record(item)
+
+    return profile['id'].rsplit('/', 1)[-1], json_backend.dumps(profile)
+
+
+INGEST_SOURCES: Dict[str, IngestSource] = {
+    # https://www.crossref.org/learning/public-data-file/
+    'crossref': IngestSource('Crossref', lambda document: _items(document, 'items'), _crossref_record, RECORD_NORMALIZERS['Crossref'], canonical_doi),
+    # https://support.datacite.org/docs/datacite-public-data-file
+    'datacite': IngestSource('DataCite', lambda document: _items(document, 'data'), _datacite_record, RECORD_NORMALIZERS['DataCite'], canonical_doi),
+    # https://info.orcid.org/documentation/integration-guide/working-with-bulk-data/
+    # the checksum of an ORCID may be an upper-case X, ids read with read_doi_file are lower-cased
+    'orcid': IngestSource('orcid', lambda document: [document], _orcid_record, normalize_orcid_profile, str.upper)
+}
+
+
+def _strip_suffix(name: str, suffixes: List[str]) -> Optional[str]:
+    for suffix in suffixes:
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+
+    return None
+
+
+def iter_dump_files(dump: Path) -> Iterator[Tuple[str, IO[bytes]]]:
+    """
+    Yields the files of a dump one after another without extracting them: the files below a directory, the members of a tar archive
+    (optionally compressed) or a single file.
+
+    @param dump: The dump's path.
+    @return: The files' names and contents, each content can only be read until the next file is yielded.
+    """
+
+    if dump.is_dir():
+        for path in sorted(filter(lambda path: path.is_file(), dump.rglob('*'))):
+            yield from iter_dump_files(path)
+
+    elif _strip_suffix(dump.name, ['.tar', '.tar.gz', '.tgz']) is not None:
+        # streaming mode, members are read in the order they are stored
+        with tarfile.open(dump, 'r|*') as tar:
+            for member in tar:
+                content = tar.extractfile(member) if member.isfile() else None
+
+                if content is not None:
+                    yield member.name, content
+
+    else:
+        with open(dump, 'rb') as content:
+            yield dump.name, content
+
+
+def iter_documents(name: str, content: IO[bytes]) -> Iterator[Any]:
+    """
+    Yields the documents of a file of a dump: each line of a JSONL file, the JSON document of a JSON file or the root element of an XML file.
+    Files may be compressed with gzip, other files are ignored.
+
+    @param name: The file's name.
+    @param content: The file's content.
+    """
+
+    uncompressed = _strip_suffix(name, ['.gz'])
+
+    if uncompressed is not None:
+        with gzip.open(content) as decompressed:
+            yield from iter_documents(uncompressed, cast(IO[bytes], decompressed))
+
+    elif _strip_suffix(name, ['.jsonl', '.ndjson']) is not None:
+        for line in content:
+            if len(line.strip()) > 0:
+                yield json_backend.loads(line)
+
+    elif name.endswith('.json'):
+        yield json_backend.load(content)
+
+    elif name.endswith('.xml'):
+        yield etree.parse(content).getroot()
+
+    else:
+        logging.info(f'{INGEST} skipping {name}')
+
+
+def _iter_records(dump: Path, source: IngestSource, report: Dict[str, int]) -> Iterator[Tuple[str, str]]:
+    for name, content in iter_dump_files(dump):
+        try:
+            for document in iter_documents(name, content):
+                for item in source.get_items(document):
+                    try:
+                        record = source.get_record(item)
+                    except Exception as e:
+                        logging.error(f'{INGEST} An error occurred when reading a record of {name}: {e}')
+                        report['failed'] += 1
+                        continue
+
+                    yield record
+
+        except Exception as e:
+            # the rest of the file is skipped
+            logging.error(f'{INGEST} An error occurred when reading {name}: {e}')
+            report['failed'] += 1
+
+
+def _write_batch(records: List[ResolvedRecord], cache_dir: Path, normalizer: RecordNormalizer) -> None:
+    # one transaction per cache directory and batch
+    write_records_to_cache(records, 0, 1, cache_dir)
+    write_metadata(records, cache_dir)
+    write_normalized_records(records, cache_dir, normalizer)
+
+
+def ingest_dump(dump: Path, source: IngestSource, cache_root: Path = Path('.'), record_ids: Optional[Iterable[str]] = None,
+                overwrite: bool = False, batch_size: int = INGEST_BATCH_SIZE) -> IngestReport:
+    """
+    Reads the records of a dump, e.g., a public data file, and writes them to a cache along with their normalized form,
+    so only records missing from the dump have to be fetched. The dump is streamed, it is not extracted or loaded into memory.
+
+    @param dump: A directory, tar archive or file containing JSON, JSONL or XML files (optionally compressed with gzip).
+    @param source: The kind of dump, see INGEST_SOURCES.
+    @param cache_root: Directory containing the cache directories.
+    @param record_ids: DOIs or ORCIDs to be ingested, all records if not given. Records are cached under their keys, e.g., canonical DOIs.
+    @param overwrite: If True, cached records are replaced with the dump's records.
+    @param batch_size: Number of records written per transaction.
+    """
+
+    cache_dir = cache_root / source.cache_name
+
+    wanted: Optional[Set[str]] = set(map(source.get_key, record_ids)) if record_ids is not None else None
+
+    cached: Set[str] = set() if overwrite else set(get_keys(cache_dir))
+
+    counts = {'records': 0, 'ingested': 0, 'cached': 0, 'failed': 0}
+    # records indexed by key, a record appearing several times in a batch is written once (the last occurrence)
+    batch: Dict[str, ResolvedRecord] = {}
+
+    for record_id, content in _iter_records(dump, source, counts):
+        counts['records'] += 1
+
+        key = source.get_key(record_id)
+
+        if wanted is not None and key not in wanted:
+            continue
+
+        if key in cached:
+            counts['cached'] += 1
+        else:
+            batch[key] = ResolvedRecord(key, content)
+
+        if len(batch) >= batch_size:
+            _write_batch(list(batch.values()), cache_dir, source.normalizer)
+            counts['ingested'] += len(batch)
+            logging.info(f'{INGEST} {counts}')
+            # a record appearing again in a later batch is skipped like a cached record
+            cached.update(batch)
+            batch = {}
+
+    if len(batch) > 0:
+        _write_batch(list(batch.values()), cache_dir, source.normalizer)
+        counts['ingested'] += len(batch)
+
+    report = IngestReport(**counts)
+
+    logging.info(f'{INGEST} ingested {dump} into {cache_dir}: {report}')
+
+    return report
+
+
+def usage() -> None:
+    print('Usage: ' + sys.argv[0] + ' -s <source> [-k <ids_file>] [-r <cache_root>] [-c <cache_policy>] [-b <batch_size>] [--overwrite] <dump> [<dump> ...]')
+    print('Writes the records of data dumps, e.g., public data files, to the caches, so only missing records have to be fetched.')
+    print(f'-s <source>: kind of dump, one of {", ".join(INGEST_SOURCES)}')
+    print('<dump>: directory, tar archive or file containing JSON, JSONL or XML files, optionally compressed with gzip')
+    print('-k <ids_file>: path to file containing DOIs or ORCIDs to be ingested (JSON array, NDJSON or one per line), defaults to all records')
+    print('-r <cache_root>: directory the cache directories are created in, defaults to the working directory')
+    print('-c <cache_policy>: size limit in bytes and eviction policy of a cache directory relative to the cache root, may be repeated, e.g. Crossref:4e9:none')
+    print(f'-b <batch_size>: number of records written per transaction, defaults to {INGEST_BATCH_SIZE}')
+    print('--overwrite: replace cached records with the records of the dumps')
+    exit(1)
+
+
+def main():
+    # progress is logged per batch, records that cannot be normalized are logged as errors
+    logging.basicConfig(filename='pid_resolver.log',
+                        filemode='a',
+                        format='%(module)s %(levelname)s: %(asctime)s %(message)s',
+                        datefmt='%H:%M:%S',
+                        encoding='utf-8',
+                        level=logging.INFO)
+
+    from .cli import parse_cache_policy
+
+    source = None
+    record_ids = None
+    cache_root = Path('.')
+    batch_size = INGEST_BATCH_SIZE
+    overwrite = False
+    cache_policies = []
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "s:k:r:c:b:h", ["overwrite"])
+
+        for opt, arg in opts:
+            if opt in ['-s']:
+                source = INGEST_SOURCES[arg.lower()]
+            elif opt in ['-k']:
+                # JSON array, NDJSON or plain text, ORCIDs are read like DOIs
+                record_ids = read_doi_file(Path(arg))
+            elif opt in ['-r']:
+                cache_root = Path(arg)
+            elif opt in ['-c']:
+                # configured once the cache root is known
+                cache_policies.append(arg)
+            elif opt in ['-b']:
+                batch_size = int(arg)
+            elif opt in ['--overwrite']:
+                overwrite = True
+            elif opt in ['-h']:
+                usage()
+
+        for cache_policy in cache_policies:
+            parse_cache_policy(cache_policy, cache_root)
+
+    except Exception as err:
+        print(err, file=sys.stderr)
+        usage()
+
+    if source is None or len(args) == 0:
+        usage()
+    else:
+        for dump in args:
+            print(f'{dump}: {ingest_dump(Path(dump), source, cache_root, record_ids, overwrite, batch_size)}')
+
+
+__all__ = ['ingest_dump', 'iter_dump_files', 'iter_documents', 'IngestSource', 'IngestReport', 'INGEST_SOURCES', 'INGEST_BATCH_SIZE']
@@ -0,0 +1,90 @@
+#  Copyright 2024 Switch
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Decodes and encodes JSON with orjson if it is installed (pid_resolver_lib[orjson]), with the standard library's json module otherwise.
+The backend is selected at import time, the environment variable PID_RESOLVER_JSON_BACKEND=json enforces the standard library.
+
+Values decoded by either backend are equal. Encoded values are equivalent, but not identical:
+orjson writes compact UTF-8 (no whitespace, non-ASCII characters are not escaped).
+Values orjson cannot handle (e.g., integers beyond 64 bit) are processed with the standard library.
+"""
+import json
+import os
+from typing import IO, Any, Union
+
+try:
+    import orjson # type: ignore
+except ImportError:  # orjson is an optional dependency, install pid_resolver_lib[orjson]
+    orjson = None # type: ignore
+
+if os.environ.get('PID_RESOLVER_JSON_BACKEND') == 'json':
+    orjson = None # type: ignore
+
+# name of the selected backend
+JSON_BACKEND = 'orjson' if orjson is not None else 'json'
+
+
+def _default(value: Any) -> Any:
+    # NamedTuples (e.g., PublicationInfo) are encoded as arrays like the standard library does
+    if isinstance(value, tuple):
+        return list(value)
+
+    raise TypeError
+
+
+def loads(value: Union[str, bytes]) -> Any:
+    """
+    Decodes a JSON document, like json.loads.
+
+    @param value: The JSON document.
+    """
+
+    if orjson is not None:
+        try:
+            return orjson.loads(value)
+        except orjson.JSONDecodeError:
+            # the standard library accepts some input orjson rejects and raises the familiar errors
+            pass
+
+    return json.loads(value)
+
+
+def load(file: IO) -> Any:
+    """
+    Decodes the JSON document contained in a file opened in text or binary mode, like json.load.
+
+    @param file: The file.
+    """
+    return loads(file.read())
+
+
+def dumps(value: Any) -> str:
+    """
+    Encodes a value as JSON, like json.dumps. NamedTuples are encoded as arrays.
+
+    @param value: The value.
+    """
+
+    if orjson is not None:
+        try:
+            return orjson.dumps(value, default=_default, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+        except TypeError:
+            # orjson.JSONEncodeError is a TypeError
+            pass
+
+    return json.dumps(value)
+
+
+__all__ = ['loads', 'load', 'dumps', 'JSON_BACKEND']
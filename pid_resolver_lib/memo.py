@@ -0,0 +1,169 @@
+#  Copyright 2024 Switch
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, NamedTuple, Optional
+
+
+class MemoStats(NamedTuple):
+    """
+    Represents the usage statistics of an in-memory LRU memo.
+    """
+
+    hits: int # 0
+    misses: int # 1
+    evictions: int # 2
+    entries: int # 3
+    size: int # 4
+
+
+class LRUMemo:
+    """
+    Bounded in-memory least-recently-used memo, limited by number of entries and by accumulated size of the entries.
+
+    The memo is shared within a process, e.g., between the analyzer modules, and is thread-safe.
+    Memoized values must not be mutated by callers.
+    """
+
+    def __init__(self, max_entries: int, max_size: int):
+        """
+        @param max_entries: Maximum number of entries.
+        @param max_size: Maximum accumulated size of the entries, as given when putting them (e.g., length of a string).
+        """
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self._entries: OrderedDict[Hashable, Any] = OrderedDict()
+        self._sizes: Dict[Hashable, int] = {}
+        self._size = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Returns the memoized value or None if the key is not memoized.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+
+            self._misses += 1
+            return None
+
+    def put(self, key: Hashable, value: Any, size: int = 1) -> None:
+        """
+        Memoizes a value, evicting the least recently used entries if the memo's limits are exceeded.
+        Values larger than the memo's size limit are not memoized. None values are not memoized.
+        """
+        if value is None:
+            return
+
+        with self._lock:
+            self._remove(key)
+
+            if size > self.max_size:
+                return
+
+            self._entries[key] = value
+            self._sizes[key] = size
+            self._size += size
+
+            while len(self._entries) > self.max_entries or self._size > self.max_size:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._evictions += 1
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any], size: Callable[[Any], int] = lambda value: 1) -> Any:
+        """
+        Returns the memoized value or computes and memoizes it on a miss.
+
+        @param key: The key of the value.
+        @param compute: Computes the value on a miss.
+        @param size: Determines the size of a computed value.
+        """
+        value = self.get(key)
+
+        if value is None:
+            value = compute()
+            self.put(key, value, size(value))
+
+        return value
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._remove(key)
+
+    def resize(self, max_entries: int, max_size: int) -> None:
+        """
+        Changes the limits of the memo, evicting entries if necessary.
+        """
+        with self._lock:
+            self.max_entries = max_entries
+            self.max_size = max_size
+
+            while len(self._entries) > self.max_entries or self._size > self.max_size:
+                self._remove(next(iter(self._entries)))
+                self._evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._size = 0
+            self._hits = 0
+            self._misses = 0
+            self._evictions = 0
+
+    def stats(self) -> MemoStats:
+        with self._lock:
+            return MemoStats(hits=self._hits, misses=self._misses, evictions=self._evictions, entries=len(self._entries), size=self._size)
+
+    def _remove(self, key: Hashable) -> None:
+        if key in self._entries:
+            del self._entries[key]
+            self._size -= self._sizes.pop(key)
+
+
+# records read from the caches, keyed by (cache_dir, key), sized by length
+RECORD_MEMO = LRUMemo(max_entries=100000, max_size=int(5e8))
+
+# extracted ORCID profiles (see normalize_orcid_profile), keyed by (orcid, digest of the JSON string), sized by length of the retained strings
+ORCID_PROFILE_MEMO = LRUMemo(max_entries=20000, max_size=int(5e8))
+
+# registration agencies keyed by (base URL of the DOI resolver, DOI prefix)
+RA_MEMO = LRUMemo(max_entries=100000, max_size=100000)
+
+
+def get_memo_stats() -> Dict[str, MemoStats]:
+    """
+    Returns the usage statistics of the memos shared within the process.
+    """
+    return {
+        'records': RECORD_MEMO.stats(),
+        'orcid_profiles': ORCID_PROFILE_MEMO.stats(),
+        'registration_agencies': RA_MEMO.stats()
+    }
+
+
+def clear_memos() -> None:
+    for memo in [RECORD_MEMO, ORCID_PROFILE_MEMO, RA_MEMO]:
+        memo.clear()
+
+
+__all__ = ['LRUMemo', 'MemoStats', 'RECORD_MEMO', 'ORCID_PROFILE_MEMO', 'RA_MEMO', 'get_memo_stats', 'clear_memos']
@@ -0,0 +1,129 @@
+#  Copyright 2024 Switch
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+from aiohttp import ClientSession # type: ignore
+from lxml import etree # type: ignore
+
+from . import json_backend
+from .pid_resolver import ResolvedRecord
+
+ORCID_WORKS = 'ORCID WORKS:'
+
+# public API, https://info.orcid.org/documentation/api-tutorials/api-tutorial-read-data-on-a-record/
+ORCID_API_URL = 'https://pub.orcid.org/v3.0'
+
+ORCID_API_MIME = 'application/json'
+
+logger = logging.getLogger(__name__)
+
+
+def _value(element: Optional[Dict]) -> Optional[str]:
+    return element.get('value') if element is not None else None
+
+
+def compact_orcid_profile(orcid: str, personal_details: Dict, works: Dict) -> Dict:
+    """
+    Reduces the personal details and the works summary of an ORCID record to the structure normalize_orcid_profile extracts from a full profile.
+
+    @param orcid: The ORCID without base URL.
+    @param personal_details: The response of /<orcid>/personal-details.
+    @param works: The response of /<orcid>/works.
+    @return: A dict with the structure {id, givenName, familyName, dois}.
+    """
+
+    # the name is missing if it is not public
+    name: Dict = personal_details.get('name') or {}
+
+    # works are grouped by their identifiers, identifiers of the work containing a work (e.g., the book of a chapter) are not the work's
+    dois: List[str] = [ext_id['external-id-value'] for group in works.get('group', [])
+                       for ext_id in (group.get('external-ids') or {}).get('external-id', [])
+                       if ext_id.get('external-id-type') == 'doi' and ext_id.get('external-id-relationship', 'self') == 'self']
+
+    return {'id': f'https://orcid.org/{orcid}', 'givenName': _value(name.get('given-names')), 'familyName': _value(name.get('family-name')),
+            'dois': list(dict.fromkeys(dois))}
+
+
+def compact_orcid_record(record: Dict) -> Dict:
+    """
+    Reduces a full ORCID record in JSON (/<orcid>/record, or a record of the ORCID public data file) to a compact profile.
+
+    @param record: The ORCID record.
+    """
+
+    activities: Dict = record.get('activities-summary') or {}
+
+    return compact_orcid_profile(record['orcid-identifier']['path'], record.get('person') or {}, activities.get('works') or {})
+
+
+def compact_orcid_record_xml(record: etree.Element) -> Dict:
+    """
+    Reduces an ORCID record in XML (a record of the summaries in the ORCID public data file) to a compact profile.
+
+    @param record: The root element of the record.
+    """
+
+    name: Optional[etree.Element] = record.find('{*}person/{*}name')
+
+    personal_details = {'name': {'given-names': {'value': name.findtext('{*}given-names')},
+                                 'family-name': {'value': name.findtext('{*}family-name')}}} if name is not None else {}
+
+    works = {'group': [{'external-ids': {'external-id': [{'external-id-type': ext_id.findtext('{*}external-id-type'),
+                                                          'external-id-value': ext_id.findtext('{*}external-id-value'),
+                                                          'external-id-relationship': ext_id.findtext('{*}external-id-relationship', 'self')}
+                                                         for ext_id in group.iterfind('{*}external-ids/{*}external-id')]}}
+                       for group in record.iterfind('{*}activities-summary/{*}works/{*}group')]}
+
+    return compact_orcid_profile(record.findtext('{*}orcid-identifier/{*}path'), personal_details, works)
+
+
+async def _get_json(session: ClientSession, url: str, accept_header: str) -> Any:
+    async with session.get(url, headers={'Accept': accept_header}) as request:
+        if request.status != 200:
+            raise Exception(f'status {request.status} for {url}')
+
+        return await request.json(content_type=None, loads=json_backend.loads)
+
+
+async def request_orcid_works_summary(session: ClientSession, orcid: str, base_url: str = ORCID_API_URL, accept_header: str = ORCID_API_MIME,
+                                      conditional_headers: Optional[Dict[str, str]] = None) -> Optional[ResolvedRecord]:
+    """
+    Requests the personal details and the works summary of an ORCID record instead of the full profile.
+    Can be passed to fetch_records as record_request, the record's content is the compact profile, see compact_orcid_profile.
+
+    Conditional requests are not made since the record is combined from two responses.
+    When refreshing, the content hash of the compact profile tells whether it changed.
+
+    @param session: The aiohttp session to be used.
+    @param orcid: The ORCID without base URL.
+    @param base_url: Base URL of the ORCID public API.
+    @param accept_header: HTTP accept header of the requests.
+    @param conditional_headers: Ignored, see above.
+    """
+
+    try:
+        personal_details, works = await asyncio.gather(_get_json(session, f'{base_url}/{orcid}/personal-details', accept_header),
+                                                       _get_json(session, f'{base_url}/{orcid}/works', accept_header))
+
+        return ResolvedRecord(orcid, json_backend.dumps(compact_orcid_profile(orcid, personal_details, works)))
+
+    except Exception as e:
+        logging.error(f'{ORCID_WORKS} Error when resolving {orcid} {e}')
+        return None
+
+
+__all__ = ['request_orcid_works_summary', 'compact_orcid_profile', 'compact_orcid_record', 'compact_orcid_record_xml', 'ORCID_API_URL', 'ORCID_API_MIME']
@@ -12,13 +12,23 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 #
+# annotations are not evaluated, so lxml and aiohttp (pid_resolver) are only imported when records are parsed or fetched
+from __future__ import annotations
 import logging
 from pathlib import Path
-from lxml import etree  # type: ignore
-from typing import List, Optional, Dict, Any, NamedTuple, cast, Callable, Union, Tuple
-import json
-import jq # type: ignore
-from .cache_handler import get_keys, read_from_cache
+from typing import List, Optional, Dict, Any, NamedTuple, cast, Callable, Union, Tuple, Iterable, Iterator, TYPE_CHECKING
+import hashlib
+import unicodedata
+from functools import lru_cache
+from . import json_backend
+from .doi_reader import canonical_doi
+from .cache_handler import get_keys, read_from_cache, read_records_from_cache, write_records_to_cache, \
+    get_normalized_cache_dir
+from .memo import ORCID_PROFILE_MEMO
+
+if TYPE_CHECKING:
+    from lxml import etree  # type: ignore
+    from .pid_resolver import ResolvedRecord
 
 ANALYZER = 'ANALYZER:'
 
@@ -62,6 +72,112 @@ def _get_orcid_id_from_url(orcid_url: str) -> str:
     return orcid_url.replace('http://orcid.org/http', 'http').replace('http://',
                                                       'https://').strip()[len('https://orcid.org/'):]  # fix invalid ORCIDs, use https scheme for ORCID
 
+class NameKey(NamedTuple):
+    """
+    Represents the normalized parts of a name used for matching, computed once per name.
+    """
+
+    given_name: str # 0 normalized, see normalize_name
+    family_name: str # 1 normalized, see normalize_name
+    first_surname: str # 2 first token of the family name, without particles
+    first_given_name: str # 3 first token of the given name
+
+
+class OrcidProfileIndex(NamedTuple):
+    """
+    Represents the ORCID profiles associated with a DOI, indexed by the first token of the family name.
+    """
+
+    profiles: List[OrcidProfile] # 0
+    by_first_surname: Dict[str, List[Tuple[OrcidProfile, NameKey]]] # 1
+
+
+# characters separating name parts, e.g., in hyphenated given names like "Irina-Afrodita"
+_NAME_SEPARATORS = str.maketrans({'-': ' ', '\u2010': ' ', '\u2011': ' ', '\u2013': ' ', '_': ' '})
+
+# particles that may precede a surname, e.g., "Di Nucci", "van der Berg"
+NAME_PARTICLES = frozenset(['van', 'von', 'der', 'den', 'de', 'del', 'della', 'des', 'di', 'da', 'dos', 'das', 'du', 'la', 'le', 'ter', 'ten', 'zu', 'af', 'al', 'el', 'bin', 'ibn'])
+
+
+@lru_cache(maxsize=2**18)
+def normalize_name(name: str) -> str:
+    """
+    Normalizes a name for comparison: applies Unicode compatibility decomposition (NFKD), removes diacritics,
+    folds case, replaces hyphens by spaces and collapses whitespace, e.g., "Ortuño" and "ORTUNO" both become "ortuno".
+    Normalized forms are memoized per string. Values that are not strings are returned unchanged.
+
+    @param name: A given name or a family name.
+    """
+
+    if not isinstance(name, str):
+        return name
+
+    decomposed = unicodedata.normalize('NFKD', name)
+
+    without_diacritics = ''.join(filter(lambda char: not unicodedata.combining(char), decomposed))
+
+    return ' '.join(without_diacritics.casefold().translate(_NAME_SEPARATORS).split())
+
+
+def _first_surname(family_name: str) -> str:
+    """
+    Returns the first token of a normalized family name, skipping leading particles if followed by further tokens.
+    """
+
+    tokens = family_name.split(' ')
+
+    while len(tokens) > 1 and tokens[0] in NAME_PARTICLES:
+        tokens = tokens[1:]
+
+    return tokens[0]
+
+
+@lru_cache(maxsize=2**16)
+def make_name_key(given_name: str, family_name: str) -> Optional[NameKey]:
+    """
+    Computes the name key for a name, used by match_orcid_profiles and the batch matcher. Returns None if a name part is missing or has zero length.
+    Name keys are memoized per name.
+
+    @param given_name: The given name.
+    @param family_name: The family name.
+    """
+
+    if not isinstance(given_name, str) or not isinstance(family_name, str) or len(given_name) == 0 or len(family_name) == 0:
+        return None
+
+    given_name_norm = normalize_name(given_name)
+    family_name_norm = normalize_name(family_name)
+
+    return NameKey(given_name=given_name_norm, family_name=family_name_norm, first_surname=_first_surname(family_name_norm),
+                   first_given_name=given_name_norm.split(' ')[0])
+
+
+def _name_keys_match(author: NameKey, orcid: NameKey) -> bool:
+    """
+    Determines if two name keys match, see names_match.
+    """
+
+    if author.given_name == orcid.given_name and author.family_name == orcid.family_name:
+        return True
+
+    if author.first_surname != orcid.first_surname:
+        return False
+
+    if author.given_name == orcid.given_name:
+        return True
+
+    given_name_lc = author.given_name
+    orcid_given_name_lc = orcid.given_name
+
+    # check for abbreviated given name
+    # TODO: check if ORCID names could also be abbreviated
+    if (len(given_name_lc) > 1 and len(orcid_given_name_lc) > 1 and given_name_lc[0] == orcid_given_name_lc[0] and (given_name_lc[1] == '.' or given_name_lc[1] == ' ')
+            or (len(given_name_lc) == 1 and len(orcid_given_name_lc) > 0 and given_name_lc[0] == orcid_given_name_lc[0])):
+        return True
+
+    return author.first_given_name == orcid.first_given_name
+
+
 def names_match(given_name: str, family_name: str, orcid: OrcidProfile) -> bool:
     """
     Determines if two names match.
@@ -74,60 +190,62 @@ def names_match(given_name: str, family_name: str, orcid: OrcidProfile) -> bool:
 
     try:
 
-        if len(given_name) == 0 or len(family_name) == 0 or len(orcid.given_name) == 0 or len(orcid.family_name) == 0:
+        author_key = make_name_key(given_name, family_name)
+        orcid_key = make_name_key(orcid.given_name, orcid.family_name)
+
+        if author_key is None or orcid_key is None:
             logging.error(f'Name part has zero length: {given_name}, {family_name}, {orcid}')
             return False
 
-        given_name_lc = given_name.lower().strip()
-        family_name_lc = family_name.lower().strip()
+        return _name_keys_match(author_key, orcid_key)
 
-        orcid_given_name_lc = orcid.given_name.lower().strip()
-        orcid_family_name_lc = orcid.family_name.lower().strip()
+    except Exception as e:
+        logging.error(f'Error when handling {given_name} {family_name} and {orcid}, {e}')
+        return False
 
-        if given_name_lc == orcid_given_name_lc and family_name_lc == orcid_family_name_lc:
-            return True
 
-        # split family name
-        author_first_surname, *author_second_surname = family_name_lc.split(' ')
-        orcid_first_surname, *member_second_surname = orcid_family_name_lc.split(' ')
+def index_orcid_profiles(orcid_info: List[OrcidProfile]) -> OrcidProfileIndex:
+    """
+    Indexes ORCID profiles by the first token of their family name so authors are only compared to candidates with the same surname.
+    Profiles with missing name parts are not indexed since they cannot match.
 
-        if author_first_surname == orcid_first_surname:
-            if given_name_lc == orcid_given_name_lc:
-                return True
-            else:
+    @param orcid_info: ORCID profiles associated with a DOI/publication.
+    """
 
-                # check for abbreviated given name
-                # TODO: check if ORCID names could also be abbreviated
-                if (len(given_name_lc) > 1 and len(orcid_given_name_lc) > 1 and given_name_lc[0] == orcid_given_name_lc[0] and (given_name_lc[1] == '.' or given_name_lc[1] == ' ')
-                        or (len(given_name_lc) == 1 and given_name_lc[0] == orcid_given_name_lc[0])):
-                    return True
-                else:
-                    author_first_given_name, *author_second_given_name = given_name_lc.split(' ')
-                    orcid_first_given_name, *orcid_second_given_name = orcid_given_name_lc.split(' ')
+    by_first_surname: Dict[str, List[Tuple[OrcidProfile, NameKey]]] = {}
 
-                    return author_first_given_name == orcid_first_given_name
-        else:
-            return False
+    for profile in orcid_info:
+        key = make_name_key(profile.given_name, profile.family_name)
 
-    except Exception as e:
-        logging.error(f'Error when handling {given_name} {family_name} and {orcid}, {e}')
-        return False
+        if key is not None:
+            by_first_surname.setdefault(key.first_surname, []).append((profile, key))
 
-def _match_name_with_orcid_profile(orcid_info: List[OrcidProfile], given_name: str, family_name: str) -> Tuple[Optional[str], Optional[str]]:
+    return OrcidProfileIndex(profiles=orcid_info, by_first_surname=by_first_surname)
+
+
+def _match_name_with_orcid_index(orcid_index: OrcidProfileIndex, given_name: str, family_name: str) -> Tuple[Optional[str], Optional[str]]:
     """
-    Given a list of ORCID profiles for a DOI, filters them by name.
+    Given the indexed ORCID profiles of a DOI, filters them by name.
 
-    @param orcid_info: Information extracted from the ORCID profiles.
+    @param orcid_index: Indexed ORCID profiles, see index_orcid_profiles.
     @param given_name: The author's first name.
     @param family_name: The author's last name.
     """
 
-    if len(orcid_info) == 0:
+    if len(orcid_index.profiles) == 0:
         return None, None
 
+    author_key = make_name_key(given_name, family_name)
+
+    if author_key is None:
+        logging.error(f'Name part has zero length: {given_name}, {family_name}')
+        candidates = []
+    else:
+        candidates = orcid_index.by_first_surname.get(author_key.first_surname, [])
+
     # match ORCID profiles by name
-    author_orcid = list(
-        filter(lambda orcid: names_match(given_name, family_name, orcid), orcid_info))
+    author_orcid = list(map(lambda candidate: candidate[0],
+                            filter(lambda candidate: _name_keys_match(cast(NameKey, author_key), candidate[1]), candidates)))
 
     if len(author_orcid) == 1:
         # get ORCID ID from URL
@@ -135,19 +253,66 @@ def _match_name_with_orcid_profile(orcid_info: List[OrcidProfile], given_name: s
         origin_orcid = 'orcid'
         logger.debug(f'Could assign ORCID profile {author_orcid[0]} to {given_name} {family_name}')
     else:
-        logger.debug(f'Could not assign exactly one of {orcid_info} to {given_name} {family_name}')
+        logger.debug(f'Could not assign exactly one of {orcid_index.profiles} to {given_name} {family_name}')
         orcid = None
         origin_orcid = None
 
     return orcid, origin_orcid
 
 
-def analyze_author_info_datacite(author_info: Dict, orcid_info: List[OrcidProfile]) -> AuthorInfo:
+def _match_name_with_orcid_profile(orcid_info: List[OrcidProfile], given_name: str, family_name: str) -> Tuple[Optional[str], Optional[str]]:
     """
-    Transforms a JSON-LD item representing author information.
+    Given a list of ORCID profiles for a DOI, filters them by name.
+
+    @param orcid_info: Information extracted from the ORCID profiles.
+    @param given_name: The author's first name.
+    @param family_name: The author's last name.
+    """
+
+    return _match_name_with_orcid_index(index_orcid_profiles(orcid_info), given_name, family_name)
+
+
+def _assign_orcid(author: AuthorInfo, orcid_index: OrcidProfileIndex) -> AuthorInfo:
+    """
+    Assigns an ORCID from the ORCID profiles to an author whose ORCID is not contained in the DOI metadata.
+
+    @param author: Information about a publication's author.
+    @param orcid_index: Indexed ORCID profiles associated with the current DOI/publication.
+    """
+
+    if author.orcid is not None:
+        return author
+
+    orcid, origin_orcid = _match_name_with_orcid_index(orcid_index, author.given_name, author.family_name)
+
+    return author._replace(orcid=orcid, origin_orcid=origin_orcid)
+
+
+def match_orcid_profiles(publication: PublicationInfo, orcid_info: Dict[str, List[OrcidProfile]]) -> PublicationInfo:
+    """
+    Completes a normalized publication with ORCIDs obtained from matching the authors' names against ORCID profiles.
+
+    @param publication: Normalized publication, only containing ORCIDs from the DOI metadata.
+    @param orcid_info: ORCID profiles organized by canonical DOI, see group_orcids_per_doi.
+    """
+
+    orcid_author_info = orcid_info.get(canonical_doi(publication.doi), [])
+
+    # the profiles are indexed once per publication, not per author
+    orcid_index = index_orcid_profiles(orcid_author_info)
+
+    return publication._replace(authors=list(map(lambda author: _assign_orcid(author, orcid_index), publication.authors)))
+
+
+# completes a normalized publication with ORCIDs from the ORCID profiles organized by DOI, e.g., match_orcid_profiles
+PublicationMatcher = Callable[[PublicationInfo, Dict[str, List[OrcidProfile]]], PublicationInfo]
+
+
+def _normalize_author_info_datacite(author_info: Dict) -> AuthorInfo:
+    """
+    Transforms a JSON-LD item representing author information without matching ORCID profiles.
 
     @param author_info: Information about a publication's author.
-    @param orcid_info: ORCID profiles associated with the current DOI/publication.
     """
 
     given_name = author_info['givenName']
@@ -161,7 +326,8 @@ def analyze_author_info_datacite(author_info: Dict, orcid_info: List[OrcidProfil
         orcid = _get_orcid_id_from_url(author_info['@id'])
         origin_orcid = 'doi'
     else:
-        orcid, origin_orcid = _match_name_with_orcid_profile(orcid_info, given_name, family_name)
+        orcid = None
+        origin_orcid = None
 
     if 'affiliation' in author_info:
         # check for single or multiple affiliations
@@ -178,6 +344,89 @@ def analyze_author_info_datacite(author_info: Dict, orcid_info: List[OrcidProfil
     return AuthorInfo(given_name=given_name, family_name=family_name, orcid=orcid, origin_orcid=origin_orcid, ror=ror)
 
 
+def analyze_author_info_datacite(author_info: Dict, orcid_info: List[OrcidProfile]) -> AuthorInfo:
+    """
+    Transforms a JSON-LD item representing author information.
+
+    @param author_info: Information about a publication's author.
+    @param orcid_info: ORCID profiles associated with the current DOI/publication.
+    """
+
+    return _assign_orcid(_normalize_author_info_datacite(author_info), index_orcid_profiles(orcid_info))
+
+
+def normalize_doi_record_datacite(doi: str, rec_str: str) -> PublicationInfo:
+    """
+    Transforms a DOI record (JSON-LD/schema.org) to a publication without matching ORCID profiles.
+    Raises an exception if the record cannot be parsed.
+
+    @param doi: The DOI of the record.
+    @param rec_str: The record as returned by content negotiation, or by the DataCite REST API, see fetch_records_bulk.
+    """
+
+    record = json_backend.loads(rec_str)
+
+    # records fetched in bulk are stored as returned by the DataCite REST API
+    if 'attributes' in record:
+        return _normalize_doi_record_datacite_rest(doi, record)
+
+    title: Optional[str] = record['name']
+    author_info: Union[List[Dict], Dict] = record['author']
+
+    if isinstance(author_info, List):
+        authors_list: List[AuthorInfo] = list(map(_normalize_author_info_datacite, author_info))
+        return PublicationInfo(doi=doi, title=title, authors=authors_list)
+    else:
+        author_single: List[AuthorInfo] = [_normalize_author_info_datacite(author_info)]
+        return PublicationInfo(doi=doi, title=title, authors=author_single)
+
+
+def _normalize_author_info_datacite_rest(creator: Dict) -> AuthorInfo:
+    """
+    Transforms a creator of the DataCite REST API to author information without matching ORCID profiles, like _normalize_author_info_datacite.
+
+    @param creator: Information about a publication's creator.
+    """
+
+    # like in the JSON-LD representation, creators without given or family name (organizations) cannot be normalized
+    given_name = creator['givenName']
+    family_name = creator['familyName']
+
+    orcids = list(filter(lambda identifier: 'http://orcid.org/' in identifier or 'https://orcid.org/' in identifier,
+                         map(lambda name_id: name_id.get('nameIdentifier') or '', creator.get('nameIdentifiers', []))))
+
+    # the JSON-LD representation contains a single affiliation as object, several as array
+    affiliations: List[Dict] = creator.get('affiliation', [])
+    rors = list(map(lambda aff: aff['affiliationIdentifier'], filter(lambda aff: isinstance(aff, dict) and 'affiliationIdentifier' in aff, affiliations)))
+
+    return AuthorInfo(given_name=given_name, family_name=family_name, orcid=_get_orcid_id_from_url(orcids[0]) if len(orcids) > 0 else None,
+                      origin_orcid='doi' if len(orcids) > 0 else None, ror=rors if len(affiliations) > 1 or len(rors) > 0 else None)
+
+
+def _normalize_doi_record_datacite_rest(doi: str, record: Dict) -> PublicationInfo:
+    attributes = record['attributes']
+
+    # the main title has no title type
+    titles: List[Dict] = attributes.get('titles', [])
+    main_titles = list(filter(lambda title: title.get('titleType') is None, titles)) or titles
+
+    return PublicationInfo(doi=doi, title=main_titles[0]['title'] if len(main_titles) > 0 else None,
+                           authors=list(map(_normalize_author_info_datacite_rest, attributes.get('creators', []))))
+
+
+def normalize_doi_record_datacite_rest(doi: str, rec_str: str) -> PublicationInfo:
+    """
+    Transforms an item of the DataCite REST API (/dois) to a publication without matching ORCID profiles,
+    equal to the publication normalize_doi_record_datacite returns for the JSON-LD representation.
+    Raises an exception if the record cannot be parsed.
+
+    @param doi: The DOI of the record.
+    @param rec_str: An item of the response's data array.
+    """
+
+    return _normalize_doi_record_datacite_rest(doi, json_backend.loads(rec_str))
+
+
 def analyze_doi_record_datacite(cache_dir: Path, doi: str, orcid_info: Dict[str, List[OrcidProfile]]) -> Optional[PublicationInfo]:
     """
     Reads a DOI record (JSON-LD/schema.org) and transforms it to an item containing author information about a publication.
@@ -188,44 +437,25 @@ def analyze_doi_record_datacite(cache_dir: Path, doi: str, orcid_info: Dict[str,
     """
 
     try:
-        record = json.loads(read_from_cache(doi, cache_dir))
-
-        title: Optional[str] = record['name']
-        author_info: Union[List[Dict], Dict] = record['author']
-
-        if doi in orcid_info:
-            orcid_author_info = orcid_info[doi]
-        else:
-            orcid_author_info = []
-
-        if isinstance(author_info, List):
-            authors_list: List[AuthorInfo] = list(map(lambda author: analyze_author_info_datacite(author, orcid_author_info), author_info))
-            return PublicationInfo(doi=doi, title=title, authors=authors_list)
-        else:
-            author_single: List[AuthorInfo] = [analyze_author_info_datacite(author_info, orcid_author_info)]
-            return PublicationInfo(doi=doi, title=title, authors=author_single)
+        return match_orcid_profiles(normalize_doi_record_datacite(doi, read_from_cache(doi, cache_dir)), orcid_info)
 
     except Exception as e:
         logging.error(f'{ANALYZER} An error occurred in {doi}: {e}')
         return None
 
 
-def analyze_author_info_crossref(creator: etree.Element, namespace_map: Any, orcid_info: List[OrcidProfile]) -> Optional[AuthorInfo]:
+def _normalize_author_info_crossref(creator: etree.Element, namespace_map: Any) -> Optional[AuthorInfo]:
     """
-    Transforms an RDF/XML item representing creator information to author information.
+    Transforms an RDF/XML item representing creator information to author information without matching ORCID profiles.
 
     @param creator: DOI information about a creator.
     @param namespace_map: XML namespace information for the XML element.
-    @param orcid_info: ORCID profiles associated with the current DOI/publication.
     """
 
     given_name_ele: Optional[etree.Element] = creator.find('.//j.3:givenName', namespaces=namespace_map)
     family_name_ele: Optional[etree.Element] = creator.find('.//j.3:familyName', namespaces=namespace_map)
     orcid_ele: Optional[etree.Element] = creator.find('.//owl:sameAs', namespaces=namespace_map)
 
-    orcid: Optional[str]
-    origin_orcid: Optional[str]
-
     if given_name_ele is not None and family_name_ele is not None:
         given_name = given_name_ele.text
         family_name = family_name_ele.text
@@ -233,101 +463,175 @@ def analyze_author_info_crossref(creator: etree.Element, namespace_map: Any, orc
             orcid = _get_orcid_id_from_url(orcid_ele.attrib.get('{http://www.w3.org/1999/02/22-rdf-syntax-ns#}resource'))
             return AuthorInfo(given_name=given_name, family_name=family_name, orcid=orcid, origin_orcid='doi', ror=None)
         else:
-            orcid, origin_orcid = _match_name_with_orcid_profile(orcid_info, given_name, family_name)
-
-            return AuthorInfo(given_name=given_name, family_name=family_name, orcid=orcid, origin_orcid=origin_orcid, ror=None)
+            return AuthorInfo(given_name=given_name, family_name=family_name, orcid=None, origin_orcid=None, ror=None)
 
     # return None if insufficient information is provided.
     return None
 
 
-def analyze_doi_record_crossref(cache_dir: Path, doi: str, orcid_info: Dict[str, List[OrcidProfile]]) -> Optional[PublicationInfo]:
+def analyze_author_info_crossref(creator: etree.Element, namespace_map: Any, orcid_info: List[OrcidProfile]) -> Optional[AuthorInfo]:
     """
-    Reads a DOI record (RDF/XML) and transforms it to an item containing author information about a publication.
+    Transforms an RDF/XML item representing creator information to author information.
 
-    @type cache_dir: Directory resolved DOIs have been written to.
-    @param doi: Path to read record from.
-    @param orcid_info: ORCID profiles organized by DOI.
+    @param creator: DOI information about a creator.
+    @param namespace_map: XML namespace information for the XML element.
+    @param orcid_info: ORCID profiles associated with the current DOI/publication.
     """
 
-    try:
-        rec_str = read_from_cache(doi, cache_dir)
+    author = _normalize_author_info_crossref(creator, namespace_map)
 
-        root = etree.fromstring(rec_str)
+    if author is not None:
+        return _assign_orcid(author, index_orcid_profiles(orcid_info))
 
-        title_ele: Optional[etree.Element] = root.find('.//rdf:Description/j.0:title', namespaces=root.nsmap)
-        creators: List[etree.Element] = root.findall('.//j.0:creator/j.3:Person', namespaces=root.nsmap)
+    return None
 
-        if title_ele is not None:
-            title = title_ele.text
-        else:
-            title = None
 
-        if doi in orcid_info:
-            orcid_author_info: List[OrcidProfile] = orcid_info[doi]
-        else:
-            orcid_author_info = []
+def normalize_doi_record_crossref(doi: str, rec_str: str) -> PublicationInfo:
+    """
+    Transforms a DOI record (RDF/XML) to a publication without matching ORCID profiles.
+    Raises an exception if the record cannot be parsed.
+
+    @param doi: The DOI of the record.
+    @param rec_str: The record as returned by content negotiation, or by the Crossref REST API, see fetch_records_bulk.
+    """
+
+    # records fetched in bulk are stored as returned by the Crossref REST API
+    if rec_str.lstrip().startswith('{'):
+        return normalize_doi_record_crossref_rest(doi, rec_str)
+
+    from lxml import etree  # type: ignore
+
+    root = etree.fromstring(rec_str)
+
+    title_ele: Optional[etree.Element] = root.find('.//rdf:Description/j.0:title', namespaces=root.nsmap)
+    creators: List[etree.Element] = root.findall('.//j.0:creator/j.3:Person', namespaces=root.nsmap)
+
+    if title_ele is not None:
+        title = title_ele.text
+    else:
+        title = None
+
+    authors: List[Optional[AuthorInfo]] = list(
+        map(lambda creator: _normalize_author_info_crossref(creator, root.nsmap), creators))
+
+    # filter out None values
+    authors_filtered = list(filter(lambda auth: auth is not None, authors))
+
+    # https://stackoverflow.com/questions/67274469/mypy-types-and-optional-filtering
+    return PublicationInfo(doi=doi, title=title, authors=cast(List[AuthorInfo], authors_filtered))
+
+
+def _normalize_author_info_crossref_rest(author: Dict) -> Optional[AuthorInfo]:
+    """
+    Transforms an author of the Crossref REST API to author information without matching ORCID profiles, like _normalize_author_info_crossref.
+
+    @param author: Information about a publication's author.
+    """
+
+    if author.get('given') is None or author.get('family') is None:
+        # return None if insufficient information is provided.
+        return None
+
+    orcid = author.get('ORCID')
+
+    # affiliations are not contained in the RDF/XML representation
+    return AuthorInfo(given_name=author['given'], family_name=author['family'], orcid=_get_orcid_id_from_url(orcid) if orcid is not None else None,
+                      origin_orcid='doi' if orcid is not None else None, ror=None)
+
+
+def normalize_doi_record_crossref_rest(doi: str, rec_str: str) -> PublicationInfo:
+    """
+    Transforms an item of the Crossref REST API (/works) to a publication without matching ORCID profiles,
+    equal to the publication normalize_doi_record_crossref returns for the RDF/XML representation.
+    Raises an exception if the record cannot be parsed.
+
+    @param doi: The DOI of the record.
+    @param rec_str: An item of the response message's items.
+    """
+
+    record = json_backend.loads(rec_str)
+
+    titles: List[str] = record.get('title', [])
+
+    authors = list(filter(lambda auth: auth is not None, map(_normalize_author_info_crossref_rest, record.get('author', []))))
+
+    return PublicationInfo(doi=doi, title=titles[0] if len(titles) > 0 else None, authors=cast(List[AuthorInfo], authors))
+
 
-        authors: List[Optional[AuthorInfo]] = list(
-            map(lambda creator: analyze_author_info_crossref(creator, root.nsmap, orcid_author_info), creators))
+def analyze_doi_record_crossref(cache_dir: Path, doi: str, orcid_info: Dict[str, List[OrcidProfile]]) -> Optional[PublicationInfo]:
+    """
+    Reads a DOI record (RDF/XML) and transforms it to an item containing author information about a publication.
 
-        # filter out None values
-        authors_filtered = list(filter(lambda auth: auth is not None, authors))
+    @type cache_dir: Directory resolved DOIs have been written to.
+    @param doi: Path to read record from.
+    @param orcid_info: ORCID profiles organized by DOI.
+    """
 
-        # https://stackoverflow.com/questions/67274469/mypy-types-and-optional-filtering
-        return PublicationInfo(doi=doi, title=title, authors=cast(List[AuthorInfo], authors_filtered))
+    try:
+        return match_orcid_profiles(normalize_doi_record_crossref(doi, read_from_cache(doi, cache_dir)), orcid_info)
     except Exception as e:
         logging.error(f'{ANALYZER} An error occurred in {doi}: {e}')
         return None
 
 
-def analyze_author_info_medra(creator: etree.Element, namespace_map: Any, orcid_info: List[OrcidProfile]) -> Optional[AuthorInfo]:
+def _normalize_author_info_medra(creator: etree.Element, namespace_map: Any) -> Optional[AuthorInfo]:
     given_name_ele: Optional[etree.Element] = creator.find('.//foaf:givenName', namespaces=namespace_map)
     family_name_ele: Optional[etree.Element] = creator.find('.//foaf:familyName', namespaces=namespace_map)
 
-    orcid: Optional[str]
-    origin_orcid: Optional[str]
-
     if given_name_ele is not None and family_name_ele is not None:
         given_name = given_name_ele.text.strip()
         family_name = family_name_ele.text.strip()
 
-        orcid, origin_orcid = _match_name_with_orcid_profile(orcid_info, given_name, family_name)
-
-        return AuthorInfo(given_name=given_name, family_name=family_name, orcid=orcid, origin_orcid=origin_orcid, ror=None)
+        return AuthorInfo(given_name=given_name, family_name=family_name, orcid=None, origin_orcid=None, ror=None)
 
     # return None if insufficient information is provided.
     return None
 
 
-def analyze_doi_record_medra(cache_dir: Path, doi: str, orcid_info: Dict[str, List[OrcidProfile]]) -> Optional[PublicationInfo]:
-    try:
-        rec_str = read_from_cache(doi, cache_dir)
+def analyze_author_info_medra(creator: etree.Element, namespace_map: Any, orcid_info: List[OrcidProfile]) -> Optional[AuthorInfo]:
+    author = _normalize_author_info_medra(creator, namespace_map)
 
-        root = etree.fromstring(rec_str)
+    if author is not None:
+        return _assign_orcid(author, index_orcid_profiles(orcid_info))
 
-        title_ele: Optional[etree.Element] = root.find('.//bibo:Article/dc:title', namespaces=root.nsmap)
+    return None
 
-        if title_ele is not None:
-            title = title_ele.text.strip()
-        else:
-            title = None
 
-        if doi in orcid_info:
-            orcid_author_info: List[OrcidProfile] = orcid_info[doi]
-        else:
-            orcid_author_info = []
+def normalize_doi_record_medra(doi: str, rec_str: str) -> PublicationInfo:
+    """
+    Transforms a DOI record (RDF/XML) to a publication without matching ORCID profiles.
+    Raises an exception if the record cannot be parsed.
 
-        creators: List[etree.Element] = root.findall('.//dc:creator/foaf:Person', namespaces=root.nsmap)
+    @param doi: The DOI of the record.
+    @param rec_str: The record as returned by content negotiation.
+    """
+
+    from lxml import etree  # type: ignore
+
+    root = etree.fromstring(rec_str)
+
+    title_ele: Optional[etree.Element] = root.find('.//bibo:Article/dc:title', namespaces=root.nsmap)
+
+    if title_ele is not None:
+        title = title_ele.text.strip()
+    else:
+        title = None
+
+    creators: List[etree.Element] = root.findall('.//dc:creator/foaf:Person', namespaces=root.nsmap)
+
+    authors: List[Optional[AuthorInfo]] = list(
+        map(lambda creator: _normalize_author_info_medra(creator, root.nsmap), creators))
+
+    # filter out None values
+    authors_filtered = list(filter(lambda auth: auth is not None, authors))
 
-        authors: List[Optional[AuthorInfo]] = list(
-            map(lambda creator: analyze_author_info_medra(creator, root.nsmap, orcid_author_info), creators))
+    # https://stackoverflow.com/questions/67274469/mypy-types-and-optional-filtering
+    return PublicationInfo(doi=doi, title=title, authors=cast(List[AuthorInfo], authors_filtered))
 
-        # filter out None values
-        authors_filtered = list(filter(lambda auth: auth is not None, authors))
 
-        # https://stackoverflow.com/questions/67274469/mypy-types-and-optional-filtering
-        return PublicationInfo(doi=doi, title=title, authors=cast(List[AuthorInfo], authors_filtered))
+def analyze_doi_record_medra(cache_dir: Path, doi: str, orcid_info: Dict[str, List[OrcidProfile]]) -> Optional[PublicationInfo]:
+    try:
+        return match_orcid_profiles(normalize_doi_record_medra(doi, read_from_cache(doi, cache_dir)), orcid_info)
 
     except Exception as e:
         logging.error(f'{ANALYZER} An error occurred in {doi}: {e}')
@@ -335,14 +639,76 @@ def analyze_doi_record_medra(cache_dir: Path, doi: str, orcid_info: Dict[str, Li
     return None
 
 
+# Transforms a raw record (id, content) to its normalized representation, see write_normalized_records.
+RecordNormalizer = Callable[[str, str], Any]
+
+
+def write_normalized_records(records: List[ResolvedRecord], cache_dir: Path, normalizer: RecordNormalizer) -> None:
+    """
+    Normalizes freshly fetched records and writes them to the side store of the cache directory,
+    so they do not have to be parsed again for analysis. Can be passed to `fetch_records` as `post_fetch` hook.
+
+    Records that cannot be normalized are stored as null so they are not parsed again either.
+
+    @param records: Resolved records (raw payloads).
+    @param cache_dir: The cache directory the raw records have been written to.
+    @param normalizer: Function transforming a raw record to a JSON serializable structure.
+    """
+
+    normalized = list(map(lambda rec: (rec.rec_id, json_backend.dumps(_normalize_record(normalizer, rec.rec_id, rec.content))), records))
+
+    write_records_to_cache(normalized, 0, 1, get_normalized_cache_dir(cache_dir))
 
-def analyze_dois(cache_dir: Path, analyzer: Callable[[Path, str, Dict], Optional[PublicationInfo]]) -> Dict[
+
+def _normalize_record(normalizer: RecordNormalizer, rec_id: str, rec_str: str) -> Any:
+    try:
+        return normalizer(rec_id, rec_str)
+    except Exception as e:
+        logging.error(f'{ANALYZER} An error occurred when normalizing {rec_id}: {e}')
+        return None
+
+
+def read_normalized_records(cache_dir: Path, record_ids: List[str], normalizer: RecordNormalizer) -> Dict[str, Any]:
+    """
+    Reads normalized records from the side store of the cache directory.
+    Records missing from the side store (cached before it existed) are normalized from the raw records and added to it.
+
+    @param cache_dir: The cache directory containing the raw records.
+    @param record_ids: The ids of the records to read.
+    @param normalizer: Function transforming a raw record to a JSON serializable structure.
+    @return: Normalized records (decoded from JSON) indexed by id, None for records that could not be normalized.
+    """
+
+    normalized_cache_dir = get_normalized_cache_dir(cache_dir)
+
+    cached: Dict[str, str] = read_records_from_cache(record_ids, normalized_cache_dir)
+
+    missing = list(filter(lambda rec_id: rec_id not in cached, record_ids))
+
+    if len(missing) > 0:
+        logging.info(f'{ANALYZER} normalizing records missing from {normalized_cache_dir}: {len(missing)}')
+
+        raw_records = map(lambda rec_id: (rec_id, read_from_cache(rec_id, cache_dir)), missing)
+
+        # records not contained in the raw cache are not normalized
+        backfill = list(map(lambda rec: (rec[0], json_backend.dumps(_normalize_record(normalizer, rec[0], rec[1]))),
+                            filter(lambda rec: rec[1] is not None, raw_records)))
+
+        write_records_to_cache(backfill, 0, 1, normalized_cache_dir)
+
+        cached = {**cached, **dict(backfill)}
+
+    return dict(map(lambda rec_id: (rec_id, json_backend.loads(cached[rec_id]) if rec_id in cached else None), record_ids))
+
+
+def analyze_dois(cache_dir: Path, analyzer: Callable[[Path, str, Dict], Optional[PublicationInfo]], orcid_cache_dir: Path = Path('orcid')) -> Dict[
     str, PublicationInfo]:
     """
     Reads resolved DOIs from the cache and returns a dict indexed by DOI (without base URL).
 
     @param cache_dir: Directory resolved DOIs have been written to.
     @param analyzer: Function that parses the metadata resolved for a DOI and transforms it to a PublicationInfo.
+    @param orcid_cache_dir: Directory resolved ORCIDs have been written to.
     """
 
     '''
@@ -375,8 +741,7 @@ def analyze_dois(cache_dir: Path, analyzer: Callable[[Path, str, Dict], Optional
     #print('dois to analyze ', len(dois_to_analyze), dois_to_analyze)
 
     # check if additional ORCIDs could be added from cached ORCID profiles
-    dois_per_orcid: List[Dict] = get_dois_per_orcid(Path('orcid'))
-    orcids_grouped_by_doi: Dict[str, List[OrcidProfile]] = group_orcids_per_doi(dois_per_orcid)
+    orcids_grouped_by_doi: Dict[str, List[OrcidProfile]] = group_orcids_per_doi(iter_dois_per_orcid(orcid_cache_dir))
 
     # print(grouped)
 
@@ -396,13 +761,56 @@ def analyze_dois(cache_dir: Path, analyzer: Callable[[Path, str, Dict], Optional
     # write dois to new cache file
     '''
     with open(records_cache_file, 'w') as f:
-        f.write(json.dumps(combined_records))
+        f.write(json_backend.dumps(combined_records))
     '''
 
     #return combined_records
     return records_as_dict
 
 
+def analyze_normalized_dois(cache_dir: Path, normalizer: Callable[[str, str], PublicationInfo], orcid_cache_dir: Path = Path('orcid'),
+                            dois_to_analyze: Optional[List[str]] = None,
+                            orcids_grouped_by_doi: Optional[Dict[str, List[OrcidProfile]]] = None,
+                            matcher: PublicationMatcher = match_orcid_profiles) -> Dict[str, PublicationInfo]:
+    """
+    Like `analyze_dois`, but reads normalized records from the side store instead of parsing each raw record again.
+    Only the ORCID profile matching is performed on every analysis.
+
+    @param cache_dir: Directory resolved DOIs have been written to.
+    @param normalizer: Function that parses the metadata resolved for a DOI, e.g., `normalize_doi_record_crossref`.
+    @param orcid_cache_dir: Directory resolved ORCIDs have been written to.
+    @param dois_to_analyze: DOIs to be analyzed, all cached DOIs if not given. DOIs not contained in the cache are ignored.
+    @param orcids_grouped_by_doi: ORCID profiles organized by DOI, read from the ORCID cache if not given.
+    @param matcher: Matches the authors against the ORCID profiles, e.g., match_orcid_profiles_batch (pid_resolver_lib.batch_matcher).
+    """
+
+    if dois_to_analyze is None:
+        dois_to_analyze = list(get_keys(cache_dir))
+
+    if orcids_grouped_by_doi is None:
+        # check if additional ORCIDs could be added from cached ORCID profiles
+        orcids_grouped_by_doi = group_orcids_per_doi(iter_dois_per_orcid(orcid_cache_dir))
+
+    normalized: Dict[str, Any] = read_normalized_records(cache_dir, dois_to_analyze, normalizer)
+
+    # filter out None values (records that could not be normalized)
+    publications = map(_publication_info_from_json, filter(lambda rec: rec is not None, normalized.values()))
+
+    # return dict indexed by DOI
+    return dict(map(lambda pub: (pub.doi, matcher(pub, cast(Dict[str, List[OrcidProfile]], orcids_grouped_by_doi))), publications))
+
+
+def _publication_info_from_json(pub: List) -> PublicationInfo:
+    """
+    Recreates a PublicationInfo from its JSON representation (nested arrays).
+
+    @param pub: JSON representation of a PublicationInfo.
+    """
+
+    return PublicationInfo(doi=pub[0], title=pub[1], authors=list(
+        map(lambda auth: AuthorInfo(given_name=auth[0], family_name=auth[1], orcid=auth[2], origin_orcid=auth[3], ror=auth[4]), pub[2])))
+
+
 def parse_resolved_dois_from_json(resolved_dois_json: Path) -> Dict[str, PublicationInfo]:
     """
     Transform a JSON representation to a Dict of PublicationInfo.
@@ -411,7 +819,7 @@ def parse_resolved_dois_from_json(resolved_dois_json: Path) -> Dict[str, Publica
     """
 
     with open(resolved_dois_json) as f:
-        resolved_dois = json.load(f)
+        resolved_dois = json_backend.load(f)
 
     doi_items = resolved_dois.items()
 
@@ -445,9 +853,7 @@ def parse_resolved_dois_from_json(resolved_dois_json: Path) -> Dict[str, Publica
     ]
   ] 
     '''
-    mapped_items = map(lambda doi: [doi[0], PublicationInfo(doi=doi[0], title=doi[1][1], authors=list(
-        map(lambda auth: AuthorInfo(given_name=auth[0], family_name=auth[1], orcid=auth[2], origin_orcid=auth[3], ror=auth[4]), doi[1][2])))],
-                       doi_items)
+    mapped_items = map(lambda doi: [doi[0], _publication_info_from_json(doi[1])], doi_items)
 
     # recreate Dict[str, PublicationInfo] from JSON
     return dict(mapped_items)
@@ -472,33 +878,108 @@ def get_orcids_from_resolved_dois(dois: Dict[str, PublicationInfo]) -> List[str]
 
 def _parse_orcid_json(orcid_json: str, orcid: str)-> Optional[Dict]:
     try:
-        return json.loads(orcid_json)
+        return json_backend.loads(orcid_json)
     except Exception as e:
         logging.error(f'{ANALYZER} An error occurred when parsing ORCID JSON for {orcid}: {e}')
         return None
 
 
-def get_dois_per_orcid(cache_dir: Path) -> List[Dict]:
+# number of ORCID profiles read from the side store at once, see iter_dois_per_orcid
+ORCID_PROFILE_CHUNK_SIZE = 1000
+
+
+def _flatten(value: Any) -> Iterator[Any]:
+    # like jq's flatten: nested arrays are flattened, other values (including null) are kept
+    if isinstance(value, list):
+        for element in value:
+            yield from _flatten(element)
+    else:
+        yield value
+
+
+def _extract_orcid_profile(orcid_profile: Dict) -> Dict:
+    """
+    Extracts {id, givenName, familyName, dois} from a single ORCID profile (JSON-LD).
+    The works of a profile and their identifiers may be single objects or arrays.
+    """
+
+    reverse = orcid_profile.get('@reverse')
+    creator = reverse.get('creator') if isinstance(reverse, dict) else None
+
+    works = filter(lambda work: isinstance(work, dict) and work.get('@type') == 'CreativeWork', _flatten(creator))
+
+    identifiers = (identifier for work in works for identifier in _flatten(work.get('identifier')))
+
+    dois = [identifier.get('value') for identifier in identifiers if isinstance(identifier, dict) and identifier.get('propertyID') == 'doi']
+
+    return {'id': orcid_profile.get('@id'), 'givenName': orcid_profile.get('givenName'), 'familyName': orcid_profile.get('familyName'), 'dois': dois}
+
+
+def _profile_size(profile: Dict) -> int:
+    # approximated by the length of the strings an extracted profile retains
+    values = [profile.get('id'), profile.get('givenName'), profile.get('familyName'), *(profile.get('dois') or [])]
+
+    return sum(map(lambda value: len(value) if isinstance(value, str) else 0, values))
+
+
+def normalize_orcid_profile(orcid: str, orcid_json: str) -> Optional[Dict]:
+    """
+    Extracts id, names and DOIs from an ORCID profile (JSON-LD).
+    The same profile is normalized by several analyses per run, so extracted profiles are memoized by ORCID and a digest of the JSON.
+
+    @param orcid: The ORCID of the profile.
+    @param orcid_json: The profile as returned by content negotiation, or a compact profile, see request_orcid_works_summary.
+    @return: A dict with the structure {id, givenName, familyName, dois} or None if the profile cannot be parsed.
     """
-    Collects cached ORCID profiles and organizes them as a list of objects with id and DOIs.
+
+    # the key does not retain the JSON, a changed profile has a different digest
+    key = (orcid, hashlib.blake2b(orcid_json.encode('utf-8'), digest_size=16).digest())
+
+    return ORCID_PROFILE_MEMO.get_or_compute(key, lambda: _extract_orcid_profile_json(orcid, orcid_json), _profile_size)
+
+
+def _extract_orcid_profile_json(orcid: str, orcid_json: str) -> Optional[Dict]:
+    orcid_profile = _parse_orcid_json(orcid_json, orcid)
+
+    if orcid_profile is None:
+        return None
+
+    # compact profiles have the extracted structure already
+    if '@context' not in orcid_profile and 'dois' in orcid_profile:
+        return orcid_profile
+
+    return _extract_orcid_profile(orcid_profile)
+
+
+def iter_dois_per_orcid(cache_dir: Path, chunk_size: int = ORCID_PROFILE_CHUNK_SIZE) -> Iterator[Dict]:
+    """
+    Yields the cached ORCID profiles one by one as objects with id and DOIs, reading them in chunks,
+    so only a chunk of profiles is held in memory at once.
+    The extracted information is read from the side store, profiles are only parsed if missing from it.
 
     @param cache_dir: The ORCID cache directory.
+    @param chunk_size: Number of profiles read at once.
+    @return: Profiles with the structure {id, givenName, familyName, dois}, profiles that cannot be parsed are omitted.
     """
 
     orcids = list(get_keys(cache_dir))
 
-    orcid_profiles_maybe: List[Optional[Dict]] = list(map(lambda orcid: _parse_orcid_json(read_from_cache(orcid, cache_dir), orcid), orcids))
+    for offset in range(0, len(orcids), chunk_size):
+        orcid_profiles_maybe: Dict[str, Optional[Dict]] = read_normalized_records(cache_dir, orcids[offset:offset + chunk_size],
+                                                                                  normalize_orcid_profile)
 
-    orcid_profiles = list(filter(lambda orcid_profile: orcid_profile is not None, orcid_profiles_maybe))
+        yield from cast(Iterator[Dict], filter(lambda orcid_profile: orcid_profile is not None, orcid_profiles_maybe.values()))
 
-    # structure [{id, givenName, familyName, dois}]
-    dois_per_orcid: List[Dict] = jq.compile(
-        '. | map({"id": ."@id", "givenName": .givenName, "familyName": .familyName, "dois": [[."@reverse".creator] | flatten[] | select(."@type" == "CreativeWork")] | [[map(.identifier)] | flatten[] | [select(.propertyID == "doi")] | map(.value)] | flatten})').input_value(
-        orcid_profiles).first()
 
-    #logging.info(f'{ANALYZER} {dois_per_orcid}')
+def get_dois_per_orcid(cache_dir: Path) -> List[Dict]:
+    """
+    Collects cached ORCID profiles and organizes them as a list of objects with id and DOIs, see iter_dois_per_orcid.
 
-    return dois_per_orcid
+    @param cache_dir: The ORCID cache directory.
+    """
+
+    # structure [{id, givenName, familyName, dois}]
+    return list(iter_dois_per_orcid(cache_dir))
 
 
 def _make_entry(ele: Dict) -> OrcidProfile:
@@ -506,24 +987,35 @@ def _make_entry(ele: Dict) -> OrcidProfile:
     return OrcidProfile(ele['id'], ele['givenName'], ele['familyName'])
 
 
-def group_orcids_per_doi(dois_per_orcid: List[Dict]) -> Dict[str, List[OrcidProfile]]:
+def group_orcids_per_doi(dois_per_orcid: Iterable[Dict]) -> Dict[str, List[OrcidProfile]]:
     """
     Groups ORCID profile contents by DOI (key) and associates the ORCIDs with them (values).
+    DOIs are grouped in canonical form (see canonical_doi), so spellings of a DOI listed in several profiles share their ORCIDs.
 
-    @param dois_per_orcid: A list of ORCIDs with their associated DOIs.
+    @param dois_per_orcid: ORCIDs with their associated DOIs, e.g., streamed by iter_dois_per_orcid.
     """
 
-    orcids_by_doi = {}
+    orcids_by_doi: Dict[str, List[OrcidProfile]] = {}
 
     for ele in dois_per_orcid:
-        for doi in ele['dois']:
-            if doi not in orcids_by_doi:
-                orcids_by_doi[doi] = [_make_entry(ele)]
-            else:
-                orcids_by_doi[doi].append(_make_entry(ele))
+        entry = _make_entry(ele)
+
+        # a profile may list a DOI in several spellings
+        for doi in dict.fromkeys(map(canonical_doi, filter(None, ele['dois']))):
+            orcids_by_doi.setdefault(doi, []).append(entry)
 
     return orcids_by_doi
 
 
+# normalizers of the DOI records by registration agency
+RECORD_NORMALIZERS: Dict[str, Callable[[str, str], PublicationInfo]] = {
+    'Crossref': normalize_doi_record_crossref,
+    'DataCite': normalize_doi_record_datacite,
+    'mEDRA': normalize_doi_record_medra
+}
+
+
 __all__ = ['PublicationInfo', 'AuthorInfo', 'analyze_dois', 'analyze_doi_record_crossref', 'analyze_doi_record_datacite', 'analyze_doi_record_medra', 'get_orcids_from_resolved_dois',
-           'get_dois_per_orcid', 'group_orcids_per_doi', 'names_match', 'parse_resolved_dois_from_json']
\ No newline at end of file
+           'get_dois_per_orcid', 'iter_dois_per_orcid', 'group_orcids_per_doi', 'names_match', 'parse_resolved_dois_from_json',
+           'analyze_normalized_dois', 'normalize_doi_record_crossref', 'normalize_doi_record_datacite', 'normalize_doi_record_medra', 'normalize_doi_record_crossref_rest', 'normalize_doi_record_datacite_rest',
+           'normalize_orcid_profile', 'match_orcid_profiles', 'index_orcid_profiles', 'OrcidProfile', 'OrcidProfileIndex', 'PublicationMatcher', 'NameKey', 'make_name_key', 'normalize_name', 'write_normalized_records', 'read_normalized_records', 'RECORD_NORMALIZERS']
\ No newline at end of file
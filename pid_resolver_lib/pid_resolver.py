@@ -14,18 +14,26 @@
 #
 
 from pathlib import Path
-import jq  # type: ignore
-from typing import List, NamedTuple, Optional, cast, Tuple
+from typing import List, NamedTuple, Optional, cast, Tuple, Callable, Dict, Awaitable, Set
 import aiohttp # type: ignore
-from aiohttp import ClientSession, TCPConnector, ClientTimeout
+from aiohttp import ClientSession, TCPConnector, ClientTimeout, ClientResponse
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 import logging
-from .cache_handler import get_keys, write_records_to_cache
+from . import json_backend
+from .cache_handler import get_contained_keys, write_records_to_cache, read_records_from_cache, get_metadata_cache_dir
 
 logger = logging.getLogger(__name__)
 
 RESOLVER = 'RESOLVER:'
 
+# batches of fetched records waiting to be written per cache, fetching pauses when reached, see _CacheWriter
+MAX_PENDING_WRITES = 2
+
+# response bodies larger than this (in bytes) are decoded in a thread, e.g., full ORCID profiles
+DECODE_IN_THREAD_SIZE = 1 << 20
+
 class ResolvedRecord(NamedTuple):
     """
     Represents a resolved record (DOI, ORCID).
@@ -34,101 +42,348 @@ class ResolvedRecord(NamedTuple):
     # requires Python 3.5
     """
     rec_id: str # 0
-    content: str # 1
+    content: str # 1 empty if not modified
+    etag: Optional[str] = None # 2
+    last_modified: Optional[str] = None # 3
+    status: int = 200 # 4 304 if not modified since the last request
+
+
+# makes the request(s) for a record, like _make_record_request: session, record id, base URL, accept header, conditional headers
+RecordRequest = Callable[[ClientSession, str, str, str, Optional[Dict[str, str]]], Awaitable[Optional[ResolvedRecord]]]
+
+
+class RefreshReport(NamedTuple):
+    """
+    Represents the outcome of refreshing cached records.
+    """
+    requested: int # 0
+    not_modified: int # 1 the server responded 304 Not Modified
+    unchanged: int # 2 the server sent the record, but its content hash did not change
+    changed: int # 3 records rewritten in the cache
+    failed: int # 4
+
+
+def _content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def _record_metadata(record: ResolvedRecord) -> str:
+    """
+    Returns the metadata stored for a record: HTTP validators and content hash.
+    """
+    return json_backend.dumps({'etag': record.etag, 'last_modified': record.last_modified, 'sha256': _content_hash(record.content)})
+
+
+def _conditional_headers(metadata: Dict) -> Dict[str, str]:
+    """
+    Returns the headers for a conditional request given the metadata of a record.
+    """
+    headers = {}
+
+    if metadata.get('etag') is not None:
+        headers['If-None-Match'] = metadata['etag']
+
+    if metadata.get('last_modified') is not None:
+        headers['If-Modified-Since'] = metadata['last_modified']
+
+    return headers
 
 
-async def _make_record_request(session: ClientSession, record_id: str, base_url: str, accept_header: str) -> Optional[ResolvedRecord]:
+async def read_text(response: ClientResponse) -> str:
+    """
+    Reads and decodes a response body like ClientResponse.text, large bodies are decoded in a thread to not block the event loop.
+
+    @param response: The response.
+    """
+
+    body: bytes = await response.read()
+    encoding: str = response.get_encoding()
+
+    if len(body) < DECODE_IN_THREAD_SIZE:
+        return body.decode(encoding)
+
+    return await asyncio.get_running_loop().run_in_executor(None, body.decode, encoding)
+
+
+class _CacheWriter:
+    """
+    Writes batches of fetched records to a cache in a dedicated thread, so fetching the next batch does not wait for the disk.
+    Batches are written in the order they are put. At most max_pending batches wait to be written, put waits when reached.
+
+    To be used as an async context manager, all batches are written when it exits.
+    """
+
+    def __init__(self, cache_dir: Path, post_fetch: Optional[Callable[[List[ResolvedRecord], Path], None]] = None,
+                 max_pending: int = MAX_PENDING_WRITES, log_prefix: str = RESOLVER):
+        """
+        @param cache_dir: Directory the records are written to.
+        @param post_fetch: Optional hook called with each batch of records after they have been written to the cache.
+        @param max_pending: Maximum number of batches waiting to be written.
+        @param log_prefix: Prefix of the logged errors.
+        """
+        self.cache_dir = cache_dir
+        self.post_fetch = post_fetch
+        self.log_prefix = log_prefix
+        # ids of records that could not be written
+        self.failed: Set[str] = set()
+        self._queue: asyncio.Queue[Optional[Tuple[List[ResolvedRecord], List[ResolvedRecord]]]] = asyncio.Queue(maxsize=max_pending)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def __aenter__(self) -> '_CacheWriter':
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='cache_writer')
+        self._task = asyncio.create_task(self._write_batches())
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self._queue.put(None)
+        await cast(asyncio.Task, self._task)
+        cast(ThreadPoolExecutor, self._executor).shutdown()
+
+    async def put(self, records: List[ResolvedRecord], metadata_records: Optional[List[ResolvedRecord]] = None) -> None:
+        """
+        Queues a batch of records to be written.
+
+        @param records: Records to be written to the cache.
+        @param metadata_records: Records whose metadata are written, records if not given.
+        """
+        await self._queue.put((records, metadata_records if metadata_records is not None else records))
+
+    async def _write_batches(self) -> None:
+        loop = asyncio.get_running_loop()
+
+        while (batch := await self._queue.get()) is not None:
+            await loop.run_in_executor(self._executor, self._write_batch, *batch)
+
+    def _write_batch(self, records: List[ResolvedRecord], metadata_records: List[ResolvedRecord]) -> None:
+        try:
+            write_records_to_cache(records, 0, 1, self.cache_dir)
+            write_metadata(metadata_records, self.cache_dir)
+
+            if self.post_fetch is not None and len(records) > 0:
+                self.post_fetch(records, self.cache_dir)
+
+        except Exception as e:
+            logging.error(f'{self.log_prefix} An error occurred when writing results: {e}')
+            self.failed.update(map(lambda rec: rec.rec_id, records))
+
+
+async def _make_record_request(session: ClientSession, record_id: str, base_url: str, accept_header: str,
+                               conditional_headers: Optional[Dict[str, str]] = None) -> Optional[ResolvedRecord]:
     """
     Given a record id, resolves it using content negotiation.
 
     @param session:  The aiohttp session to be used.
     @param record_id: The id of the record to be resolved.
+    @param conditional_headers: Headers for a conditional request, e.g., If-None-Match.
     """
 
     headers = {
-        'Accept': accept_header
+        'Accept': accept_header,
+        **(conditional_headers or {})
     }
 
     try:
         async with session.get(f'{base_url}/{record_id}', headers=headers) as request:
-            return ResolvedRecord(record_id, await request.text())
+            etag = request.headers.get('ETag')
+            last_modified = request.headers.get('Last-Modified')
+
+            if request.status == 304:
+                return ResolvedRecord(record_id, '', etag, last_modified, 304)
+
+            return ResolvedRecord(record_id, await read_text(request), etag, last_modified)
 
     except Exception as e:
         logging.error(f'{RESOLVER} Error when resolving {record_id} {e}')
         return None
 
 
-async def _fetch_record_batch(record_ids: List[str], base_url: str, accept_header) -> List[ResolvedRecord]:
+async def _request_records(session: ClientSession, record_ids: List[str], base_url: str, accept_header,
+                           metadata: Optional[Dict[str, Dict]] = None, record_request: Optional[RecordRequest] = None) -> List[ResolvedRecord]:
+
+    make_request: RecordRequest = record_request if record_request is not None else _make_record_request
+
+    requests = [make_request(session, rec_id, base_url, accept_header,
+                                     _conditional_headers(metadata.get(rec_id, {})) if metadata is not None else None) for rec_id in record_ids]
+
+    results = await asyncio.gather(*requests)
+
+    # filter out None values (failed requests)
+    return cast(List[ResolvedRecord], list(filter(lambda res: res is not None, results)))
+
+
+async def _fetch_record_batch(record_ids: List[str], base_url: str, accept_header, metadata: Optional[Dict[str, Dict]] = None,
+                             concurrency: int = 5, session: Optional[ClientSession] = None,
+                             record_request: Optional[RecordRequest] = None) -> List[ResolvedRecord]:
     """
     Given a batch of record ids, fetches them.
 
     @param record_ids: List of record ids.
+    @param metadata: Stored metadata per record id. If given, conditional requests are made.
+    @param concurrency: Maximum number of simultaneous connections.
+    @param session: An open session to be reused, e.g., by a long-running service. If given, its connector limits the number of connections.
+    @param record_request: Makes the request(s) for a record, content negotiation (_make_record_request) if not given.
     """
 
-    conn = TCPConnector(limit=5)
+    if session is not None:
+        return await _request_records(session, record_ids, base_url, accept_header, metadata, record_request)
+
+    conn = TCPConnector(limit=concurrency)
     # set raise_for_status
     time_out = ClientTimeout(total=60 * 60 * 24)
-    async with aiohttp.ClientSession(connector=conn, raise_for_status=True, timeout=time_out) as session:
-
-        requests = [_make_record_request(session, rec_id, base_url, accept_header) for rec_id in record_ids]
-
-        results = await asyncio.gather(*requests)
-
-        # filter out None values (failed requests)
-        return cast(List[ResolvedRecord], list(filter(lambda res: res is not None, results)))
+    async with aiohttp.ClientSession(connector=conn, raise_for_status=True, timeout=time_out) as new_session:
+        return await _request_records(new_session, record_ids, base_url, accept_header, metadata, record_request)
 
 
 def records_not_in_cache(record_ids: List[str], cache_dir: Path) -> List[str]:
-    return list(set(record_ids) - set(get_keys(cache_dir)))
+    return list(set(record_ids) - get_contained_keys(record_ids, cache_dir))
 
 
-async def fetch_records(record_ids: List[str], cache_dir: Path, base_url: str, accept_header: str, sleep_per_batch: int = 0) -> None:
+async def fetch_records(record_ids: List[str], cache_dir: Path, base_url: str, accept_header: str, sleep_per_batch: int = 0,
+                        post_fetch: Optional[Callable[[List[ResolvedRecord], Path], None]] = None, refresh: bool = False,
+                        concurrency: int = 5, batch_size: int = 500, session: Optional[ClientSession] = None,
+                        record_request: Optional[RecordRequest] = None, record_key: Optional[Callable[[str], str]] = None) -> None:
     """
     Fetches a list of records (DOIs, ORCIDs) and writes them to the cache directory.
-    Performs fetching in batches of size 500 requests each.
+    Performs fetching in batches of size 500 requests each (default).
 
     @param record_ids: Records to be fetched.
     @param cache_dir: Directory the results are written to
     @param base_url: Base URL of the items to be fetched, e.g., https://doi.org.
     @param accept_header: HTTP accept header for content negotiation.
     @param sleep_per_batch: Sleep in seconds after each batch to respect rate limits, if any. See https://support.datacite.org/docs/is-there-a-rate-limit-for-making-requests-against-the-datacite-apis.
+    @param post_fetch: Optional hook called with each batch of fetched records after they have been written to the cache, e.g., to store normalized records.
+                       Records are written in a thread while the next batch is fetched, the hook is called in that thread.
+    @param refresh: If True, records already contained in the cache are refreshed using conditional requests, see refresh_records.
+    @param concurrency: Maximum number of simultaneous connections.
+    @param batch_size: Number of requests per batch.
+    @param session: An open session to be reused, see _fetch_record_batch.
+    @param record_request: Makes the request(s) for a record, see _fetch_record_batch.
+    @param record_key: Returns the canonical form of a record id, e.g., canonical_doi (doi_reader). If given, records are requested and cached
+                       under their canonical ids, so ids differing only in spelling are fetched once.
     """
 
+    if record_key is not None:
+        record_ids = list(dict.fromkeys(map(record_key, record_ids)))
+
+    if refresh:
+        await refresh_records(record_ids, cache_dir, base_url, accept_header, sleep_per_batch, post_fetch, concurrency, batch_size, session,
+                              record_request)
+
     records_not_cached = records_not_in_cache(record_ids, cache_dir)
 
     logging.info(f'{RESOLVER} fetching number of records for {cache_dir}: {len(records_not_cached)}')
 
     offset = 0
-    batch_size = 500
     last_run = False
 
-    while not last_run:
+    async with _CacheWriter(cache_dir, post_fetch) as writer:
+        while not last_run:
 
-        limit = offset + batch_size
+            limit = offset + batch_size
 
-        if limit > len(records_not_cached):
-            limit = len(records_not_cached)
-            last_run = True
+            if limit > len(records_not_cached):
+                limit = len(records_not_cached)
+                last_run = True
 
-        logging.info(f'{RESOLVER} fetching batch: {offset}, {limit}')
+            logging.info(f'{RESOLVER} fetching batch: {offset}, {limit}')
 
-        results: List[ResolvedRecord] = await _fetch_record_batch(records_not_cached[offset:limit], base_url, accept_header)
+            results: List[ResolvedRecord] = await _fetch_record_batch(records_not_cached[offset:limit], base_url, accept_header,
+                                                                      concurrency=concurrency, session=session, record_request=record_request)
 
-        # store records in cache
-        try:
-            # TODO: try to use member names of named tuple, i.e rec_id and content
+            # store records in cache while the next batch is fetched
             logging.info(f'{RESOLVER} results {len(results)}')
-            write_records_to_cache(results, 0, 1, cache_dir)
+            await writer.put(results)
 
-        except Exception as e:
-            logging.error(f'{RESOLVER} An error occurred when writing results: {e}')
+            if not last_run:
+                # sleep because of rate limits
+                logging.info(f'{RESOLVER} pausing')
+                await asyncio.sleep(sleep_per_batch)
+                logging.info(f'{RESOLVER} working')
+
+            offset = offset + batch_size
+
+
+def write_metadata(records: List[ResolvedRecord], cache_dir: Path) -> None:
+    """
+    Writes the metadata of records (HTTP validators and content hash) to the metadata cache of a cache directory, see refresh_records.
+
+    @param records: The records, e.g., as written to the cache directory.
+    @param cache_dir: Directory the records have been written to.
+    """
+
+    write_records_to_cache(list(map(lambda rec: (rec.rec_id, _record_metadata(rec)), records)), 0, 1, get_metadata_cache_dir(cache_dir))
+
+
+async def refresh_records(record_ids: List[str], cache_dir: Path, base_url: str, accept_header: str, sleep_per_batch: int = 0,
+                          post_fetch: Optional[Callable[[List[ResolvedRecord], Path], None]] = None, concurrency: int = 5,
+                          batch_size: int = 500, session: Optional[ClientSession] = None,
+                          record_request: Optional[RecordRequest] = None, record_key: Optional[Callable[[str], str]] = None) -> RefreshReport:
+    """
+    Refreshes cached records using conditional requests (If-None-Match / If-Modified-Since) based on the stored HTTP validators.
+    Only records whose content hash changed are rewritten to the cache. Records not contained in the cache are ignored.
+    Performs fetching in batches of size 500 requests each (default).
+
+    @param record_ids: Records to be refreshed.
+    @param cache_dir: Directory the records have been written to.
+    @param base_url: Base URL of the items to be fetched, e.g., https://doi.org.
+    @param accept_header: HTTP accept header for content negotiation.
+    @param sleep_per_batch: Sleep in seconds after each batch to respect rate limits, if any.
+    @param post_fetch: Optional hook called with each batch of changed records after they have been written to the cache.
+    @param concurrency: Maximum number of simultaneous connections.
+    @param batch_size: Number of requests per batch.
+    @param session: An open session to be reused, see _fetch_record_batch.
+    @param record_request: Makes the request(s) for a record, see _fetch_record_batch.
+    @param record_key: Returns the canonical form of a record id, see fetch_records.
+    """
+
+    if record_key is not None:
+        record_ids = list(dict.fromkeys(map(record_key, record_ids)))
+
+    cached_ids = get_contained_keys(record_ids, cache_dir)
+    records_cached = list(filter(lambda rec_id: rec_id in cached_ids, record_ids))
+
+    logging.info(f'{RESOLVER} refreshing number of records for {cache_dir}: {len(records_cached)}')
+
+    not_modified = 0
+    unchanged = 0
+    changed = 0
+    failed = 0
+
+    async with _CacheWriter(cache_dir, post_fetch) as writer:
+        for offset in range(0, len(records_cached), batch_size):
+            batch = records_cached[offset:offset + batch_size]
+
+            metadata: Dict[str, Dict] = dict(map(lambda rec: (rec[0], json_backend.loads(rec[1])),
+                                                 read_records_from_cache(batch, get_metadata_cache_dir(cache_dir)).items()))
+
+            logging.info(f'{RESOLVER} refreshing batch: {offset}, {offset + len(batch)}')
+
+            results: List[ResolvedRecord] = await _fetch_record_batch(batch, base_url, accept_header, metadata, concurrency, session, record_request)
+
+            modified = list(filter(lambda rec: rec.status != 304, results))
+
+            # records without stored metadata are treated as changed
+            changed_records = list(filter(lambda rec: metadata.get(rec.rec_id, {}).get('sha256') != _content_hash(rec.content), modified))
+
+            failed += len(batch) - len(results)
+            not_modified += len(results) - len(modified)
+            unchanged += len(modified) - len(changed_records)
+            changed += len(changed_records)
+
+            # validators of unchanged records may have changed, too
+            await writer.put(changed_records, modified)
+
+            if offset + batch_size < len(records_cached):
+                # sleep because of rate limits
+                await asyncio.sleep(sleep_per_batch)
+
+    report = RefreshReport(requested=len(records_cached), not_modified=not_modified, unchanged=unchanged, changed=changed, failed=failed)
+
+    logging.info(f'{RESOLVER} refreshed {cache_dir}: {report}')
 
-        if not last_run:
-            # sleep because of rate limits
-            logging.info(f'{RESOLVER} pausing')
-            await asyncio.sleep(sleep_per_batch)
-            logging.info(f'{RESOLVER} working')
+    return report
 
-        offset = offset + batch_size
 
-__all__ = ['fetch_records', 'records_not_in_cache']
\ No newline at end of file
+__all__ = ['fetch_records', 'refresh_records', 'records_not_in_cache', 'read_text', 'write_metadata', 'ResolvedRecord', 'RefreshReport', 'RecordRequest',
+           'MAX_PENDING_WRITES']
\ No newline at end of file
@@ -0,0 +1,322 @@
+#  Copyright 2024 Switch
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import logging
+from contextlib import contextmanager
+from functools import partial
+from pathlib import Path
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Optional, Set
+
+from aiohttp import ClientSession
+
+from .bulk_fetch import BULK_ENDPOINTS, DOIS_PER_REQUEST, fetch_records_bulk
+from .cache_handler import delete_records, get_contained_keys, get_metadata_cache_dir, get_normalized_cache_dir, migrate_keys, pin_records, unpin_records
+from .doi_ra_handler import RAs, group_dois_by_ra
+from .doi_reader import canonical_doi, normalize_doi
+from .pid_analyzer import OrcidProfile, PublicationInfo, PublicationMatcher, RECORD_NORMALIZERS, analyze_normalized_dois, group_orcids_per_doi, \
+    iter_dois_per_orcid, match_orcid_profiles, normalize_orcid_profile, read_normalized_records, write_normalized_records
+from .orcid_works import ORCID_API_MIME, ORCID_API_URL, request_orcid_works_summary
+from .pid_resolver import RefreshReport, fetch_records, records_not_in_cache, refresh_records
+
+RESOLVER = 'RESOLVER:'
+
+logger = logging.getLogger(__name__)
+
+
+class Resolver:
+    """
+    Resolves DOIs and the ORCID profiles linked to them, caching all records below a configurable cache root.
+
+    A resolver does not write to the working directory, so several resolvers with different cache roots
+    can be used in parallel, e.g., embedded in an asyncio service.
+
+    DOIs may be given in any spelling, e.g., with resolver URL. They are cached and returned in canonical form, see canonical_doi.
+    """
+
+    def __init__(self, cache_root: Path = Path('.'), concurrency: int = 5, batch_size: int = 500, ra_concurrency: int = 10,
+                 sleep_per_batch: Optional[Dict[str, int]] = None, doi_base_url: str = 'https://doi.org',
+                 orcid_base_url: str = 'https://orcid.org', matcher: PublicationMatcher = match_orcid_profiles, bulk_fetch: bool = False,
+                 dois_per_request: int = DOIS_PER_REQUEST, lean_orcid_profiles: bool = False, orcid_api_url: str = ORCID_API_URL):
+        """
+        @param cache_root: Directory containing the cache directories of the RAs and ORCID.
+        @param concurrency: Maximum number of simultaneous connections when fetching records.
+        @param batch_size: Number of requests per batch.
+        @param ra_concurrency: Maximum number of simultaneous connections when resolving the RAs of DOI prefixes.
+        @param sleep_per_batch: Sleep in seconds after each batch per RA, overriding the defaults in `RAs`.
+        @param doi_base_url: Base URL for resolving DOIs.
+        @param orcid_base_url: Base URL for resolving ORCIDs.
+        @param matcher: Matches authors against ORCID profiles, e.g., match_orcid_profiles_batch (pid_resolver_lib.batch_matcher).
+        @param bulk_fetch: If True, DOIs of RAs with a REST API (see BULK_ENDPOINTS) are fetched several per request, see fetch_records_bulk.
+        @param dois_per_request: Maximum number of DOIs per request when fetching in bulk.
+        @param lean_orcid_profiles: If True, only the names and the works summaries of ORCID records are fetched from the public API
+                                    and cached in compact form instead of the full JSON-LD profiles, see request_orcid_works_summary.
+        @param orcid_api_url: Base URL of the ORCID public API, used if lean_orcid_profiles is True.
+        """
+        self.cache_root = cache_root
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.ra_concurrency = ra_concurrency
+        self.sleep_per_batch = sleep_per_batch if sleep_per_batch is not None else {}
+        self.doi_base_url = doi_base_url
+        self.orcid_base_url = orcid_base_url
+        self.matcher = matcher
+        self.bulk_fetch = bulk_fetch
+        self.dois_per_request = dois_per_request
+        self.lean_orcid_profiles = lean_orcid_profiles
+        self.orcid_api_url = orcid_api_url
+        # an open session to be reused for all requests, e.g., set by a long-running service
+        self.session: Optional[ClientSession] = None
+
+    def get_cache_dir(self, name: str) -> Path:
+        """
+        Returns the cache directory of an RA or of ORCID.
+
+        @param name: The name of the RA, e.g., "Crossref", or "orcid".
+        """
+        return self.cache_root / name
+
+    @property
+    def orcid_cache_dir(self) -> Path:
+        return self.get_cache_dir('orcid')
+
+    @contextmanager
+    def pinned(self, record_ids: List[str], names: Iterable[str]) -> Iterator[None]:
+        """
+        Protects records in caches and their side stores from eviction while they are used, e.g., by a request.
+        Pins are counted per record, so concurrent requests sharing records do not remove each other's pins.
+
+        @param record_ids: Canonical DOIs or ORCIDs.
+        @param names: Names of the caches, see get_cache_dir.
+        """
+
+        pinned_dirs = [pinned_dir for name in names for pinned_dir in [self.get_cache_dir(name), get_normalized_cache_dir(self.get_cache_dir(name))]]
+
+        for pinned_dir in pinned_dirs:
+            pin_records(record_ids, pinned_dir)
+
+        try:
+            yield
+        finally:
+            for pinned_dir in pinned_dirs:
+                unpin_records(pinned_dir, record_ids)
+
+    def _sleep(self, ra: str) -> int:
+        return self.sleep_per_batch.get(ra, int(RAs[ra]['sleep']))
+
+    async def fetch_dois(self, dois: List[str]) -> None:
+        """
+        Groups DOIs by RA and fetches those not contained in the caches yet.
+        The DOIs are pinned in the caches while they are fetched, use `pinned` to keep them until they are analyzed.
+
+        @param dois: DOIs to be fetched.
+        """
+
+        dois = list(dict.fromkeys(map(canonical_doi, dois)))
+
+        if len(dois) == 0:
+            return
+
+        # protect the records from eviction while they are being fetched
+        with self.pinned(dois, RAs):
+            # group the DOIs by registration agency
+            org_dois: Dict[str, List[str]] = await group_dois_by_ra(dois, self.cache_root, self.ra_concurrency,
+                                                                    self.doi_base_url, self.session)
+
+            for ra in org_dois.keys():
+
+                # for each RA, resolve the DOIs
+                if ra in RAs:
+                    if self.bulk_fetch and ra in BULK_ENDPOINTS:
+                        await fetch_records_bulk(org_dois[ra], self.get_cache_dir(ra), ra, self._sleep(ra),
+                                                 post_fetch=partial(write_normalized_records, normalizer=RECORD_NORMALIZERS[ra]),
+                                                 concurrency=self.concurrency, batch_size=self.batch_size,
+                                                 dois_per_request=self.dois_per_request, session=self.session)
+
+                    # store normalized records alongside the raw records so analysis does not have to parse them again
+                    # DOIs fetched in bulk are cached already, the others are fetched using content negotiation
+                    await fetch_records(org_dois[ra], self.get_cache_dir(ra), self.doi_base_url, str(RAs[ra]['mime']), self._sleep(ra),
+                                        post_fetch=partial(write_normalized_records, normalizer=RECORD_NORMALIZERS[ra]),
+                                        concurrency=self.concurrency, batch_size=self.batch_size, session=self.session,
+                                        record_key=canonical_doi)
+
+    async def refresh_dois(self, dois: List[str]) -> Dict[str, RefreshReport]:
+        """
+        Refreshes cached DOIs using conditional requests, see `refresh_records`.
+        The cache a DOI is contained in determines its RA, so cached DOIs are not grouped by RA again.
+
+        @param dois: DOIs to be refreshed.
+        @return: A report per RA.
+        """
+
+        reports: Dict[str, RefreshReport] = {}
+
+        canonical_dois = set(map(canonical_doi, dois))
+
+        for ra in RAs:
+            cached_dois = list(get_contained_keys(canonical_dois, self.get_cache_dir(ra)))
+
+            reports[ra] = await refresh_records(cached_dois, self.get_cache_dir(ra), self.doi_base_url, str(RAs[ra]['mime']), self._sleep(ra),
+                                                post_fetch=partial(write_normalized_records, normalizer=RECORD_NORMALIZERS[ra]),
+                                                concurrency=self.concurrency, batch_size=self.batch_size, session=self.session,
+                                                record_key=canonical_doi)
+
+        return reports
+
+    def get_orcids_grouped_by_doi(self) -> Dict[str, List[OrcidProfile]]:
+        """
+        Reads the cached ORCID profiles and groups them by the DOIs they list.
+        """
+        return group_orcids_per_doi(iter_dois_per_orcid(self.orcid_cache_dir))
+
+    def analyze(self, dois: Optional[List[str]] = None,
+                orcids_grouped_by_doi: Optional[Dict[str, List[OrcidProfile]]] = None) -> Dict[str, PublicationInfo]:
+        """
+        Analyzes cached DOIs and matches their authors against the cached ORCID profiles.
+
+        @param dois: DOIs to be analyzed, all cached DOIs if not given. DOIs not contained in the caches are ignored.
+        @param orcids_grouped_by_doi: ORCID profiles grouped by DOI, read from the ORCID cache if not given.
+        @return: Publications indexed by canonical DOI.
+        """
+
+        # the ORCID profiles are read once for all RAs
+        if orcids_grouped_by_doi is None:
+            orcids_grouped_by_doi = self.get_orcids_grouped_by_doi()
+
+        resolved_dois: Dict[str, PublicationInfo] = {}
+
+        for ra in RAs:
+            cache_dir = self.get_cache_dir(ra)
+
+            if dois is None:
+                dois_to_analyze = None
+            else:
+                canonical_dois = list(dict.fromkeys(map(canonical_doi, dois)))
+                cached: Set[str] = get_contained_keys(canonical_dois, cache_dir)
+                dois_to_analyze = list(filter(lambda doi: doi in cached, canonical_dois))
+
+            resolved_dois.update(analyze_normalized_dois(cache_dir, RECORD_NORMALIZERS[ra], self.orcid_cache_dir,
+                                                         dois_to_analyze, orcids_grouped_by_doi, self.matcher))
+
+        return resolved_dois
+
+    async def resolve(self, dois: List[str]) -> AsyncIterator[PublicationInfo]:
+        """
+        Resolves DOIs and yields a publication for each DOI that could be resolved and analyzed.
+
+        @param dois: DOIs to be resolved.
+        """
+
+        # records fetched by concurrent calls must not evict the records before they are analyzed
+        with self.pinned(list(dict.fromkeys(map(canonical_doi, dois))), RAs):
+            await self.fetch_dois(dois)
+
+            resolved_dois = self.analyze(dois)
+
+        for doi in dict.fromkeys(map(canonical_doi, dois)):
+            if doi in resolved_dois:
+                yield resolved_dois[doi]
+
+    async def expand_orcids(self, orcids: List[str], refresh: bool = False) -> List[str]:
+        """
+        Fetches ORCID profiles not contained in the cache yet and returns the DOIs listed in the profiles.
+        The ORCIDs are pinned in the cache while they are fetched and read.
+
+        @param orcids: ORCIDs without base URL.
+        @param refresh: If True, cached profiles are refreshed using conditional requests.
+        @return: DOIs listed in the profiles in canonical form (without duplicates).
+        """
+
+        with self.pinned(orcids, ['orcid']):
+            # profiles cached in one form are refreshed in the other form if the mode changes
+            if self.lean_orcid_profiles:
+                await fetch_records(orcids, self.orcid_cache_dir, self.orcid_api_url, ORCID_API_MIME,
+                                    post_fetch=partial(write_normalized_records, normalizer=normalize_orcid_profile), refresh=refresh,
+                                    concurrency=self.concurrency, batch_size=self.batch_size, session=self.session,
+                                    record_request=request_orcid_works_summary)
+            else:
+                await fetch_records(orcids, self.orcid_cache_dir, self.orcid_base_url, 'application/ld+json',
+                                    post_fetch=partial(write_normalized_records, normalizer=normalize_orcid_profile), refresh=refresh,
+                                    concurrency=self.concurrency, batch_size=self.batch_size, session=self.session)
+
+            dois = [doi for profile_dois in self.get_profile_dois(orcids).values() for doi in profile_dois]
+
+        return list(dict.fromkeys(map(canonical_doi, dois)))
+
+    def get_profile_dois(self, orcids: List[str]) -> Dict[str, List[str]]:
+        """
+        Returns the DOIs listed in cached ORCID profiles.
+
+        @param orcids: ORCIDs without base URL, ORCIDs not contained in the cache are omitted.
+        @return: DOIs (as listed in the profile) indexed by ORCID.
+        """
+
+        profiles = read_normalized_records(self.orcid_cache_dir, orcids, normalize_orcid_profile)
+
+        return {orcid: profile['dois'] for orcid, profile in profiles.items() if profile is not None}
+
+    async def get_ras(self, dois: List[str]) -> Dict[str, str]:
+        """
+        Returns the RA of each DOI that is not cached yet. The RAs of DOI prefixes are memoized, see `group_dois_by_ra`.
+
+        @param dois: DOIs to be looked up.
+        @return: RAs indexed by canonical DOI, DOIs whose RA could not be resolved are omitted.
+        """
+
+        uncached = self.dois_not_in_cache(dois)
+
+        org_dois = await group_dois_by_ra(uncached, self.cache_root, self.ra_concurrency, self.doi_base_url, self.session)
+
+        return {doi: ra for ra, ra_dois in org_dois.items() for doi in ra_dois}
+
+    def dois_not_in_cache(self, dois: List[str]) -> List[str]:
+        """
+        Returns the DOIs that are not contained in the cache of any RA, e.g., because they could not be resolved.
+        DOIs are compared in canonical form, but returned as given.
+        """
+
+        canonical_dois = set(map(canonical_doi, dois))
+        cached: Set[str] = set().union(*map(lambda ra: get_contained_keys(canonical_dois, self.get_cache_dir(ra)), RAs))
+
+        return list(filter(lambda doi: canonical_doi(doi) not in cached, dois))
+
+    def orcids_not_in_cache(self, orcids: List[str]) -> List[str]:
+        return records_not_in_cache(orcids, self.orcid_cache_dir)
+
+    def migrate_doi_caches(self) -> Dict[str, int]:
+        """
+        Rewrites the keys of DOI caches written before DOIs were cached in canonical form (see canonical_doi),
+        merging records cached several times under different spellings of a DOI. The HTTP validators are rewritten, too.
+        Normalized records of rewritten DOIs are removed from the side stores, they are normalized again with the canonical DOI when analyzed.
+
+        @return: The number of rewritten keys per RA.
+        """
+
+        report: Dict[str, int] = {}
+
+        for ra in RAs:
+            cache_dir = self.get_cache_dir(ra)
+
+            migrated = migrate_keys(cache_dir, canonical_doi)
+            migrate_keys(get_metadata_cache_dir(cache_dir), canonical_doi)
+            delete_records([*migrated, *migrated.values()], get_normalized_cache_dir(cache_dir))
+
+            report[ra] = len(migrated)
+
+        logging.info(f'{RESOLVER} migrated DOI caches: {report}')
+
+        return report
+
+
+__all__ = ['Resolver', 'normalize_doi', 'canonical_doi']
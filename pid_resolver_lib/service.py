@@ -0,0 +1,298 @@
+#  Copyright 2024 Switch
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import asyncio
+import getopt
+import logging
+import sys
+from functools import reduce
+from pathlib import Path
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, NamedTuple, Optional, cast
+
+from aiohttp import ClientSession, ClientTimeout, TCPConnector, web
+
+from . import json_backend
+from .cache_handler import close_caches, keep_caches_open
+from .doi_reader import canonical_doi
+from .memo import get_memo_stats
+from .pid_analyzer import OrcidProfile, PublicationInfo, group_orcids_per_doi, normalize_orcid_profile, read_normalized_records
+from .doi_ra_handler import RAs
+from .resolver import Resolver
+
+SERVICE = 'SERVICE:'
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceStats(NamedTuple):
+    """
+    Represents the number of records requested from a service and how many upstream fetches they caused.
+    """
+    requests: int # 0 records requested by clients
+    coalesced: int # 1 records that joined a fetch already in flight
+    fetches: int # 2 fetches started, each covering one or several records
+
+
+def _release(in_flight: Dict[str, asyncio.Future], keys: List[str], task: asyncio.Future) -> None:
+    for key in keys:
+        if in_flight.get(key) is task:
+            del in_flight[key]
+
+
+class ResolverService:
+    """
+    Serves resolved DOIs and ORCID profiles over HTTP, keeping caches, the HTTP session and the ORCID index warm.
+
+    Concurrent requests for the same DOI or ORCID are coalesced into one upstream fetch.
+    """
+
+    def __init__(self, resolver: Resolver):
+        """
+        @param resolver: The resolver used to fetch and analyze records.
+        """
+        self.resolver = resolver
+        self._dois_in_flight: Dict[str, asyncio.Future] = {}
+        self._orcids_in_flight: Dict[str, asyncio.Future] = {}
+        # ORCID profiles grouped by DOI, read from the ORCID cache on first use and extended when profiles are fetched
+        self._orcids_grouped_by_doi: Optional[Dict[str, List[OrcidProfile]]] = None
+        self._stats = ServiceStats(0, 0, 0)
+
+    @property
+    def stats(self) -> ServiceStats:
+        return self._stats
+
+    async def _coalesce(self, in_flight: Dict[str, asyncio.Future], keys: List[str],
+                        fetch: Callable[[List[str]], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """
+        Fetches the keys that are not in flight yet in one call and waits for the fetches already in flight for the others.
+
+        @param in_flight: Fetches in flight by key.
+        @param keys: The keys (DOIs, ORCIDs) to be fetched.
+        @param fetch: Fetches a list of keys and returns the results by key.
+        @return: The result of each key, None if it could not be fetched.
+        """
+
+        keys = list(dict.fromkeys(keys))
+        new_keys = list(filter(lambda key: key not in in_flight, keys))
+
+        self._stats = ServiceStats(self._stats.requests + len(keys), self._stats.coalesced + len(keys) - len(new_keys),
+                                   self._stats.fetches + (1 if len(new_keys) > 0 else 0))
+
+        if len(new_keys) > 0:
+            task = asyncio.ensure_future(fetch(new_keys))
+            for key in new_keys:
+                in_flight[key] = task
+            task.add_done_callback(lambda done: _release(in_flight, new_keys, done))
+
+        tasks = list(dict.fromkeys(map(lambda key: in_flight[key], keys)))
+
+        # a client disconnecting must not cancel a fetch other clients are waiting for
+        results: List[Dict[str, Any]] = await asyncio.gather(*map(asyncio.shield, tasks))
+
+        merged: Dict[str, Any] = reduce(lambda a, b: {**a, **b}, results, {})
+
+        return {key: merged.get(key) for key in keys}
+
+    def _get_orcid_index(self) -> Dict[str, List[OrcidProfile]]:
+        if self._orcids_grouped_by_doi is None:
+            self._orcids_grouped_by_doi = self.resolver.get_orcids_grouped_by_doi()
+
+        return self._orcids_grouped_by_doi
+
+    def _add_to_orcid_index(self, profiles: List[Dict]) -> None:
+        if self._orcids_grouped_by_doi is None:
+            # the index will be read from the cache, including these profiles
+            return
+
+        for doi, entries in group_orcids_per_doi(profiles).items():
+            known = self._orcids_grouped_by_doi.setdefault(doi, [])
+            known.extend(filter(lambda entry: entry not in known, entries))
+
+    async def _fetch_dois(self, dois: List[str]) -> Dict[str, PublicationInfo]:
+        # pinned once per coalesced fetch until the records are analyzed
+        with self.resolver.pinned(dois, RAs):
+            await self.resolver.fetch_dois(dois)
+
+            # analysis reads from the caches and matches the authors, it runs in a thread to not block other requests
+            return await asyncio.get_running_loop().run_in_executor(None, self._analyze, dois)
+
+    def _analyze(self, dois: List[str]) -> Dict[str, PublicationInfo]:
+        return self.resolver.analyze(dois, self._get_orcid_index())
+
+    async def _fetch_orcids(self, orcids: List[str]) -> Dict[str, Optional[Dict]]:
+        with self.resolver.pinned(orcids, ['orcid']):
+            await self.resolver.expand_orcids(orcids)
+
+            profiles: Dict[str, Optional[Dict]] = read_normalized_records(self.resolver.orcid_cache_dir, orcids, normalize_orcid_profile)
+
+        self._add_to_orcid_index(cast(List[Dict], list(filter(lambda profile: profile is not None, profiles.values()))))
+
+        return profiles
+
+    async def resolve_dois(self, dois: List[str]) -> Dict[str, PublicationInfo]:
+        """
+        Resolves DOIs, coalescing them with concurrent requests for the same DOIs, in any spelling (see canonical_doi).
+
+        @param dois: DOIs to be resolved.
+        @return: Publications indexed by DOI as given, DOIs that could not be resolved are omitted.
+        """
+
+        results = await self._coalesce(self._dois_in_flight, list(map(canonical_doi, dois)), self._fetch_dois)
+
+        publications = map(lambda doi: (doi, results.get(canonical_doi(doi))), dois)
+
+        return {doi: pub for doi, pub in publications if pub is not None}
+
+    async def resolve_orcids(self, orcids: List[str]) -> Dict[str, Dict]:
+        """
+        Resolves ORCIDs, coalescing them with concurrent requests for the same ORCIDs.
+
+        @param orcids: ORCIDs without base URL.
+        @return: Normalized profiles (id, givenName, familyName, dois) indexed by ORCID, ORCIDs that could not be resolved are omitted.
+        """
+
+        results = await self._coalesce(self._orcids_in_flight, orcids, self._fetch_orcids)
+
+        return {orcid: profile for orcid, profile in results.items() if profile is not None}
+
+    async def _handle_doi(self, request: web.Request) -> web.Response:
+        doi = request.match_info['doi']
+
+        resolved = await self.resolve_dois([doi])
+
+        if doi not in resolved:
+            raise web.HTTPNotFound(text=f'DOI could not be resolved: {doi}')
+
+        return web.json_response(resolved[doi], dumps=json_backend.dumps)
+
+    async def _handle_dois(self, request: web.Request) -> web.Response:
+        dois = await request.json(loads=json_backend.loads)
+
+        if not isinstance(dois, list) or not all(map(lambda doi: isinstance(doi, str), dois)):
+            raise web.HTTPBadRequest(text='expected a JSON array of DOIs')
+
+        return web.json_response(await self.resolve_dois(dois), dumps=json_backend.dumps)
+
+    async def _handle_orcid(self, request: web.Request) -> web.Response:
+        orcid = request.match_info['orcid']
+
+        resolved = await self.resolve_orcids([orcid])
+
+        if orcid not in resolved:
+            raise web.HTTPNotFound(text=f'ORCID could not be resolved: {orcid}')
+
+        return web.json_response(resolved[orcid], dumps=json_backend.dumps)
+
+    async def _handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response({'service': self._stats._asdict(),
+                                  'memos': {name: stats._asdict() for name, stats in get_memo_stats().items()}}, dumps=json_backend.dumps)
+
+    async def _session_context(self, app: web.Application) -> AsyncIterator[None]:
+        """
+        Opens the session shared by all requests and keeps the caches open on startup, closes them on cleanup.
+        """
+
+        keep_caches_open()
+
+        conn = TCPConnector(limit=self.resolver.concurrency)
+        time_out = ClientTimeout(total=60 * 60 * 24)
+        async with ClientSession(connector=conn, raise_for_status=True, timeout=time_out) as session:
+            self.resolver.session = session
+            yield
+            self.resolver.session = None
+
+        close_caches()
+
+        logging.info(f'{SERVICE} {self._stats}')
+
+    def make_app(self) -> web.Application:
+        """
+        Creates the web application with the routes:
+
+        - GET /doi/{doi}: the publication of a DOI
+        - POST /dois: the publications of a JSON array of DOIs, indexed by DOI
+        - GET /orcid/{orcid}: the normalized profile of an ORCID
+        - GET /stats: request, coalescing and memo statistics
+        """
+
+        app = web.Application()
+        app.add_routes([web.get('/doi/{doi:.+}', self._handle_doi),
+                        web.post('/dois', self._handle_dois),
+                        web.get('/orcid/{orcid}', self._handle_orcid),
+                        web.get('/stats', self._handle_stats)])
+        app.cleanup_ctx.append(self._session_context)
+
+        return app
+
+
+def usage() -> None:
+    print('Usage: ' + sys.argv[0] + ' [-r <cache_root>] [-c <cache_policy>] [--host <host>] [--port <port>] [--socket <path>]')
+    print('Serves resolved DOIs and ORCID profiles over HTTP.')
+    print('-r <cache_root>: directory the cache directories are created in, defaults to the working directory')
+    print('-c <cache_policy>: size limit in bytes and eviction policy of a cache directory relative to the cache root, may be repeated, e.g. Crossref:4e9:least-recently-used')
+    print('--host <host>, --port <port>: address to listen on, defaults to 127.0.0.1:8080')
+    print('--socket <path>: listen on a Unix socket instead')
+    exit(1)
+
+
+def main():
+    logging.basicConfig(filename='pid_resolver.log',
+                        filemode='a',
+                        format='%(module)s %(levelname)s: %(asctime)s %(message)s',
+                        datefmt='%H:%M:%S',
+                        encoding='utf-8',
+                        level=logging.DEBUG)
+
+    from .cli import parse_cache_policy
+
+    cache_root = Path('.')
+    host = '127.0.0.1'
+    port = 8080
+    socket_path = None
+    cache_policies = []
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "r:c:h", ["host=", "port=", "socket="])
+
+        for opt, arg in opts:
+            if opt in ['-r']:
+                cache_root = Path(arg)
+            elif opt in ['-c']:
+                # configured once the cache root is known
+                cache_policies.append(arg)
+            elif opt in ['--host']:
+                host = arg
+            elif opt in ['--port']:
+                port = int(arg)
+            elif opt in ['--socket']:
+                socket_path = arg
+            elif opt in ['-h']:
+                usage()
+
+        for cache_policy in cache_policies:
+            parse_cache_policy(cache_policy, cache_root)
+
+    except Exception as err:
+        print(err, file=sys.stderr)
+        usage()
+
+    service = ResolverService(Resolver(cache_root=cache_root))
+
+    if socket_path is not None:
+        web.run_app(service.make_app(), path=socket_path)
+    else:
+        web.run_app(service.make_app(), host=host, port=port)
+
+
+__all__ = ['ResolverService', 'ServiceStats']
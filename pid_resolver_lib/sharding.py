@@ -0,0 +1,391 @@
+#  Copyright 2024 Switch
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import asyncio
+import getopt
+import hashlib
+import logging
+import sqlite3
+import sys
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Set
+
+from . import json_backend
+from .cache_handler import get_keys
+from .doi_ra_handler import RAs
+from .pid_analyzer import OrcidProfile, PublicationInfo, get_orcids_from_resolved_dois
+from .resolver import Resolver, canonical_doi
+from .doi_reader import read_doi_file
+from .snapshot import write_snapshot, get_snapshot_file
+
+SHARDING = 'SHARDING:'
+
+# kinds of queued items
+DOI = 'doi'
+ORCID = 'orcid'
+
+# states of queued items
+PENDING = 'pending'
+CLAIMED = 'claimed'
+DONE = 'done'
+FAILED = 'failed'
+
+logger = logging.getLogger(__name__)
+
+
+class QueueConfig(NamedTuple):
+    """
+    Represents the configuration of a sharded crawl, shared by all workers.
+    """
+
+    number_of_shards: int # 0
+    number_of_iterations: int # 1
+
+
+def shard_of(pid: str, number_of_shards: int) -> int:
+    """
+    Returns the shard a DOI or ORCID is assigned to. The assignment is stable across processes and machines.
+
+    @param pid: The DOI or ORCID without base URL.
+    @param number_of_shards: The number of shards.
+    """
+
+    return int.from_bytes(hashlib.blake2b(pid.encode('utf-8'), digest_size=8).digest(), 'big') % number_of_shards
+
+
+def get_shard_dir(cache_root: Path, shard: int) -> Path:
+    """
+    Returns the cache root of a shard.
+
+    @param cache_root: Directory containing the cache roots of all shards.
+    @param shard: The shard.
+    """
+    return cache_root / f'shard-{shard}'
+
+
+class WorkQueue:
+    """
+    A work queue shared by the workers of a sharded crawl, stored in a SQLite database.
+
+    Each DOI and ORCID is queued once over the whole crawl, so the queue also records which PIDs have been visited.
+    """
+
+    def __init__(self, queue_file: Path):
+        """
+        @param queue_file: The SQLite database file, created if it does not exist.
+        """
+
+        # autocommit mode, transactions are started explicitly where several statements must be atomic
+        self._con = sqlite3.connect(str(queue_file), timeout=60, isolation_level=None)
+        self._con.execute('PRAGMA journal_mode=WAL')
+        self._con.execute('CREATE TABLE IF NOT EXISTS config (key TEXT PRIMARY KEY, value TEXT)')
+        self._con.execute('CREATE TABLE IF NOT EXISTS items (kind TEXT, pid TEXT, shard INTEGER, iteration INTEGER, status TEXT, '
+                          'PRIMARY KEY (kind, pid))')
+        self._con.execute('CREATE INDEX IF NOT EXISTS items_by_shard ON items (kind, shard, iteration, status)')
+
+    def close(self) -> None:
+        self._con.close()
+
+    @contextmanager
+    def _transaction(self) -> Iterator[None]:
+        # takes the write lock immediately, so claims of concurrent workers do not overlap
+        self._con.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except Exception:
+            self._con.execute('ROLLBACK')
+            raise
+
+        self._con.execute('COMMIT')
+
+    def initialize(self, config: QueueConfig) -> None:
+        """
+        Stores the configuration of the crawl. A queue can only be initialized once.
+        """
+
+        if self.get_config() is not None:
+            raise ValueError('work queue has already been initialized')
+
+        self._con.executemany('INSERT INTO config VALUES (?, ?)', config._asdict().items())
+
+    def get_config(self) -> Optional[QueueConfig]:
+        config = dict(self._con.execute('SELECT key, value FROM config').fetchall())
+
+        if len(config) == 0:
+            return None
+
+        return QueueConfig(**dict(map(lambda item: (item[0], int(item[1])), config.items())))
+
+    def _get_number_of_shards(self) -> int:
+        config = self.get_config()
+
+        if config is None:
+            raise ValueError('work queue has not been initialized')
+
+        return config.number_of_shards
+
+    def enqueue(self, kind: str, pids: Iterable[str], iteration: int) -> int:
+        """
+        Queues DOIs or ORCIDs for an iteration, assigning each to its shard. PIDs queued before are ignored.
+
+        @param kind: DOI or ORCID.
+        @param pids: PIDs without base URL.
+        @param iteration: The iteration the PIDs are to be resolved in.
+        @return: The number of newly queued PIDs.
+        """
+
+        number_of_shards = self._get_number_of_shards()
+
+        rows = list(map(lambda pid: (kind, pid, shard_of(pid, number_of_shards), iteration, PENDING), dict.fromkeys(pids)))
+
+        before = self._con.total_changes
+        with self._transaction():
+            self._con.executemany('INSERT OR IGNORE INTO items VALUES (?, ?, ?, ?, ?)', rows)
+
+        return self._con.total_changes - before
+
+    def claim(self, kind: str, shard: int, iteration: int, limit: int) -> List[str]:
+        """
+        Claims pending PIDs of a shard and iteration.
+
+        @param kind: DOI or ORCID.
+        @param shard: The worker's shard.
+        @param iteration: The current iteration.
+        @param limit: Maximum number of PIDs to claim.
+        @return: The claimed PIDs, empty if none are pending.
+        """
+
+        with self._transaction():
+            pids = list(map(lambda row: row[0], self._con.execute(
+                'SELECT pid FROM items WHERE kind = ? AND shard = ? AND iteration = ? AND status = ? LIMIT ?',
+                (kind, shard, iteration, PENDING, limit)).fetchall()))
+
+            self._con.executemany('UPDATE items SET status = ? WHERE kind = ? AND pid = ?', map(lambda pid: (CLAIMED, kind, pid), pids))
+
+        return pids
+
+    def complete(self, kind: str, pids: List[str], failed: Iterable[str] = ()) -> None:
+        """
+        Marks claimed PIDs as done.
+
+        @param kind: DOI or ORCID.
+        @param pids: The claimed PIDs.
+        @param failed: PIDs among them that could not be resolved.
+        """
+
+        failed_pids = set(failed)
+
+        with self._transaction():
+            self._con.executemany('UPDATE items SET status = ? WHERE kind = ? AND pid = ?',
+                                  map(lambda pid: (FAILED if pid in failed_pids else DONE, kind, pid), pids))
+
+    def release_claims(self, shard: int) -> int:
+        """
+        Makes the PIDs claimed by a shard pending again, e.g., when its worker is restarted after a crash.
+
+        @return: The number of released PIDs.
+        """
+
+        return self._con.execute('UPDATE items SET status = ? WHERE shard = ? AND status = ?', (PENDING, shard, CLAIMED)).rowcount
+
+    def count_unfinished(self, kind: str, iteration: int) -> int:
+        """
+        Returns the number of PIDs of an iteration that are pending or claimed on any shard.
+        """
+
+        return self._con.execute('SELECT COUNT(*) FROM items WHERE kind = ? AND iteration = ? AND status IN (?, ?)',
+                                 (kind, iteration, PENDING, CLAIMED)).fetchone()[0]
+
+    def count_by_status(self) -> Dict[str, int]:
+        return dict(self._con.execute('SELECT status, COUNT(*) FROM items GROUP BY status').fetchall())
+
+    async def wait_for(self, kind: str, iteration: int, poll_interval: float = 5) -> None:
+        """
+        Waits until all shards have finished the PIDs of an iteration.
+        """
+
+        while self.count_unfinished(kind, iteration) > 0:
+            await asyncio.sleep(poll_interval)
+
+
+async def run_worker(queue: WorkQueue, shard: int, cache_root: Path, batch_size: int = 500, poll_interval: float = 5,
+                     resolver: Optional[Resolver] = None) -> None:
+    """
+    Runs the crawl for a shard: resolves the shard's DOIs and ORCIDs iteration by iteration and queues the ORCIDs and DOIs found.
+    All workers finish the DOIs of an iteration before the ORCIDs are resolved and vice versa.
+    A worker that is restarted continues where it stopped.
+
+    @param queue: The shared work queue.
+    @param shard: The worker's shard.
+    @param cache_root: Directory containing the cache roots of all shards.
+    @param batch_size: Number of PIDs claimed at once.
+    @param poll_interval: Seconds to wait between checking whether the other shards have finished an iteration.
+    @param resolver: The resolver to be used, writes to the shard's cache root if not given.
+    """
+
+    config = queue.get_config()
+
+    if config is None:
+        raise ValueError('work queue has not been initialized')
+
+    if resolver is None:
+        resolver = Resolver(cache_root=get_shard_dir(cache_root, shard))
+
+    released = queue.release_claims(shard)
+    if released > 0:
+        logging.info(f'{SHARDING} shard {shard} released {released} claims')
+
+    # the shard's caches are scanned once, the keys cached by each batch are added
+    cached_dois: Set[str] = set().union(*map(lambda ra: set(get_keys(resolver.get_cache_dir(ra))), RAs))
+    cached_orcids: Set[str] = set(get_keys(resolver.orcid_cache_dir))
+
+    for iteration in range(1, config.number_of_iterations + 1):
+        logging.info(f'{SHARDING} shard {shard} iteration {iteration}')
+
+        while True:
+            dois = queue.claim(DOI, shard, iteration, batch_size)
+            if len(dois) == 0:
+                break
+
+            await resolver.fetch_dois(dois)
+
+            # only DOIs not cached before the batch are looked up
+            failed_dois = resolver.dois_not_in_cache(list(filter(lambda doi: doi not in cached_dois, dois)))
+            cached_dois.update(set(dois) - set(failed_dois))
+
+            # ORCIDs are resolved by the shard they are assigned to
+            orcids = get_orcids_from_resolved_dois(resolver.analyze(list(set(dois) - set(failed_dois))))
+            queue.enqueue(ORCID, orcids, iteration)
+
+            queue.complete(DOI, dois, failed_dois)
+
+        await queue.wait_for(DOI, iteration, poll_interval)
+
+        while True:
+            orcids = queue.claim(ORCID, shard, iteration, batch_size)
+            if len(orcids) == 0:
+                break
+
+            dois_to_harvest = await resolver.expand_orcids(orcids)
+
+            # DOIs listed in the profiles are resolved in the next iteration
+            queue.enqueue(DOI, map(canonical_doi, dois_to_harvest), iteration + 1)
+
+            failed_orcids = resolver.orcids_not_in_cache(list(filter(lambda orcid: orcid not in cached_orcids, orcids)))
+            cached_orcids.update(set(orcids) - set(failed_orcids))
+
+            queue.complete(ORCID, orcids, failed_orcids)
+
+        await queue.wait_for(ORCID, iteration, poll_interval)
+
+    logging.info(f'{SHARDING} shard {shard} finished: {queue.count_by_status()}')
+
+
+def merge_shards(cache_root: Path, number_of_shards: int) -> Dict[str, PublicationInfo]:
+    """
+    Analyzes the DOIs of all shards, matching their authors against the ORCID profiles of all shards.
+
+    @param cache_root: Directory containing the cache roots of all shards.
+    @param number_of_shards: The number of shards.
+    @return: Publications indexed by DOI.
+    """
+
+    resolvers = list(map(lambda shard: Resolver(cache_root=get_shard_dir(cache_root, shard)), range(number_of_shards)))
+
+    # the profiles listing a DOI may have been fetched by any shard
+    orcids_grouped_by_doi: Dict[str, List[OrcidProfile]] = {}
+    for resolver in resolvers:
+        for doi, profiles in resolver.get_orcids_grouped_by_doi().items():
+            orcids_grouped_by_doi.setdefault(doi, []).extend(profiles)
+
+    resolved_dois: Dict[str, PublicationInfo] = {}
+    for resolver in resolvers:
+        resolved_dois.update(resolver.analyze(orcids_grouped_by_doi=orcids_grouped_by_doi))
+
+    return resolved_dois
+
+
+def usage() -> None:
+    print('Usage: ' + sys.argv[0] + ' init -q <queue_file> -d <doi_input_file> -n <number_of_shards> -i <number_of_iterations>')
+    print('       ' + sys.argv[0] + ' work -q <queue_file> -s <shard> [-r <cache_root>]')
+    print('       ' + sys.argv[0] + ' merge -q <queue_file> [-r <cache_root>] [--snapshot]')
+    print('Crawls DOIs and related ORCIDs with several workers sharing a work queue.')
+    print('init: creates the work queue and queues the DOIs from a JSON file for the first iteration')
+    print('work: runs the worker of a shard (0 to number_of_shards - 1), start one worker per shard')
+    print('merge: analyzes the DOIs of all shards and writes results.json (working directory)')
+    print('-r <cache_root>: directory the shards\' cache directories are created in, defaults to the working directory')
+    print('--snapshot: also write results.snapshot, a binary snapshot of results.json that loads faster')
+    exit(1)
+
+
+def main():
+    logging.basicConfig(filename='pid_resolver.log',
+                        filemode='a',
+                        format='%(module)s %(levelname)s: %(asctime)s %(message)s',
+                        datefmt='%H:%M:%S',
+                        encoding='utf-8',
+                        level=logging.DEBUG)
+
+    if len(sys.argv) < 2 or sys.argv[1] not in ['init', 'work', 'merge']:
+        usage()
+
+    command = sys.argv[1]
+    options: Dict[str, str] = {}
+
+    try:
+        opts, args = getopt.getopt(sys.argv[2:], "q:d:n:i:s:r:", ["snapshot"])
+        options = dict(opts)
+        queue_file = Path(options['-q'])
+        cache_root = Path(options.get('-r', '.'))
+
+        if command == 'init':
+            dois = read_doi_file(Path(options['-d']))
+
+            config = QueueConfig(number_of_shards=int(options['-n']), number_of_iterations=int(options['-i']))
+
+    except Exception as err:
+        print(err, file=sys.stderr)
+        usage()
+
+    queue = WorkQueue(queue_file)
+
+    if command == 'init':
+        queue.initialize(config)
+        print(f'queued DOIs: {queue.enqueue(DOI, dois, 1)}')
+
+    elif command == 'work':
+        asyncio.run(run_worker(queue, int(options['-s']), cache_root))
+        print(f'queue: {queue.count_by_status()}')
+
+    elif command == 'merge':
+        queue_config = queue.get_config()
+        if queue_config is None:
+            print(f'{queue_file} has not been initialized', file=sys.stderr)
+            usage()
+        else:
+            resolved_dois = merge_shards(cache_root, queue_config.number_of_shards)
+
+            with open('results.json', 'w') as f:
+                f.write(json_backend.dumps(resolved_dois))
+
+            if '--snapshot' in options:
+                write_snapshot(resolved_dois, get_snapshot_file(Path('results.json')))
+
+            print(f'merged DOIs: {len(resolved_dois)}, queue: {queue.count_by_status()}')
+
+    queue.close()
+
+
+__all__ = ['WorkQueue', 'QueueConfig', 'shard_of', 'get_shard_dir', 'run_worker', 'merge_shards']
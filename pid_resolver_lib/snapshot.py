@@ -0,0 +1,300 @@
+#  Copyright 2024 Switch
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import gc
+import logging
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from functools import partial
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Tuple
+
+from .pid_analyzer import AuthorInfo, PublicationInfo, parse_resolved_dois_from_json
+
+SNAPSHOT = 'SNAPSHOT:'
+
+logger = logging.getLogger(__name__)
+
+'''
+A snapshot stores resolved DOIs in a binary file that is memory-mapped when read:
+
+- header: magic, byte order, number of strings, publications, authors and RORs, length of the string table
+- string offsets (uint64): start of each string in the string table, followed by the end of the table
+- publications (4 x uint32): DOI, title, index of the first author, number of authors
+- authors (6 x uint32): given name, family name, ORCID, origin of the ORCID, index of the first ROR, number of RORs
+- RORs (uint32)
+- string table: distinct UTF-8 encoded strings, each terminated by a null byte
+
+Strings are referenced by their index. The first string is empty and represents None.
+An author without RORs (None) is represented by NO_ROR as the index of the first ROR.
+Integers are stored in the byte order of the machine that wrote the snapshot.
+'''
+
+SNAPSHOT_MAGIC = b'PIDSNAP1'
+
+_HEADER = struct.Struct('<8sc7xQQQQQ')
+
+NONE = 0
+
+NO_ROR = 0xFFFFFFFF
+
+_PUBLICATION_FIELDS = 4
+_AUTHOR_FIELDS = 6
+
+
+def get_snapshot_file(results_json: Path) -> Path:
+    """
+    Returns the snapshot file written alongside a results file, e.g., results.snapshot for results.json.
+    """
+    return results_json.with_suffix('.snapshot')
+
+
+def write_snapshot(resolved_dois: Mapping[str, PublicationInfo], snapshot_file: Path) -> None:
+    """
+    Writes resolved DOIs to a snapshot. The snapshot is written to a temporary file that replaces the snapshot file.
+
+    @param resolved_dois: Publications indexed by DOI.
+    @param snapshot_file: The snapshot file.
+    """
+
+    # distinct strings by index, names and ORCIDs repeat across publications
+    strings: Dict[Optional[str], int] = {None: NONE}
+
+    def string_id(value: Optional[str]) -> int:
+        return strings.setdefault(value, len(strings))
+
+    publications = array('I')
+    authors = array('I')
+    rors = array('I')
+
+    for pub in resolved_dois.values():
+        publications.extend((string_id(pub.doi), string_id(pub.title), len(authors) // _AUTHOR_FIELDS, len(pub.authors)))
+
+        for author in pub.authors:
+            authors.extend((string_id(author.given_name), string_id(author.family_name), string_id(author.orcid),
+                            string_id(author.origin_orcid), NO_ROR if author.ror is None else len(rors),
+                            0 if author.ror is None else len(author.ror)))
+
+            if author.ror is not None:
+                rors.extend(map(string_id, author.ror))
+
+    encoded = list(map(lambda value: ('' if value is None else value).encode('utf-8') + b'\0', strings))
+
+    offsets = array('Q', [0])
+    for value in encoded:
+        offsets.append(offsets[-1] + len(value))
+
+    header = _HEADER.pack(SNAPSHOT_MAGIC, b'l' if sys.byteorder == 'little' else b'b', len(strings),
+                          len(publications) // _PUBLICATION_FIELDS, len(authors) // _AUTHOR_FIELDS, len(rors), offsets[-1])
+
+    with tempfile.NamedTemporaryFile('wb', dir=snapshot_file.parent, prefix=f'.{snapshot_file.name}.', delete=False) as f:
+        tmp_file = f.name
+        try:
+            f.write(header)
+            offsets.tofile(f)
+            publications.tofile(f)
+            authors.tofile(f)
+            rors.tofile(f)
+            f.writelines(encoded)
+            f.flush()
+            os.fsync(f.fileno())
+        except Exception:
+            os.remove(tmp_file)
+            raise
+
+    os.replace(tmp_file, snapshot_file)
+
+    logging.info(f'{SNAPSHOT} wrote {len(resolved_dois)} publications and {len(strings) - 1} strings to {snapshot_file}')
+
+
+class PublicationSnapshot(Mapping[str, PublicationInfo]):
+    """
+    A snapshot opened for reading. Publications are decoded from the memory-mapped file when they are accessed,
+    use to_dict to decode all of them at once.
+    """
+
+    def __init__(self, snapshot_file: Path):
+        """
+        @param snapshot_file: The snapshot file.
+        """
+
+        with open(snapshot_file, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, byte_order, self._number_of_strings, self._number_of_publications, number_of_authors, number_of_rors, \
+            table_length = _HEADER.unpack_from(self._mm)
+
+        if magic != SNAPSHOT_MAGIC:
+            self._mm.close()
+            raise ValueError(f'{snapshot_file} is not a snapshot')
+
+        self._swap = byte_order != (b'l' if sys.byteorder == 'little' else b'b')
+        self._views: List[memoryview] = []
+
+        offset = _HEADER.size
+        self._offsets, offset = self._int_array('Q', offset, self._number_of_strings + 1)
+        self._publications, offset = self._int_array('I', offset, self._number_of_publications * _PUBLICATION_FIELDS)
+        self._authors, offset = self._int_array('I', offset, number_of_authors * _AUTHOR_FIELDS)
+        self._rors, offset = self._int_array('I', offset, number_of_rors)
+        self._table = offset
+        self._table_length = table_length
+
+        self._index: Optional[Dict[str, int]] = None
+
+    def _int_array(self, typecode: str, offset: int, length: int) -> Tuple[Any, int]:
+        end = offset + length * array(typecode).itemsize
+
+        view = memoryview(self._mm)[offset:end]
+
+        if not self._swap:
+            # no copy, the integers are read from the mapped file
+            integers = view.cast(typecode)  # type: ignore[call-overload]
+            self._views.extend([view, integers])
+            return integers, end
+
+        swapped = array(typecode)
+        swapped.frombytes(view)
+        swapped.byteswap()
+        view.release()
+
+        return swapped, end
+
+    def close(self) -> None:
+        # views into the mapped file have to be released before it can be closed
+        for view in reversed(self._views):
+            view.release()
+
+        self._views = []
+        self._mm.close()
+
+    def __enter__(self) -> 'PublicationSnapshot':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def _string(self, string_id: int) -> Any:
+        if string_id == NONE:
+            return None
+
+        # the end offset includes the null byte terminating the string
+        return self._mm[self._table + self._offsets[string_id]:self._table + self._offsets[string_id + 1] - 1].decode('utf-8')
+
+    def _publication(self, idx: int) -> PublicationInfo:
+        doi, title, first_author, number_of_authors = self._publications[idx * _PUBLICATION_FIELDS:(idx + 1) * _PUBLICATION_FIELDS]
+
+        authors = []
+        for author_idx in range(first_author, first_author + number_of_authors):
+            given_name, family_name, orcid, origin_orcid, first_ror, number_of_rors = \
+                self._authors[author_idx * _AUTHOR_FIELDS:(author_idx + 1) * _AUTHOR_FIELDS]
+
+            ror = None if first_ror == NO_ROR else list(map(self._string, self._rors[first_ror:first_ror + number_of_rors]))
+
+            authors.append(AuthorInfo(self._string(given_name), self._string(family_name), self._string(orcid), self._string(origin_orcid), ror))
+
+        return PublicationInfo(self._string(doi), self._string(title), authors)
+
+    def _get_index(self) -> Dict[str, int]:
+        if self._index is None:
+            self._index = {self._string(self._publications[idx * _PUBLICATION_FIELDS]): idx for idx in range(self._number_of_publications)}
+
+        return self._index
+
+    def __getitem__(self, doi: str) -> PublicationInfo:
+        return self._publication(self._get_index()[doi])
+
+    def __contains__(self, doi: object) -> bool:
+        return doi in self._get_index()
+
+    def __iter__(self) -> Iterator[str]:
+        return map(lambda idx: self._string(self._publications[idx * _PUBLICATION_FIELDS]), range(self._number_of_publications))
+
+    def __len__(self) -> int:
+        return self._number_of_publications
+
+    def _decode_strings(self) -> List[Optional[str]]:
+        table: List[Optional[str]] = list(self._mm[self._table:self._table + self._table_length].decode('utf-8').split('\0')[:-1])
+
+        # strings containing null bytes are decoded one by one
+        if len(table) != self._number_of_strings:
+            return list(map(self._string, range(self._number_of_strings)))
+
+        table[NONE] = None
+
+        return table
+
+    def to_dict(self) -> Dict[str, PublicationInfo]:
+        """
+        Decodes all publications. Each section is decoded at once instead of publication by publication.
+        """
+
+        # allocating many tuples triggers the cyclic garbage collector over and over, although they do not form reference cycles
+        gc_enabled = gc.isenabled()
+        gc.disable()
+
+        try:
+            return self._decode_publications()
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def _decode_publications(self) -> Dict[str, PublicationInfo]:
+        strings: List[Any] = self._decode_strings()
+        string = strings.__getitem__
+
+        authors = self._authors.tolist()
+        rors = list(map(string, self._rors.tolist()))
+
+        author_rors = map(lambda first_ror, number_of_rors: None if first_ror == NO_ROR else rors[first_ror:first_ror + number_of_rors],
+                          authors[4::_AUTHOR_FIELDS], authors[5::_AUTHOR_FIELDS])
+
+        # tuple.__new__ skips the constructor of the named tuple, the fields are given in order
+        author_infos: List[AuthorInfo] = list(map(partial(tuple.__new__, AuthorInfo),
+                                                  zip(map(string, authors[0::_AUTHOR_FIELDS]), map(string, authors[1::_AUTHOR_FIELDS]),
+                                                      map(string, authors[2::_AUTHOR_FIELDS]), map(string, authors[3::_AUTHOR_FIELDS]),
+                                                      author_rors)))
+
+        publications = self._publications.tolist()
+
+        return dict(map(lambda doi, title, first_author, number_of_authors:
+                        (doi, PublicationInfo(doi, title, author_infos[first_author:first_author + number_of_authors])),
+                        map(string, publications[0::_PUBLICATION_FIELDS]), map(string, publications[1::_PUBLICATION_FIELDS]),
+                        publications[2::_PUBLICATION_FIELDS], publications[3::_PUBLICATION_FIELDS]))
+
+
+def open_snapshot(snapshot_file: Path) -> PublicationSnapshot:
+    return PublicationSnapshot(snapshot_file)
+
+
+def load_resolved_dois(results_json: Path) -> Dict[str, PublicationInfo]:
+    """
+    Loads resolved DOIs from the snapshot written alongside a results file if it is up to date, from the results file otherwise.
+
+    @param results_json: Path to JSON representing resolved DOIs.
+    """
+
+    snapshot_file = get_snapshot_file(results_json)
+
+    if snapshot_file.is_file() and (not results_json.is_file() or snapshot_file.stat().st_mtime >= results_json.stat().st_mtime):
+        with open_snapshot(snapshot_file) as snapshot:
+            return snapshot.to_dict()
+
+    return parse_resolved_dois_from_json(results_json)
+
+
+__all__ = ['write_snapshot', 'open_snapshot', 'load_resolved_dois', 'get_snapshot_file', 'PublicationSnapshot']
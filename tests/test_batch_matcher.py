@@ -0,0 +1,80 @@
+#  Copyright 2024 Switch
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import random
+import unittest
+from typing import Any, List
+
+from pid_resolver_lib.batch_matcher import is_available, match_authors, match_orcid_profiles_batch
+from pid_resolver_lib.pid_analyzer import PublicationInfo, AuthorInfo, OrcidProfile, match_orcid_profiles
+
+GIVEN_NAMES = ['José María', 'Jose', 'J. M.', 'J', 'j.', 'Maria', 'María José', 'M.', 'Irina-Afrodita', 'Irina', 'I A', '', ' ', 'Jo', 'J M']
+# None occurs in records without family name, although AuthorInfo declares str
+FAMILY_NAMES: List[Any] = ['Ortuño', 'Ortuno', 'ORTUNO', 'Ortuño Sánchez', 'Di Nucci', 'Nucci', 'van der Berg', 'Berg', 'de la Cruz', 'Cruz', '', None]
+
+
+def _profile(idx, given_name, family_name):
+    return OrcidProfile(f'https://orcid.org/0000-0000-0000-{idx:04d}', given_name, family_name)
+
+
+@unittest.skipIf(not is_available(), 'numpy is not installed')
+class TestBatchMatcher(unittest.TestCase):
+
+    def test_identical_to_match_orcid_profiles(self):
+        rng = random.Random(42)
+
+        for pub_idx in range(300):
+            profiles = [_profile(idx, rng.choice(GIVEN_NAMES), rng.choice(FAMILY_NAMES)) for idx in range(rng.randint(0, 40))]
+            authors = [AuthorInfo(rng.choice(GIVEN_NAMES), rng.choice(FAMILY_NAMES), rng.choice([None, None, None, '0000-0001-0000-0000']),
+                                  rng.choice([None, 'doi']), None) for _ in range(rng.randint(0, 15))]
+
+            pub = PublicationInfo(f'10.1/{pub_idx}', None, authors)
+            orcid_info = {pub.doi: profiles}
+
+            assert match_orcid_profiles_batch(pub, orcid_info, min_profiles=0) == match_orcid_profiles(pub, orcid_info), pub
+
+    def test_match_authors(self):
+        profiles = [_profile(1, 'José María', 'Ortuño'), _profile(2, 'Juan', 'Ortuno'), _profile(3, 'Irina-Afrodita', 'Di Nucci')]
+
+        authors = [AuthorInfo('José', 'Ortuño', None, None, None),
+                   AuthorInfo('J.', 'ORTUNO', None, None, None),
+                   AuthorInfo('Irina', 'Nucci', None, None, None),
+                   AuthorInfo('Irina Afrodita', 'Di Nucci', None, None, None),
+                   AuthorInfo('Gregorio', 'Tirado', '0000-0002-1871-7822', 'doi', None)]
+
+        result = match_authors(authors, profiles)
+
+        assert result.authors[0].orcid == '0000-0000-0000-0001'
+        assert result.authors[0].origin_orcid == 'orcid'
+        # "J." is an abbreviation of both "José María" and "Juan"
+        assert result.authors[1].orcid is None
+        assert result.ambiguous == [1]
+        # both forms of the name match the same profile (many-to-one)
+        assert result.authors[2].orcid == '0000-0000-0000-0003'
+        assert result.authors[3].orcid == '0000-0000-0000-0003'
+        assert result.shared == {'0000-0000-0000-0003': [2, 3]}
+        # ORCIDs from the DOI metadata are kept
+        assert result.authors[4] == authors[4]
+
+    def test_min_profiles(self):
+        pub = PublicationInfo('10.1/1', None, [AuthorInfo('J.', 'Ortuño', None, None, None)])
+        orcid_info = {'10.1/1': [_profile(1, 'José', 'Ortuño')]}
+
+        assert match_orcid_profiles_batch(pub, orcid_info) == match_orcid_profiles(pub, orcid_info)
+        assert match_orcid_profiles_batch(pub, {}, min_profiles=0) == match_orcid_profiles(pub, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+#  Copyright 2024 Switch
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import json
+import re
+import tempfile
+import unittest
+from pathlib import Path
+
+from aioresponses import aioresponses
+
+from pid_resolver_lib.bulk_fetch import fetch_records_bulk
+from pid_resolver_lib.cache_handler import get_keys
+from pid_resolver_lib.pid_analyzer import normalize_doi_record_crossref, normalize_doi_record_datacite
+from pid_resolver_lib.resolver import Resolver
+
+CROSSREF_API = re.compile(r'^https://api\.crossref\.org/works\?.*$')
+DATACITE_API = re.compile(r'^https://api\.datacite\.org/dois\?.*$')
+
+
+class TestBulkFetch(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+        with open('tests/testdata/crossref_test.xml') as f:
+            self.crossref_xml = f.read()
+
+        with open('tests/testdata/crossref_rest_test.json') as f:
+            self.crossref_rest_json = f.read()
+
+        with open('tests/testdata/datacite_rest_test.json') as f:
+            self.datacite_rest_json = f.read()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    async def test_fetch_crossref(self):
+        resolver = Resolver(cache_root=Path(self.tmp_dir.name), bulk_fetch=True)
+
+        with aioresponses() as mocked:
+            mocked.get('https://doi.org/ra/10.2196', status=200, body=json.dumps([{'DOI': '10.2196', 'RA': 'Crossref'}]))
+            mocked.get(CROSSREF_API, status=200, body=self.crossref_rest_json)
+            # DOIs unknown to the API or not expressible in a query are fetched using content negotiation
+            mocked.get('https://doi.org/10.2196/unknown', status=404)
+            mocked.get('https://doi.org/10.2196/a,b', status=200, body=self.crossref_xml)
+
+            await resolver.fetch_dois(['10.2196/38754', '10.2196/unknown', '10.2196/a,b'])
+
+            bulk_requests = [url for method, url in mocked.requests if url.host == 'api.crossref.org']
+            assert len(bulk_requests) == 1
+            assert set(bulk_requests[0].query['filter'].split(',')) == {'doi:10.2196/38754', 'doi:10.2196/unknown'}
+
+        assert set(get_keys(resolver.get_cache_dir('Crossref'))) == {'10.2196/38754', '10.2196/a,b'}
+
+        pubs = resolver.analyze(['10.2196/38754', '10.2196/a,b'])
+
+        # the publication is equal to the one normalized from the RDF/XML representation
+        assert pubs['10.2196/38754'] == normalize_doi_record_crossref('10.2196/38754', self.crossref_xml)
+        assert pubs['10.2196/a,b'].authors == pubs['10.2196/38754'].authors
+
+    async def test_fetch_datacite(self):
+        cache_dir = Path(self.tmp_dir.name) / 'DataCite'
+
+        with aioresponses() as mocked:
+            mocked.get(DATACITE_API, status=200, body=self.datacite_rest_json, repeat=True)
+
+            # the API returns DOIs in lower case, records are cached under the requested DOIs
+            not_fetched = await fetch_records_bulk(['10.5281/ZENODO.7908081', '10.5281/zenodo.10124944', '10.5281/zenodo.1'], cache_dir,
+                                                   'DataCite', dois_per_request=2)
+
+            requests = [call.kwargs['params']['query'] for calls in mocked.requests.values() for call in calls]
+            assert requests == ['doi:("10.5281/zenodo.7908081" OR "10.5281/zenodo.10124944")', 'doi:("10.5281/zenodo.1")']
+
+        assert not_fetched == ['10.5281/zenodo.1']
+        assert set(get_keys(cache_dir)) == {'10.5281/ZENODO.7908081', '10.5281/zenodo.10124944'}
+
+        with open('tests/testdata/datacite_test.json') as f:
+            expected = normalize_doi_record_datacite('10.5281/zenodo.7908081', f.read())
+
+        # the resolver caches canonical DOIs, the DOI cached as requested is found after migrating the cache
+        resolver = Resolver(cache_root=Path(self.tmp_dir.name))
+        resolver.migrate_doi_caches()
+
+        assert resolver.analyze(['10.5281/ZENODO.7908081'])['10.5281/zenodo.7908081'] == expected
+
+    async def test_fetch_error(self):
+        cache_dir = Path(self.tmp_dir.name) / 'DataCite'
+
+        with aioresponses() as mocked:
+            mocked.get(DATACITE_API, status=500)
+
+            not_fetched = await fetch_records_bulk(['10.5281/zenodo.7908081', '10.5281/zenodo.10124944'], cache_dir, 'DataCite')
+
+        # all DOIs are left to be fetched using content negotiation
+        assert sorted(not_fetched) == ['10.5281/zenodo.10124944', '10.5281/zenodo.7908081']
+        assert list(get_keys(cache_dir)) == []
+
+
+if __name__ == '__main__':
+    unittest.main()
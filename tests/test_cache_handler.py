@@ -0,0 +1,155 @@
+#  Copyright 2024 Switch
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import tempfile
+import unittest
+from pathlib import Path
+
+from pid_resolver_lib import cache_handler, memo
+
+
+class TestCacheHandler(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = Path(self.tmp_dir.name) / 'Crossref'
+
+    def tearDown(self):
+        cache_handler.unpin_records(self.cache_dir)
+        cache_handler._cache_policies.clear()
+        cache_handler.reset_eviction_report()
+        cache_handler.close_caches()
+        self.tmp_dir.cleanup()
+
+    def test_read_records_from_cache(self):
+        cache_handler.write_records_to_cache([('1', 'one'), ('2', 'two')], 0, 1, self.cache_dir)
+
+        records = cache_handler.read_records_from_cache(['1', '2', '3'], self.cache_dir)
+
+        assert records == {'1': 'one', '2': 'two'}
+
+    def test_read_from_cache_memoized(self):
+        cache_handler.write_record_to_cache('1', 'one', self.cache_dir)
+
+        assert cache_handler.read_from_cache('1', self.cache_dir) == 'one'
+        hits = memo.RECORD_MEMO.stats().hits
+
+        assert cache_handler.read_from_cache('1', self.cache_dir) == 'one'
+        assert memo.RECORD_MEMO.stats().hits == hits + 1
+
+        # writing a record invalidates the memoized value
+        cache_handler.write_record_to_cache('1', 'updated', self.cache_dir)
+
+        assert cache_handler.read_from_cache('1', self.cache_dir) == 'updated'
+
+    def test_keep_caches_open(self):
+        cache_handler.keep_caches_open()
+
+        cache_handler.write_record_to_cache('1', 'one', self.cache_dir)
+
+        with cache_handler._open_cache(self.cache_dir) as first, cache_handler._open_cache(self.cache_dir) as second:
+            assert first is second
+
+        # the cache is reopened with a new policy
+        cache_handler.configure_cache(self.cache_dir, eviction_policy='least-recently-used')
+
+        with cache_handler._open_cache(self.cache_dir) as reopened:
+            assert reopened is not first
+            assert reopened.eviction_policy == 'least-recently-used'
+
+        assert cache_handler.get_keys(self.cache_dir) == ['1']
+
+        cache_handler.close_caches()
+
+        with cache_handler._open_cache(self.cache_dir) as closed:
+            assert closed is not reopened
+
+    def test_configure_cache_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            cache_handler.configure_cache(self.cache_dir, eviction_policy='random')
+
+    def test_evict_pinned(self):
+        # values are larger than diskcache's min file size and stored as files, so the volume is dominated by them
+        value = 'x' * 100000
+        cache_handler.configure_cache(self.cache_dir, size_limit=450000, eviction_policy='least-recently-stored')
+
+        cache_handler.pin_records(['0'], self.cache_dir)
+
+        for idx in range(6):
+            cache_handler.write_record_to_cache(str(idx), value, self.cache_dir)
+
+        keys = cache_handler.get_keys(self.cache_dir)
+
+        # the oldest record is pinned and must not be evicted
+        assert '0' in keys
+        assert '1' not in keys
+        assert cache_handler.get_eviction_report()[str(self.cache_dir)] == 6 - len(keys)
+
+    def test_pin_records_counted(self):
+        value = 'x' * 100000
+        cache_handler.configure_cache(self.cache_dir, size_limit=250000, eviction_policy='least-recently-stored')
+
+        # two requests share record '0'
+        cache_handler.pin_records(['0', '1'], self.cache_dir)
+        cache_handler.pin_records(['0'], self.cache_dir)
+
+        # the first request completes, the second still uses record '0'
+        cache_handler.unpin_records(self.cache_dir, ['0', '1'])
+
+        for idx in range(4):
+            cache_handler.write_record_to_cache(str(idx), value, self.cache_dir)
+
+        keys = cache_handler.get_keys(self.cache_dir)
+
+        assert '0' in keys
+        assert '1' not in keys
+
+        cache_handler.unpin_records(self.cache_dir, ['0'])
+
+        assert cache_handler._pinned_records[str(self.cache_dir)] == {}
+
+    def test_get_contained_keys(self):
+        cache_handler.write_records_to_cache([('1', 'one'), ('2', 'two')], 0, 1, self.cache_dir)
+
+        assert cache_handler.get_contained_keys(['1', '3'], self.cache_dir) == {'1'}
+
+    def test_evict_none(self):
+        value = 'x' * 100000
+        cache_handler.configure_cache(self.cache_dir, size_limit=200000, eviction_policy='none')
+
+        cache_handler.write_records_to_cache(list(map(lambda idx: (str(idx), value), range(5))), 0, 1, self.cache_dir)
+
+        assert len(cache_handler.get_keys(self.cache_dir)) == 5
+        assert cache_handler.get_eviction_report() == {}
+
+    def test_migrate_keys(self):
+        cache_handler.write_records_to_cache([('10.1/ABC', 'upper'), ('10.1/abc', 'lower'), ('10.1/Def', 'mixed'), ('10.1/DEF', 'upper'),
+                                              ('10.1/ghi', 'lower')], 0, 1, self.cache_dir)
+
+        # memoized records are invalidated
+        assert cache_handler.read_from_cache('10.1/ABC', self.cache_dir) == 'upper'
+
+        migrated = cache_handler.migrate_keys(self.cache_dir, str.lower)
+
+        assert migrated == {'10.1/ABC': '10.1/abc', '10.1/DEF': '10.1/def', '10.1/Def': '10.1/def'}
+
+        # a record cached under the canonical key is kept, otherwise the first one is moved
+        assert cache_handler.read_records_from_cache(['10.1/ABC', '10.1/abc', '10.1/def', '10.1/ghi'], self.cache_dir) == \
+               {'10.1/abc': 'lower', '10.1/def': 'upper', '10.1/ghi': 'lower'}
+
+        assert cache_handler.migrate_keys(self.cache_dir, str.lower) == {}
+
+        assert cache_handler.delete_records(['10.1/abc', '10.1/xyz'], self.cache_dir) == 1
+        assert sorted(cache_handler.get_keys(self.cache_dir)) == ['10.1/def', '10.1/ghi']
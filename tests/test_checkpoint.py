@@ -0,0 +1,192 @@
+#  Copyright 2024 Switch
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from pid_resolver_lib import cli
+from pid_resolver_lib.checkpoint import CrawlState, write_checkpoint, read_checkpoint
+from pid_resolver_lib.frontier import CrawlBudget, PriorityFrontier
+
+
+class TestCheckpoint(unittest.TestCase):
+
+    def test_write_read_checkpoint(self):
+        state = CrawlState(iteration=3, number_of_iterations=5, frontier=['10.1038/s41585-020-0355-3'],
+                           visited_dois=['10.1016/j.jaci.2020.11.032'], visited_orcids=['0000-0002-3671-895X'],
+                           failed_dois=['10.1/failed'], failed_orcids=[])
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            checkpoint_file = Path(tmp_dir) / 'checkpoint.json'
+
+            assert read_checkpoint(checkpoint_file) is None
+
+            write_checkpoint(state, checkpoint_file)
+            write_checkpoint(state._replace(iteration=4), checkpoint_file)
+
+            assert read_checkpoint(checkpoint_file) == state._replace(iteration=4)
+
+            # no temporary files are left behind
+            assert os.listdir(tmp_dir) == ['checkpoint.json']
+
+    def test_read_checkpoint_without_budget_usage(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            checkpoint_file = Path(tmp_dir) / 'checkpoint.json'
+
+            # written before the seed ORCIDs and the used budget were checkpointed
+            checkpoint_file.write_text('{"iteration": 1, "number_of_iterations": 2, "frontier": [], "visited_dois": [], '
+                                       '"visited_orcids": [], "failed_dois": [], "failed_orcids": []}')
+
+            state = read_checkpoint(checkpoint_file)
+
+            assert state is not None
+            assert state.seed_orcids == []
+            assert state.records_taken == 0
+
+    def test_write_checkpoint_failure(self):
+        state = CrawlState(iteration=1, number_of_iterations=2, frontier=[], visited_dois=[], visited_orcids=[],
+                           failed_dois=[], failed_orcids=[])
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            checkpoint_file = Path(tmp_dir) / 'checkpoint.json'
+
+            write_checkpoint(state, checkpoint_file)
+
+            # a crash while writing keeps the previous checkpoint intact
+            with mock.patch('pid_resolver_lib.checkpoint.os.fsync', side_effect=OSError('disk full')):
+                with self.assertRaises(OSError):
+                    write_checkpoint(state._replace(iteration=2), checkpoint_file)
+
+            assert read_checkpoint(checkpoint_file) == state
+            assert os.listdir(tmp_dir) == ['checkpoint.json']
+
+
+class TestResume(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+        self.resolver = mock.MagicMock()
+        # the crawl writes results and checkpoints to the cache root
+        self.resolver.cache_root = Path(self.tmp_dir.name)
+        self.resolver.fetch_dois = mock.AsyncMock()
+        self.resolver.analyze.return_value = {}
+        self.resolver.expand_orcids = mock.AsyncMock(return_value=[])
+        self.resolver.dois_not_in_cache.return_value = []
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    async def test_retry_failed_orcids(self):
+        state = CrawlState(iteration=1, number_of_iterations=3, frontier=['10.1/a'], visited_dois=[], visited_orcids=['0000-0000-0000-0001'],
+                           failed_dois=[], failed_orcids=['0000-0000-0000-0001'])
+
+        # the profile can be fetched in the first retry
+        self.resolver.orcids_not_in_cache.return_value = []
+
+        await cli.start([], 2, state, resolver=self.resolver)
+
+        self.resolver.expand_orcids.assert_awaited_once_with(['0000-0000-0000-0001'], False)
+
+        checkpoint = read_checkpoint(self.resolver.cache_root / cli.CHECKPOINT_FILE)
+
+        assert checkpoint is not None
+        assert checkpoint.failed_orcids == []
+
+    async def test_retry_failed_orcids_again(self):
+        state = CrawlState(iteration=0, number_of_iterations=2, frontier=['10.1/a'], visited_dois=[], visited_orcids=[],
+                           failed_dois=[], failed_orcids=['0000-0000-0000-0001'])
+
+        self.resolver.orcids_not_in_cache.side_effect = lambda orcids: list(orcids)
+
+        await cli.start([], 2, state, resolver=self.resolver)
+
+        # ORCIDs that still fail are retried in every iteration and kept in the checkpoint
+        assert self.resolver.expand_orcids.await_args_list == [mock.call(['0000-0000-0000-0001'], False)] * 2
+
+        checkpoint = read_checkpoint(self.resolver.cache_root / cli.CHECKPOINT_FILE)
+
+        assert checkpoint is not None
+        assert checkpoint.failed_orcids == ['0000-0000-0000-0001']
+
+    async def test_resume_priority_frontier(self):
+        state = CrawlState(iteration=1, number_of_iterations=3, frontier=['10.1/a', '10.1/b'], visited_dois=['10.1/seed'], visited_orcids=[],
+                           failed_dois=[], failed_orcids=[], seed_orcids=['0000-0000-0000-0001'], records_taken=2,
+                           requests_per_ra={'Crossref': 2}, elapsed_seconds=10)
+
+        self.resolver.orcids_not_in_cache.return_value = []
+        self.resolver.get_profile_dois.return_value = {}
+        self.resolver.get_ras = mock.AsyncMock(return_value={})
+
+        priority_frontier = PriorityFrontier(budget=CrawlBudget(max_records=3, max_records_per_iteration=None, max_requests_per_ra={},
+                                                                max_seconds=None))
+
+        await cli.start([], 3, state, resolver=self.resolver, priority_frontier=priority_frontier)
+
+        # one DOI is left of the record budget
+        assert priority_frontier.seed_orcids == frozenset(['0000-0000-0000-0001'])
+        self.resolver.fetch_dois.assert_awaited_once_with(['10.1/a'])
+
+        checkpoint = read_checkpoint(self.resolver.cache_root / cli.CHECKPOINT_FILE)
+
+        assert checkpoint is not None
+        assert checkpoint.iteration == 2
+        assert checkpoint.seed_orcids == ['0000-0000-0000-0001']
+        assert checkpoint.records_taken == 3
+        assert checkpoint.requests_per_ra == {'Crossref': 2}
+        assert checkpoint.elapsed_seconds >= 10
+
+    async def test_resume_ra_budget(self):
+        # 10.1/c was written by an older checkpoint without its entry
+        state = CrawlState(iteration=1, number_of_iterations=2, frontier=['10.1/a', '10.1/b', '10.1/c'], visited_dois=['10.1/seed'],
+                           visited_orcids=[], failed_dois=[], failed_orcids=[], seed_orcids=['0000-0000-0000-0001'], records_taken=1,
+                           requests_per_ra={'DataCite': 1}, elapsed_seconds=10,
+                           frontier_entries=[['10.1/a', 1, ['0000-0000-0000-0001'], 'DataCite'], ['10.1/b', 1, [], 'Crossref']])
+
+        self.resolver.orcids_not_in_cache.return_value = []
+        self.resolver.get_profile_dois.return_value = {}
+        self.resolver.get_ras = mock.AsyncMock(side_effect=lambda dois: {doi: 'DataCite' for doi in dois})
+
+        priority_frontier = PriorityFrontier(budget=CrawlBudget(max_records=None, max_records_per_iteration=None,
+                                                                max_requests_per_ra={'DataCite': 1}, max_seconds=None))
+
+        await cli.start([], 2, state, resolver=self.resolver, priority_frontier=priority_frontier)
+
+        # the DataCite request budget was used up before the crawl was interrupted
+        self.resolver.get_ras.assert_any_await(['10.1/c'])
+        self.resolver.fetch_dois.assert_awaited_once_with(['10.1/b'])
+
+        checkpoint = read_checkpoint(self.resolver.cache_root / cli.CHECKPOINT_FILE)
+
+        assert checkpoint is not None
+        assert checkpoint.requests_per_ra == {'DataCite': 1, 'Crossref': 1}
+        assert checkpoint.frontier_entries == [['10.1/a', 1, ['0000-0000-0000-0001'], 'DataCite'], ['10.1/c', 1, [], 'DataCite']]
+
+    async def test_output_dir(self):
+        output_dir = Path(self.tmp_dir.name) / 'output'
+        output_dir.mkdir()
+
+        self.resolver.orcids_not_in_cache.return_value = []
+
+        await cli.start(['10.1/a'], 1, resolver=self.resolver, output_dir=output_dir)
+
+        assert sorted(os.listdir(output_dir)) == [str(cli.CHECKPOINT_FILE), cli.RESULTS_FILE]
+
+
+if __name__ == '__main__':
+    unittest.main()
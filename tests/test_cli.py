@@ -0,0 +1,51 @@
+#  Copyright 2024 Switch
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from pid_resolver_lib import cache_handler, cli
+from pid_resolver_lib.cache_handler import CachePolicy
+from pid_resolver_lib.resolver import Resolver
+
+
+class TestCli(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_root = Path(self.tmp_dir.name)
+
+    def tearDown(self):
+        cache_handler._cache_policies.clear()
+        cache_handler.close_caches()
+        self.tmp_dir.cleanup()
+
+    def test_cache_policy_with_cache_root(self):
+        # the policy is given before the cache root it is relative to
+        argv = ['pid_resolver', '-c', 'Crossref:1e6:none', '-r', str(self.cache_root), '--migrate-cache']
+
+        with mock.patch('sys.argv', argv), mock.patch('logging.basicConfig'):
+            cli.main()
+
+        resolver = Resolver(self.cache_root)
+
+        assert cache_handler.get_cache_policy(resolver.get_cache_dir('Crossref')) == CachePolicy(1000000, 'none')
+        assert cache_handler.get_cache_policy(resolver.get_cache_dir('DataCite')) == CachePolicy()
+
+
+if __name__ == '__main__':
+    unittest.main()
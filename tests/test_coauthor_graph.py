@@ -0,0 +1,143 @@
+#  Copyright 2024 Switch
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from pid_resolver_lib import coauthor_graph
+from pid_resolver_lib.coauthor_graph import build_coauthor_graph, write_coauthor_graph, open_coauthor_graph
+from pid_resolver_lib.pid_analyzer import PublicationInfo, AuthorInfo
+
+A = '0000-0000-0000-000A'
+B = '0000-0000-0000-000B'
+C = '0000-0000-0000-000C'
+D = '0000-0000-0000-000D'
+E = '0000-0000-0000-000E'
+
+
+def _author(orcid):
+    return AuthorInfo('Given', 'Family', orcid, None if orcid is None else 'doi', None)
+
+
+class TestCoauthorGraph(unittest.TestCase):
+
+    def setUp(self):
+        self.publications = [
+            PublicationInfo('10.1/1', 'First', [_author(A), _author(B), _author(None)]),
+            PublicationInfo('10.1/2', 'Second', [_author(B), _author(A), _author(C)]),
+            PublicationInfo('10.1/3', 'Third', [_author(C), _author(D), _author(D)]),
+            PublicationInfo('10.1/4', 'Single', [_author(E)]),
+            PublicationInfo('10.1/5', 'No ORCIDs', [_author(None)])
+        ]
+
+    def _assert_graph(self, graph):
+        assert list(graph.nodes) == [A, B, C, D, E]
+        assert graph.number_of_nodes == 5
+        assert graph.number_of_edges == 4
+
+        assert graph.neighbors(A) == [(B, 2), (C, 1)]
+        assert graph.neighbors(C) == [(A, 1), (B, 1), (D, 1)]
+        # an ORCID assigned to several authors of a publication is counted once
+        assert graph.neighbors(D) == [(C, 1)]
+        assert graph.neighbors(E) == []
+        assert graph.neighbors('0000-0000-0000-0000') == []
+
+        assert graph.degree(C) == 3
+        assert graph.weight(A, B) == 2
+        assert graph.weight(B, A) == 2
+        assert graph.weight(A, D) == 0
+        assert graph.weight(A, '0000-0000-0000-0000') == 0
+
+        assert graph.neighborhood([D], 0) == {D}
+        assert graph.neighborhood([D]) == {C, D}
+        assert graph.neighborhood([D], 2) == {A, B, C, D}
+        assert graph.neighborhood([E, '0000-0000-0000-0000'], 3) == {E}
+
+    def test_build_coauthor_graph(self):
+        self._assert_graph(build_coauthor_graph(self.publications))
+
+    def test_max_authors(self):
+        graph = build_coauthor_graph(self.publications, max_authors=2)
+
+        assert list(graph.nodes) == [A, B, C, D, E]
+        assert graph.neighbors(A) == [(B, 1)]
+        assert graph.neighbors(C) == [(D, 1)]
+
+    def test_write_and_open_coauthor_graph(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            graph_dir = Path(tmp_dir) / 'graph'
+
+            write_coauthor_graph(build_coauthor_graph(self.publications), graph_dir)
+
+            with open_coauthor_graph(graph_dir) as graph:
+                self._assert_graph(graph)
+
+    def test_replace_coauthor_graph(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            graph_dir = Path(tmp_dir) / 'graph'
+
+            write_coauthor_graph(build_coauthor_graph(self.publications), graph_dir)
+
+            with open_coauthor_graph(graph_dir) as graph:
+                write_coauthor_graph(build_coauthor_graph(self.publications[2:]), graph_dir)
+
+                # the opened graph keeps the arrays it mapped
+                self._assert_graph(graph)
+
+                with open_coauthor_graph(graph_dir) as replaced:
+                    assert list(replaced.nodes) == [C, D, E]
+                    assert replaced.neighbors(C) == [(D, 1)]
+
+            # the files of the previous graph are removed
+            assert len(list(graph_dir.iterdir())) == 6
+
+    def test_open_replaced_coauthor_graph(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            graph_dir = Path(tmp_dir) / 'graph'
+
+            write_coauthor_graph(build_coauthor_graph(self.publications), graph_dir)
+
+            open_generation = coauthor_graph._open_generation
+
+            def replace_and_open(*args):
+                # a writer replaces the graph after graph.json has been read
+                if mock_open_generation.call_count == 1:
+                    write_coauthor_graph(build_coauthor_graph(self.publications), graph_dir)
+
+                return open_generation(*args)
+
+            with mock.patch('pid_resolver_lib.coauthor_graph._open_generation', side_effect=replace_and_open) as mock_open_generation:
+                with open_coauthor_graph(graph_dir) as graph:
+                    self._assert_graph(graph)
+
+            assert mock_open_generation.call_count == 2
+
+    def test_empty_graph(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            graph_dir = Path(tmp_dir) / 'graph'
+
+            write_coauthor_graph(build_coauthor_graph([]), graph_dir)
+
+            with open_coauthor_graph(graph_dir) as graph:
+                assert graph.number_of_nodes == 0
+                assert graph.number_of_edges == 0
+                assert graph.neighbors(A) == []
+                assert graph.neighborhood([A]) == set()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -17,19 +17,13 @@ import unittest
 import pid_resolver_lib
 from aioresponses import aioresponses
 import json
+import tempfile
+from pathlib import Path
 import aiohttp
+from pid_resolver_lib.cache_handler import write_records_to_cache
 
 
 class TestDoiRaHandler(unittest.IsolatedAsyncioTestCase):
-    def test_get_registration_agency_prefixes(self):
-
-        dois = ['10.1016/j.jaci.2020.11.032', '10.1038/s41585-020-0355-3', '10.1038/s41585-020-0324-x']
-
-        prefixes = pid_resolver_lib.doi_ra_handler.get_registration_agency_prefixes(dois)
-
-        assert len(prefixes) == 2
-        assert set(prefixes) == set(['10.1016', '10.1038'])
-
     async def test__make_registration_agency_prefix_request(self):
 
         mocked_resp = [{
@@ -49,36 +43,51 @@ class TestDoiRaHandler(unittest.IsolatedAsyncioTestCase):
             assert response['DOI'] == '10.1108'
             assert response['RA'] == 'Crossref'
 
+    async def test__make_registration_agency_prefix_request_memoized(self):
 
+        pid_resolver_lib.memo.RA_MEMO.put(('https://doi.org', '10.5281'), {"DOI": "10.5281", "RA": "DataCite"})
 
-    def test_filter_prefixes_by_registration_agency(self):
+        with aioresponses() as mocked:
+            session = aiohttp.ClientSession()
 
-        doi_ras = [
-            {
-                "DOI": "10.1108",
-                "RA": "Crossref"
-            },
-            {
-                "DOI": "10.2314",
-                "RA": "DataCite"
-            },
-            {
-                "DOI": "10.110",
-                "status": "DOI does not exist"
-            }
-        ]
+            # no request is made for a memoized prefix
+            response = await pid_resolver_lib.doi_ra_handler._make_registration_agency_prefix_request(session, '10.5281')
+
+            await session.close()
+
+            assert response == {"DOI": "10.5281", "RA": "DataCite"}
+            assert len(mocked.requests) == 0
+
+        with aioresponses() as mocked:
+            mocked.get('http://localhost:8000/ra/10.5281', status=200, body=json.dumps([{"DOI": "10.5281", "RA": "Crossref"}]))
+            session = aiohttp.ClientSession()
+
+            # the prefix is memoized per DOI resolver
+            response = await pid_resolver_lib.doi_ra_handler._make_registration_agency_prefix_request(session, '10.5281', 'http://localhost:8000')
+
+            await session.close()
+
+            assert response == {"DOI": "10.5281", "RA": "Crossref"}
 
+    async def test_group_dois_by_ra(self):
+        pid_resolver_lib.memo.RA_MEMO.clear()
 
-        filtered_prefixes = pid_resolver_lib.doi_ra_handler.filter_prefixes_by_registration_agency(doi_ras, 'Crossref')
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache_root = Path(tmp_dir)
+            write_records_to_cache([('10.1038/cached', 'cached')], 0, 1, cache_root / 'Crossref')
 
-        assert len(filtered_prefixes) == 1
-        assert(set(filtered_prefixes)) == set(['10.1108'])
+            with aioresponses() as mocked:
+                mocked.get('https://doi.org/ra/10.1038', status=200, body=json.dumps([{'DOI': '10.1038', 'RA': 'Crossref'}]))
+                mocked.get('https://doi.org/ra/10.1016', status=200, body=json.dumps([{'DOI': '10.1016', 'RA': 'Crossref'}]))
+                mocked.get('https://doi.org/ra/10.5281', status=200, body=json.dumps([{'DOI': '10.5281', 'RA': 'DataCite'}]))
+                mocked.get('https://doi.org/ra/10.9999', status=200, body=json.dumps([{'DOI': '10.9999', 'status': 'Invalid DOI'}]))
 
-    def test_filter_dois_by_prefixes(self):
+                dois = iter(['10.1038/b', '10.5281/zenodo.1', '10.1016/a', '10.1038/cached', '10.9999/x', '10.1038/a', '10.1038/b'])
 
-        dois = ['10.1016/j.jaci.2020.11.032', '10.1038/s41585-020-0355-3', '10.1038/s41585-020-0324-x']
+                # prefixes are resolved in chunks
+                dois_by_ra = await pid_resolver_lib.doi_ra_handler.group_dois_by_ra(dois, cache_root, prefix_chunk_size=2)
 
-        filtered = pid_resolver_lib.doi_ra_handler.filter_dois_by_prefixes(dois, ['10.1038'])
+                assert len(mocked.requests) == 4
 
-        assert len(filtered) == 2
-        assert set(filtered) == set(['10.1038/s41585-020-0355-3', '10.1038/s41585-020-0324-x'])
+        # cached DOIs, duplicates and DOIs of unknown RAs are omitted
+        assert dois_by_ra == {'Crossref': ['10.1038/b', '10.1038/a', '10.1016/a'], 'DataCite': ['10.5281/zenodo.1']}
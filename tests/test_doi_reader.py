@@ -0,0 +1,74 @@
+#  Copyright 2024 Switch
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import io
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from pid_resolver_lib.doi_reader import bucket_dois_by_prefix, canonical_doi, iter_dois, read_doi_file
+
+DOIS = ['10.1016/j.jaci.2020.11.032', '10.1038/s41585-020-0355-3', '10.2196/a,b', '10.1038/s41585-020-0324-x', '10.1016/j.jaci.2020.11.032']
+
+
+class TestDoiReader(unittest.TestCase):
+
+    def test_iter_dois(self):
+        formats = [json.dumps(DOIS), json.dumps(DOIS, indent=2), '\n'.join(map(json.dumps, DOIS)), '\n\n'.join(DOIS) + '\n']
+
+        # elements and lines may be split across chunks
+        for content in formats:
+            for chunk_size in [1, 5, 1000]:
+                assert list(iter_dois(io.StringIO(content), chunk_size)) == DOIS
+
+        # DOIs are normalized, elements that are not DOIs are skipped
+        assert list(iter_dois(io.StringIO('[" 10.1/a\\\\\\\\b ", null, 1.5e3, "10.1/c"]'), 3)) == ['10.1/ab', '10.1/c']
+        assert list(iter_dois(io.StringIO(' []')), ) == []
+        assert list(iter_dois(io.StringIO('')), ) == []
+
+        for invalid in ['["10.1/a", ', '["10.1/a" "10.1/b"]', '["10.1/a",]']:
+            with self.assertRaises(ValueError):
+                list(iter_dois(io.StringIO(invalid), 2))
+
+    def test_read_doi_file(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            doi_file = Path(tmp_dir) / 'dois.txt'
+            doi_file.write_text('\n'.join(DOIS))
+
+            # duplicates are removed
+            assert read_doi_file(doi_file) == DOIS[:-1]
+
+            # spellings of the same DOI are duplicates
+            doi_file.write_text('\n'.join(['10.1000/ABC', 'https://doi.org/10.1000/abc', '10.1000/xyz']))
+
+            assert read_doi_file(doi_file) == ['10.1000/abc', '10.1000/xyz']
+
+    def test_canonical_doi(self):
+        for doi in ['10.1000/abc', '10.1000/ABC', ' 10.1000/Abc ', 'https://doi.org/10.1000/ABC', 'http://dx.doi.org/10.1000/abc',
+                    'DOI:10.1000/abc', 'https://doi.org/10.1000%2FABC', '10.1000/a\\bc']:
+            assert canonical_doi(doi) == '10.1000/abc', doi
+
+        # characters other than the percent-encoded ones are kept
+        assert canonical_doi('10.1002/(SICI)1097-4571%3C1::AID-ASI1%3E3.0.CO;2-#') == '10.1002/(sici)1097-4571<1::aid-asi1>3.0.co;2-#'
+
+    def test_bucket_dois_by_prefix(self):
+        buckets = bucket_dois_by_prefix(iter(DOIS), {'10.1038/s41585-020-0355-3'})
+
+        assert buckets == {'10.1016': ['10.1016/j.jaci.2020.11.032'], '10.1038': ['10.1038/s41585-020-0324-x'], '10.2196': ['10.2196/a,b']}
+
+
+if __name__ == '__main__':
+    unittest.main()
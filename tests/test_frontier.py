@@ -0,0 +1,104 @@
+#  Copyright 2024 Switch
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import unittest
+from unittest import mock
+
+from pid_resolver_lib.frontier import PriorityFrontier, CrawlBudget, BudgetUsage, NO_BUDGET, score_by_depth, combine_scores, score_by_ra_cost
+
+
+class TestPriorityFrontier(unittest.TestCase):
+
+    def _make_frontier(self, budget=NO_BUDGET, score=None):
+        frontier = PriorityFrontier(budget=budget) if score is None else PriorityFrontier(score, budget)
+        frontier.set_seed_orcids(['seed-1', 'seed-2'])
+
+        frontier.add('10.1/peripheral', 2, ['other-1', 'other-2', 'other-3'], 'Crossref')
+        frontier.add('10.1/datacite', 1, ['seed-1'], 'DataCite')
+        frontier.add('10.1/crossref', 1, ['seed-2'], 'Crossref')
+        frontier.add('10.1/cached', 1, ['seed-1'])
+
+        return frontier
+
+    def test_default_score(self):
+        frontier = self._make_frontier()
+
+        # linked seed ORCIDs, then linked ORCIDs, depth and RA cost
+        assert frontier.get_dois() == ['10.1/cached', '10.1/crossref', '10.1/datacite', '10.1/peripheral']
+
+        # a DOI found in another profile accumulates the linked ORCIDs
+        frontier.add('10.1/peripheral', 3, ['seed-1', 'seed-2'])
+        assert frontier.get_dois()[0] == '10.1/peripheral'
+
+        entry = frontier.get_entries()[0]
+        assert entry.depth == 2
+        assert entry.linked_seed_orcids == frozenset(['seed-1', 'seed-2'])
+        assert entry.ra == 'Crossref'
+
+        assert len(frontier.pop()) == 4
+        assert len(frontier) == 0
+        assert frontier.is_exhausted()
+
+    def test_custom_score(self):
+        frontier = self._make_frontier(score=combine_scores(score_by_ra_cost, score_by_depth))
+
+        assert frontier.get_dois() == ['10.1/cached', '10.1/crossref', '10.1/peripheral', '10.1/datacite']
+
+    def test_record_budget(self):
+        frontier = self._make_frontier(CrawlBudget(max_records=3, max_records_per_iteration=2, max_requests_per_ra={}, max_seconds=None))
+
+        assert list(map(lambda entry: entry.doi, frontier.pop())) == ['10.1/cached', '10.1/crossref']
+        assert not frontier.is_exhausted()
+        assert list(map(lambda entry: entry.doi, frontier.pop())) == ['10.1/datacite']
+        assert frontier.is_exhausted()
+        assert frontier.pop() == []
+        assert frontier.get_dois() == ['10.1/peripheral']
+
+    def test_ra_budget(self):
+        frontier = self._make_frontier(CrawlBudget(None, None, {'Crossref': 1, 'DataCite': 0}, None))
+
+        # cached DOIs do not count against the budget of an RA, DOIs of RAs whose budget is used up stay in the frontier
+        assert list(map(lambda entry: entry.doi, frontier.pop())) == ['10.1/cached', '10.1/crossref']
+        assert frontier.get_dois() == ['10.1/datacite', '10.1/peripheral']
+        assert frontier.is_exhausted()
+
+    def test_time_budget(self):
+        with mock.patch('pid_resolver_lib.frontier.time.monotonic', return_value=100):
+            frontier = self._make_frontier(CrawlBudget(None, None, {}, 60))
+
+        with mock.patch('pid_resolver_lib.frontier.time.monotonic', return_value=159):
+            assert not frontier.is_exhausted()
+
+        with mock.patch('pid_resolver_lib.frontier.time.monotonic', return_value=160):
+            assert frontier.is_exhausted()
+            assert frontier.pop() == []
+
+    def test_restore_budget_usage(self):
+        with mock.patch('pid_resolver_lib.frontier.time.monotonic', return_value=100):
+            frontier = self._make_frontier(CrawlBudget(3, None, {'Crossref': 1}, 60))
+
+            # a resumed crawl continues with the budget used before it was interrupted
+            frontier.restore_budget_usage(BudgetUsage(2, {'Crossref': 1}, 50))
+
+            assert frontier.get_budget_usage() == BudgetUsage(2, {'Crossref': 1}, 50)
+            assert list(map(lambda entry: entry.doi, frontier.pop())) == ['10.1/cached']
+            assert frontier.is_exhausted()
+
+        with mock.patch('pid_resolver_lib.frontier.time.monotonic', return_value=110):
+            assert frontier.is_out_of_time()
+
+
+if __name__ == '__main__':
+    unittest.main()
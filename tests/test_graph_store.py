@@ -0,0 +1,123 @@
+#  Copyright 2024 Switch
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import tempfile
+import unittest
+from pathlib import Path
+
+from pid_resolver_lib.coauthor_graph import build_coauthor_graph
+from pid_resolver_lib.graph_store import CoauthorGraphStore, GraphUpdate, get_name_key
+from pid_resolver_lib.infer import infer_orcids, get_affected_dois
+from pid_resolver_lib.pid_analyzer import PublicationInfo, AuthorInfo
+
+A = '0000-0000-0000-000A'
+B = '0000-0000-0000-000B'
+C = '0000-0000-0000-000C'
+D = '0000-0000-0000-000D'
+
+
+def _author(given_name, family_name, orcid=None):
+    return AuthorInfo(given_name, family_name, orcid, None if orcid is None else 'doi', None)
+
+
+class TestCoauthorGraphStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store = CoauthorGraphStore(Path(self.tmp_dir.name) / 'graph.db')
+
+        self.publications = {
+            '10.1/1': PublicationInfo('10.1/1', 'First', [_author('Ann', 'Smith', A), _author('Bob', 'Jones', B)]),
+            '10.1/2': PublicationInfo('10.1/2', 'Second', [_author('Ann', 'Smith'), _author('Bob', 'Jones', B), _author('Carl', 'Miller', C)]),
+            '10.1/3': PublicationInfo('10.1/3', 'Third', [_author('Carl', 'Miller', C), _author('Dora', 'Wu', D)])
+        }
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp_dir.cleanup()
+
+    def _assert_same_graph(self, publications):
+        expected = build_coauthor_graph(publications)
+        graph = self.store.to_coauthor_graph()
+
+        assert list(graph.nodes) == list(expected.nodes)
+        assert list(graph.indptr) == list(expected.indptr)
+        assert list(graph.indices) == list(expected.indices)
+        assert list(graph.weights) == list(expected.weights)
+
+    def test_update_publications(self):
+        assert self.store.update_publications(self.publications.values()) == GraphUpdate(3, 0, 0, 3)
+
+        assert self.store.neighbors(B) == [(A, 1), (C, 1)]
+        assert self.store.neighbors(C) == [(B, 1), (D, 1)]
+        assert self.store.neighborhood([A], 2) == {A, B, C}
+        assert self.store.neighborhood(['0000-0000-0000-0000']) == set()
+        assert self.store.get_dois_of_orcids([B]) == {'10.1/1', '10.1/2'}
+        self._assert_same_graph(self.publications.values())
+
+        changes = self.store.get_changes()
+        assert changes.dois == {'10.1/1', '10.1/2', '10.1/3'}
+        assert changes.orcids == {A, B, C, D}
+        assert get_name_key('Ann', 'Smith') in changes.names
+
+        self.store.clear_changes()
+
+        # only the changed publication is applied, the edge A-C is added and A-B is incremented
+        self.publications['10.1/2'] = PublicationInfo('10.1/2', 'Second', [_author('Ann', 'Smith', A), _author('Bob', 'Jones', B),
+                                                                           _author('Carl', 'Miller', C)])
+
+        assert self.store.update_publications(self.publications.values()) == GraphUpdate(0, 1, 2, 2)
+        assert self.store.neighbors(A) == [(B, 2), (C, 1)]
+        self._assert_same_graph(self.publications.values())
+
+        changes = self.store.get_changes()
+        assert changes.dois == {'10.1/2'}
+        assert changes.orcids == {A, B, C}
+
+        # edges whose weight drops to zero are removed
+        assert self.store.remove_publications(['10.1/2', '10.1/unknown']) == 1
+        del self.publications['10.1/2']
+
+        assert self.store.neighbors(A) == [(B, 1)]
+        assert self.store.neighbors(C) == [(D, 1)]
+        assert self.store.get_dois() == ['10.1/1', '10.1/3']
+        self._assert_same_graph(self.publications.values())
+
+    def test_incremental_inference(self):
+        self.store.update_publications(self.publications.values())
+        self.store.clear_changes()
+        previous = infer_orcids(self.publications)
+
+        # Ann Smith without ORCID shares co-author Bob Jones with Ann Smith in 10.1/1
+        assert previous['10.1/2'].authors[0].orcid == A
+        assert previous['10.1/2'].authors[0].origin_orcid == 'inferred'
+
+        # a new publication with a match by name for Dora Wu
+        self.publications['10.1/4'] = PublicationInfo('10.1/4', 'Fourth', [_author('Dora', 'Wu', D), _author('Carl', 'Miller', C)])
+        self.publications['10.1/5'] = PublicationInfo('10.1/5', 'Fifth', [_author('Dora', 'Wu'), _author('Carl', 'Miller', C)])
+        self.store.update_publications(self.publications.values())
+
+        affected = get_affected_dois(self.publications, self.store.get_changes())
+        assert affected == {'10.1/4', '10.1/5'}
+
+        updated = infer_orcids(self.publications, affected)
+        updated.update({doi: previous[doi] for doi in self.publications if doi not in affected})
+
+        assert updated == infer_orcids(self.publications)
+        assert updated['10.1/5'].authors[0].orcid == D
+
+
+if __name__ == '__main__':
+    unittest.main()
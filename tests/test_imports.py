@@ -0,0 +1,69 @@
+#  Copyright 2024 Switch
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import json
+import subprocess
+import sys
+import unittest
+from typing import Set
+
+# dependencies only needed to fetch, parse or batch match records
+HEAVY_MODULES = ['numpy', 'lxml', 'aiohttp', 'diskcache']
+
+
+def _imported_modules(statement: str) -> Set[str]:
+    """
+    Runs a statement in a new interpreter and returns the modules contained in sys.modules afterwards.
+    """
+
+    process = subprocess.run([sys.executable, '-c', f'import json, sys; {statement}; print(json.dumps(list(sys.modules)))'],
+                             capture_output=True, text=True, check=True)
+
+    return set(json.loads(process.stdout.splitlines()[-1]))
+
+
+class TestImports(unittest.TestCase):
+
+    def test_import_infer(self):
+        modules = _imported_modules('import pid_resolver_lib.infer')
+
+        # inference only reads resolved DOIs
+        assert 'pid_resolver_lib.infer' in modules
+        assert [module for module in HEAVY_MODULES if module in modules] == []
+
+    def test_import_package(self):
+        # names are still exported by the package, their modules are imported on first access
+        assert 'aiohttp' in _imported_modules('import pid_resolver_lib; pid_resolver_lib.ResolvedRecord')
+        assert [module for module in HEAVY_MODULES if module in _imported_modules('import pid_resolver_lib')] == []
+
+    def test_package_exports(self):
+        import pid_resolver_lib
+
+        # the names listed are the names served, star imports and dir() include the re-exported names
+        assert 'ResolvedRecord' in pid_resolver_lib.__all__
+        assert 'json_backend' in dir(pid_resolver_lib)
+        assert set(pid_resolver_lib.__all__) <= set(dir(pid_resolver_lib))
+        assert all(map(lambda name: hasattr(pid_resolver_lib, name), dir(pid_resolver_lib)))
+
+    def test_import_cli(self):
+        # logging is configured by main only
+        process = subprocess.run([sys.executable, '-c', 'import logging, pid_resolver_lib.cli, pid_resolver_lib.infer; print(len(logging.getLogger().handlers))'],
+                                 capture_output=True, text=True, check=True)
+
+        assert process.stdout.strip() == '0'
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+#  Copyright 2024 Switch
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from pid_resolver_lib import infer, json_backend
+from pid_resolver_lib.infer import get_components, infer_orcids, infer_orcids_parallel
+from pid_resolver_lib.pid_analyzer import PublicationInfo, AuthorInfo, parse_resolved_dois_from_json
+
+A = '0000-0000-0000-000A'
+B = '0000-0000-0000-000B'
+C = '0000-0000-0000-000C'
+D = '0000-0000-0000-000D'
+E = '0000-0000-0000-000E'
+
+
+def _author(given_name, family_name, orcid=None):
+    return AuthorInfo(given_name, family_name, orcid, None if orcid is None else 'doi', None)
+
+
+class TestInfer(unittest.TestCase):
+
+    def setUp(self):
+        self.publications = {
+            '10.1/1': PublicationInfo('10.1/1', 'First', [_author('Ann', 'Smith', A), _author('Bob', 'Jones', B)]),
+            '10.1/2': PublicationInfo('10.1/2', 'Second', [_author('Dora', 'Wu', D), _author('Carl', 'Miller', C)]),
+            '10.1/3': PublicationInfo('10.1/3', 'Third', [_author('Ann', 'Smith'), _author('Bob', 'Jones', B), _author('Eve', 'Brown')]),
+            '10.1/4': PublicationInfo('10.1/4', 'Fourth', [_author('Dora', 'Wú'), _author('Carl', 'Miller', C)]),
+            '10.1/5': PublicationInfo('10.1/5', 'Fifth', [_author('Eve', 'Brown'), _author('Finn', 'Lee', E)])
+        }
+
+    def test_get_components(self):
+        # names without ORCID (Eve Brown) do not connect publications
+        assert get_components(self.publications) == [['10.1/1', '10.1/3'], ['10.1/2', '10.1/4'], ['10.1/5']]
+
+        # a publication connecting two components
+        self.publications['10.1/6'] = PublicationInfo('10.1/6', 'Sixth', [_author('Bob', 'Jones'), _author('Dora', 'Wu')])
+
+        assert get_components(self.publications) == [['10.1/1', '10.1/2', '10.1/3', '10.1/4', '10.1/6'], ['10.1/5']]
+
+    def test_infer_orcids_parallel(self):
+        expected = infer_orcids(self.publications)
+
+        assert expected['10.1/3'].authors[0].orcid == A
+        assert expected['10.1/4'].authors[0].orcid == D
+
+        for processes in [1, 2]:
+            updated = infer_orcids_parallel(self.publications, processes=processes, chunk_size=1)
+
+            # the publications are merged in the order of the results
+            assert list(updated.items()) == list(expected.items())
+
+        # only components containing publications to be inferred are inferred
+        updated = infer_orcids_parallel(self.publications, {'10.1/4'}, processes=2, chunk_size=1)
+
+        assert updated == infer_orcids(self.publications, {'10.1/4'})
+        assert updated['10.1/3'] == self.publications['10.1/3']
+        assert updated['10.1/4'].authors[0].orcid == D
+
+    def test_main_incremental(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(tmp_dir.name)
+
+        def run(publications):
+            with open('results.json', 'w') as f:
+                f.write(json_backend.dumps(publications))
+
+            with mock.patch('sys.argv', ['pid_resolver_infer', '-g', 'graph.db', '-p', '1']), mock.patch('logging.basicConfig'):
+                infer.main()
+
+            return parse_resolved_dois_from_json(Path('updated.json'))
+
+        assert run(self.publications)['10.1/3'].authors[0].orcid == A
+
+        # the title changes, but not the authors: the ORCIDs are not inferred again
+        self.publications['10.1/3'] = self.publications['10.1/3']._replace(title='Third (corrected)')
+
+        with mock.patch('pid_resolver_lib.infer.infer_orcids', wraps=infer_orcids) as mock_infer_orcids:
+            updated = run(self.publications)
+
+        assert mock_infer_orcids.call_args.args[1] == set()
+        assert updated['10.1/3'].title == 'Third (corrected)'
+        assert updated['10.1/3'].authors[0] == AuthorInfo('Ann', 'Smith', A, 'inferred', None)
+        assert updated['10.1/4'].authors[0].orcid == D
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+#  Copyright 2024 Switch
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import gzip
+import io
+import json
+import tarfile
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from pid_resolver_lib.cache_handler import get_keys, read_from_cache, write_records_to_cache
+from pid_resolver_lib import ingest
+from pid_resolver_lib.ingest import INGEST_SOURCES, IngestReport, ingest_dump
+from pid_resolver_lib.pid_analyzer import normalize_doi_record_crossref, normalize_doi_record_datacite, normalize_orcid_profile
+from pid_resolver_lib.resolver import Resolver
+
+
+def _add_to_tar(tar: tarfile.TarFile, name: str, content: bytes) -> None:
+    info = tarfile.TarInfo(name)
+    info.size = len(content)
+    tar.addfile(info, io.BytesIO(content))
+
+
+class TestIngest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp_dir.name)
+        self.resolver = Resolver(cache_root=self.root / 'cache')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_ingest_crossref(self):
+        with open('tests/testdata/crossref_rest_test.json') as f:
+            item = json.load(f)['message']['items'][0]
+
+        # a file of the public data file, records contain fields that are not needed
+        dump = self.root / 'crossref'
+        dump.mkdir()
+        with gzip.open(dump / '0.json.gz', 'wt') as f:
+            json.dump({'items': [{**item, 'reference': [{'key': 'ref1'}]}, {'DOI': '10.1/other', 'title': ['Other']}, {'title': ['No DOI']}]}, f)
+
+        report = ingest_dump(dump, INGEST_SOURCES['crossref'], self.resolver.cache_root, ['10.2196/38754'.upper(), 'https://doi.org/10.2196/38754'])
+
+        # records are cached under the canonical DOIs, records without DOI are counted as failed
+        assert report == IngestReport(records=2, ingested=1, cached=0, failed=1)
+        assert get_keys(self.resolver.get_cache_dir('Crossref')) == ['10.2196/38754']
+        assert 'reference' not in json.loads(read_from_cache('10.2196/38754', self.resolver.get_cache_dir('Crossref')))
+
+        with open('tests/testdata/crossref_test.xml') as f:
+            expected = normalize_doi_record_crossref('10.2196/38754', f.read())
+
+        assert self.resolver.analyze(['10.2196/38754'])['10.2196/38754'] == expected
+
+        # ingested DOIs are not fetched
+        assert self.resolver.dois_not_in_cache(['10.2196/38754', '10.1/other']) == ['10.1/other']
+
+    def test_ingest_datacite(self):
+        with open('tests/testdata/datacite_rest_test.json') as f:
+            items = json.load(f)['data']
+
+        lines = '\n'.join(map(json.dumps, items)) + '\n'
+
+        dump = self.root / 'datacite.tar.gz'
+        with tarfile.open(dump, 'w:gz') as tar:
+            _add_to_tar(tar, 'dois/2023-01.jsonl.gz', gzip.compress(lines.encode('utf-8')))
+            _add_to_tar(tar, 'MANIFEST', b'')
+
+        # cached records are kept
+        write_records_to_cache([('10.5281/zenodo.10124944', 'cached')], 0, 1, self.resolver.get_cache_dir('DataCite'))
+
+        report = ingest_dump(dump, INGEST_SOURCES['datacite'], self.resolver.cache_root, batch_size=1)
+
+        assert report == IngestReport(records=2, ingested=1, cached=1, failed=0)
+        assert read_from_cache('10.5281/zenodo.10124944', self.resolver.get_cache_dir('DataCite')) == 'cached'
+
+        with open('tests/testdata/datacite_test.json') as f:
+            expected = normalize_doi_record_datacite('10.5281/zenodo.7908081', f.read())
+
+        assert self.resolver.analyze(['10.5281/zenodo.7908081'])['10.5281/zenodo.7908081'] == expected
+
+        report = ingest_dump(dump, INGEST_SOURCES['datacite'], self.resolver.cache_root, overwrite=True)
+
+        assert report == IngestReport(records=2, ingested=2, cached=0, failed=0)
+        assert read_from_cache('10.5281/zenodo.10124944', self.resolver.get_cache_dir('DataCite')) != 'cached'
+
+    def test_ingest_duplicates(self):
+        dump = self.root / 'crossref.json'
+        with open(dump, 'w') as f:
+            json.dump({'items': [{'DOI': '10.1/A', 'title': ['First']}, {'DOI': '10.1/b', 'title': ['Other']},
+                                 {'DOI': '10.1/a', 'title': ['Second']}]}, f)
+
+        with mock.patch('pid_resolver_lib.ingest.write_records_to_cache', wraps=write_records_to_cache) as mock_write_records_to_cache:
+            report = ingest_dump(dump, INGEST_SOURCES['crossref'], self.resolver.cache_root, overwrite=True)
+
+        # a DOI appearing twice in a batch is written once, the last occurrence wins
+        assert report == IngestReport(records=3, ingested=2, cached=0, failed=0)
+        assert list(map(lambda record: record.rec_id, mock_write_records_to_cache.call_args.args[0])) == ['10.1/a', '10.1/b']
+        assert json.loads(read_from_cache('10.1/a', self.resolver.get_cache_dir('Crossref')))['title'] == ['Second']
+
+    def test_ingest_duplicates_across_batches(self):
+        dump = self.root / 'crossref.json'
+        with open(dump, 'w') as f:
+            json.dump({'items': [{'DOI': '10.1/a', 'title': ['First']}, {'DOI': '10.1/b', 'title': ['Other']},
+                                 {'DOI': '10.1/A', 'title': ['Second']}]}, f)
+
+        with mock.patch('pid_resolver_lib.ingest.write_records_to_cache', wraps=write_records_to_cache) as mock_write_records_to_cache:
+            report = ingest_dump(dump, INGEST_SOURCES['crossref'], self.resolver.cache_root, batch_size=1)
+
+        # a DOI written in an earlier batch is skipped like a cached DOI
+        assert report == IngestReport(records=3, ingested=2, cached=1, failed=0)
+        assert mock_write_records_to_cache.call_count == 2
+        assert json.loads(read_from_cache('10.1/a', self.resolver.get_cache_dir('Crossref')))['title'] == ['First']
+
+    def test_ingest_orcid(self):
+        with open('tests/testdata/orcid_summary_test.xml', 'rb') as f:
+            summary_xml = f.read()
+
+        dump = self.root / 'ORCID_summaries.tar.gz'
+        with tarfile.open(dump, 'w:gz') as tar:
+            _add_to_tar(tar, 'ORCID_summaries/95X/0000-0002-3671-895X.xml', summary_xml)
+            _add_to_tar(tar, 'ORCID_summaries/000/0000-0000-0000-0000.xml', b'<record')
+
+        # ids read from a file, the checksum is lower-cased like a DOI
+        ids_file = self.root / 'orcids.txt'
+        ids_file.write_text('0000-0002-3671-895x\n')
+
+        argv = ['pid_resolver_ingest', '-s', 'orcid', '-k', str(ids_file), '-r', str(self.resolver.cache_root), str(dump)]
+
+        with mock.patch('sys.argv', argv), mock.patch('logging.basicConfig'), mock.patch('builtins.print') as mock_print:
+            ingest.main()
+
+        mock_print.assert_called_once_with(f'{dump}: {IngestReport(records=1, ingested=1, cached=0, failed=1)}')
+
+        with open('tests/testdata/orcid_test.json') as f:
+            expected = normalize_orcid_profile('0000-0002-3671-895X', f.read())
+
+        assert expected is not None
+        assert self.resolver.get_profile_dois(['0000-0002-3671-895X']) == {'0000-0002-3671-895X': expected['dois']}
+        assert self.resolver.orcids_not_in_cache(['0000-0002-3671-895X']) == []
+
+
+if __name__ == '__main__':
+    unittest.main()
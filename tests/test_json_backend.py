@@ -0,0 +1,57 @@
+#  Copyright 2024 Switch
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import io
+import json
+import math
+import unittest
+from unittest import mock
+
+from pid_resolver_lib import json_backend
+from pid_resolver_lib.pid_analyzer import AuthorInfo, PublicationInfo
+
+
+class TestJsonBackend(unittest.TestCase):
+
+    def test_loads(self):
+        with open('tests/testdata/orcid_test.json') as f:
+            orcid_json = f.read()
+
+        assert json_backend.loads(orcid_json) == json.loads(orcid_json)
+        assert json_backend.loads(orcid_json.encode('utf-8')) == json.loads(orcid_json)
+        assert json_backend.load(io.BytesIO(orcid_json.encode('utf-8'))) == json.loads(orcid_json)
+
+        # input rejected by orjson is decoded by the standard library
+        assert math.isnan(json_backend.loads('[NaN]')[0])
+
+        with self.assertRaises(json.JSONDecodeError):
+            json_backend.loads('{')
+
+    def test_dumps(self):
+        pub = PublicationInfo('10.1/a', 'Titel für Tests', [AuthorInfo('Given', 'Family', '0000-0000-0000-0001', 'doi', None)])
+
+        # NamedTuples are encoded as arrays
+        assert json.loads(json_backend.dumps({'10.1/a': pub})) == json.loads(json.dumps({'10.1/a': pub}))
+
+        # integers beyond 64 bit are encoded by the standard library
+        assert json_backend.dumps([2 ** 70]) == json.dumps([2 ** 70])
+
+    def test_dumps_json(self):
+        with mock.patch('pid_resolver_lib.json_backend.orjson', None):
+            assert json_backend.dumps({'a': (1, None)}) == json.dumps({'a': (1, None)})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+#  Copyright 2024 Switch
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import unittest
+
+from pid_resolver_lib.memo import LRUMemo, MemoStats
+
+
+class TestMemo(unittest.TestCase):
+
+    def test_lru_memo_max_entries(self):
+        memo = LRUMemo(max_entries=2, max_size=100)
+
+        memo.put('a', 1)
+        memo.put('b', 2)
+
+        # 'a' becomes the most recently used entry
+        assert memo.get('a') == 1
+
+        memo.put('c', 3)
+
+        assert memo.get('b') is None
+        assert memo.get('a') == 1
+        assert memo.get('c') == 3
+        assert memo.stats() == MemoStats(hits=3, misses=1, evictions=1, entries=2, size=2)
+
+    def test_lru_memo_max_size(self):
+        memo = LRUMemo(max_entries=10, max_size=10)
+
+        memo.put('a', 'aaaaaa', 6)
+        memo.put('b', 'bbbbbb', 6)
+
+        assert memo.get('a') is None
+        assert memo.get('b') == 'bbbbbb'
+
+        # too large to be memoized at all
+        memo.put('c', 'c' * 11, 11)
+
+        assert memo.get('c') is None
+        assert memo.stats().size == 6
+
+    def test_lru_memo_get_or_compute(self):
+        memo = LRUMemo(max_entries=10, max_size=10)
+        computed = []
+
+        def compute():
+            computed.append(1)
+            return 'value'
+
+        assert memo.get_or_compute('a', compute) == 'value'
+        assert memo.get_or_compute('a', compute) == 'value'
+        assert len(computed) == 1
+
+        memo.invalidate('a')
+
+        assert memo.get_or_compute('a', compute) == 'value'
+        assert len(computed) == 2
@@ -0,0 +1,86 @@
+#  Copyright 2024 Switch
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from aioresponses import aioresponses
+
+from pid_resolver_lib.cache_handler import read_from_cache
+from pid_resolver_lib.orcid_works import compact_orcid_profile
+from pid_resolver_lib.pid_analyzer import normalize_orcid_profile
+from pid_resolver_lib.resolver import Resolver
+
+ORCID = '0000-0002-3671-895X'
+
+
+class TestOrcidWorks(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+        with open('tests/testdata/orcid_test.json') as f:
+            self.orcid_json = f.read()
+
+        with open('tests/testdata/orcid_personal_details_test.json') as f:
+            self.personal_details_json = f.read()
+
+        with open('tests/testdata/orcid_works_test.json') as f:
+            self.works_json = f.read()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_compact_orcid_profile(self):
+        compact = compact_orcid_profile(ORCID, json.loads(self.personal_details_json), json.loads(self.works_json))
+
+        # same structure and contents as extracted from the full profile, identifiers of containing works are ignored
+        assert compact == normalize_orcid_profile(ORCID, self.orcid_json)
+        assert normalize_orcid_profile(ORCID, json.dumps(compact)) == compact
+
+        # names that are not public are missing
+        assert compact_orcid_profile(ORCID, {'name': None}, {'group': []}) == \
+            {'id': f'https://orcid.org/{ORCID}', 'givenName': None, 'familyName': None, 'dois': []}
+
+    async def test_expand_orcids(self):
+        resolver = Resolver(cache_root=Path(self.tmp_dir.name), lean_orcid_profiles=True)
+
+        with aioresponses() as mocked:
+            mocked.get(f'https://pub.orcid.org/v3.0/{ORCID}/personal-details', status=200, body=self.personal_details_json)
+            mocked.get(f'https://pub.orcid.org/v3.0/{ORCID}/works', status=200, body=self.works_json)
+            # profiles that cannot be fetched completely are not cached
+            mocked.get('https://pub.orcid.org/v3.0/0000-0000-0000-0000/personal-details', status=200, body=self.personal_details_json)
+            mocked.get('https://pub.orcid.org/v3.0/0000-0000-0000-0000/works', status=404)
+
+            dois = await resolver.expand_orcids([ORCID, '0000-0000-0000-0000'])
+
+        profile = normalize_orcid_profile(ORCID, self.orcid_json)
+
+        assert profile is not None
+        assert dois == profile['dois']
+        assert resolver.orcids_not_in_cache([ORCID, '0000-0000-0000-0000']) == ['0000-0000-0000-0000']
+
+        # the compact profile is cached instead of the responses
+        cached = read_from_cache(ORCID, resolver.orcid_cache_dir)
+        assert len(cached) < len(self.works_json) / 10
+
+        orcids_grouped_by_doi = resolver.get_orcids_grouped_by_doi()
+        assert orcids_grouped_by_doi['10.1093/bib/bby099'][0].family_name == 'Balaur'
+
+
+if __name__ == '__main__':
+    unittest.main()
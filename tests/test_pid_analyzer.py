@@ -13,6 +13,7 @@
 #  limitations under the License.
 #
 
+import hashlib
 import json
 import unittest
 from pathlib import Path
@@ -20,7 +21,8 @@ from typing import List, Dict
 from unittest import mock
 import pid_resolver_lib
 from pid_resolver_lib import PublicationInfo
-from pid_resolver_lib.pid_analyzer import AuthorInfo, OrcidProfile, names_match
+from pid_resolver_lib.memo import ORCID_PROFILE_MEMO
+from pid_resolver_lib.pid_analyzer import AuthorInfo, NameKey, OrcidProfile, names_match
 
 
 class TestPidAnalyzer(unittest.IsolatedAsyncioTestCase):
@@ -151,15 +153,164 @@ class TestPidAnalyzer(unittest.IsolatedAsyncioTestCase):
         with mock.patch('pid_resolver_lib.pid_analyzer.get_keys') as mock_get_keys:
             mock_get_keys.return_value = ['0000-0002-3671-895X']
 
-            with mock.patch('pid_resolver_lib.pid_analyzer.read_from_cache') as mock_read_from_cache:
+            with mock.patch('pid_resolver_lib.pid_analyzer.read_from_cache') as mock_read_from_cache, \
+                    mock.patch('pid_resolver_lib.pid_analyzer.read_records_from_cache') as mock_read_records_from_cache, \
+                    mock.patch('pid_resolver_lib.pid_analyzer.write_records_to_cache') as mock_write_records_to_cache:
                 mock_read_from_cache.side_effect = mock_read_from_cache_def
+                # side store is empty
+                mock_read_records_from_cache.return_value = {}
 
                 dois_per_orcid: List[Dict] = pid_resolver_lib.get_dois_per_orcid(Path())
 
                 assert len(dois_per_orcid) > 0
                 assert dois_per_orcid[0]['id'] == 'https://orcid.org/0000-0002-3671-895X'
+
+                # extracted information has been added to the side store
+                written = mock_write_records_to_cache.mock_calls[0].args
+                assert written[0][0][0] == '0000-0002-3671-895X'
+                assert json.loads(written[0][0][1]) == dois_per_orcid[0]
                 assert set(dois_per_orcid[0]['dois']) == set(['10.52825/cordi.v1i.415', '10.1515/jib-2022-0030', '10.1101/2022.12.17.520865', '10.20944/preprints202212.0209.v1', '10.1038/s41598-021-01618-3', '10.1016/j.jaci.2020.11.032', '10.1038/s41585-020-0355-3', '10.1038/s41585-020-0324-x', '10.1093/bioinformatics/btz969', '10.1515/jib-2019-0022', '10.1093/bib/bby099', '10.1038/s41540-018-0059-y', '10.1186/s12918-018-0556-z', '10.1093/bioinformatics/btw731', '10.1186/s12859-016-1394-x', '10.1089/cmb.2016.0095', '10.1186/s13040-016-0102-8', '10.1007/978-1-4939-3283-2_3', '10.1049/iet-syb.2015.0078', '10.1049/iet-syb.2015.0048', '10.1109/bibm.2014.6999255', '10.1109/bibm.2014.6999256', '10.1109/bibm.2014.6999254', '10.1109/ems.2013.27', '10.1007/s12539-013-0172-y', '10.1007/978-3-319-00395-5_126'])
 
+    def test_get_dois_per_orcid_normalized(self):
+        normalized = {'id': 'https://orcid.org/0000-0002-3671-895X', 'givenName': 'Irina', 'familyName': 'Balaur', 'dois': ['10.52825/cordi.v1i.415']}
+
+        with mock.patch('pid_resolver_lib.pid_analyzer.get_keys') as mock_get_keys, \
+                mock.patch('pid_resolver_lib.pid_analyzer.read_from_cache') as mock_read_from_cache, \
+                mock.patch('pid_resolver_lib.pid_analyzer.read_records_from_cache') as mock_read_records_from_cache:
+            mock_get_keys.return_value = ['0000-0002-3671-895X']
+            mock_read_records_from_cache.return_value = {'0000-0002-3671-895X': json.dumps(normalized)}
+
+            dois_per_orcid: List[Dict] = pid_resolver_lib.get_dois_per_orcid(Path('orcid'))
+
+            assert dois_per_orcid == [normalized]
+            assert mock_read_records_from_cache.mock_calls[0].args[1] == Path('orcid_normalized')
+
+            # raw profile is not read
+            mock_read_from_cache.assert_not_called()
+
+    def test_iter_dois_per_orcid(self):
+        orcids = ['0000-0000-0000-0001', '0000-0000-0000-0002', '0000-0000-0000-0003']
+
+        def mock_read_records_from_cache_def(keys, cache_dir):
+            # the last profile cannot be parsed
+            return {key: json.dumps({'id': key, 'givenName': None, 'familyName': None, 'dois': [key]}) for key in keys if key != orcids[-1]}
+
+        with mock.patch('pid_resolver_lib.pid_analyzer.get_keys') as mock_get_keys, \
+                mock.patch('pid_resolver_lib.pid_analyzer.read_from_cache') as mock_read_from_cache, \
+                mock.patch('pid_resolver_lib.pid_analyzer.read_records_from_cache') as mock_read_records_from_cache, \
+                mock.patch('pid_resolver_lib.pid_analyzer.write_records_to_cache'):
+            mock_get_keys.return_value = orcids
+            mock_read_records_from_cache.side_effect = mock_read_records_from_cache_def
+            mock_read_from_cache.return_value = '{'
+
+            profiles = pid_resolver_lib.iter_dois_per_orcid(Path('orcid'), chunk_size=2)
+
+            # profiles are read chunk by chunk as they are consumed
+            assert next(profiles)['id'] == orcids[0]
+            assert mock_read_records_from_cache.call_count == 1
+
+            assert list(map(lambda profile: profile['id'], profiles)) == orcids[1:2]
+            assert list(map(lambda call: call.args[0], mock_read_records_from_cache.mock_calls)) == [orcids[:2], orcids[2:]]
+
+    def test_normalize_orcid_profile_single_values(self):
+        # works and identifiers may be single objects instead of arrays
+        profile = {'@id': 'https://orcid.org/0000-0000-0000-0001', 'givenName': 'Given',
+                   '@reverse': {'creator': {'@type': 'CreativeWork', 'identifier': {'propertyID': 'doi', 'value': '10.1/a'}}}}
+
+        assert pid_resolver_lib.normalize_orcid_profile('0000-0000-0000-0001', json.dumps(profile)) == \
+            {'id': 'https://orcid.org/0000-0000-0000-0001', 'givenName': 'Given', 'familyName': None, 'dois': ['10.1/a']}
+
+        assert pid_resolver_lib.normalize_orcid_profile('0000-0000-0000-0002', json.dumps({'@id': 'https://orcid.org/0000-0000-0000-0002'}))['dois'] == []
+
+    def test_normalize_orcid_profile_memoized(self):
+        with open('tests/testdata/orcid_test.json') as f:
+            orcid_json = f.read()
+
+        ORCID_PROFILE_MEMO.clear()
+
+        profile = pid_resolver_lib.normalize_orcid_profile('0000-0002-3671-895X', orcid_json)
+
+        assert pid_resolver_lib.normalize_orcid_profile('0000-0002-3671-895X', orcid_json) is profile
+        assert ORCID_PROFILE_MEMO.stats().hits == 1
+
+        # the memo retains the extracted profile, not the JSON
+        assert ORCID_PROFILE_MEMO.stats().size == len(profile['id']) + len(profile['givenName']) + len(profile['familyName']) + sum(map(len, profile['dois']))
+        assert ORCID_PROFILE_MEMO.stats().size < len(orcid_json) / 10
+        assert list(ORCID_PROFILE_MEMO._entries) == [('0000-0002-3671-895X', hashlib.blake2b(orcid_json.encode('utf-8'), digest_size=16).digest())]
+
+        # a changed profile is normalized again
+        changed = json.loads(orcid_json)
+        changed['givenName'] = 'Changed'
+
+        assert pid_resolver_lib.normalize_orcid_profile('0000-0002-3671-895X', json.dumps(changed))['givenName'] == 'Changed'
+
+    def test_normalize_doi_record_crossref(self):
+        with open('tests/testdata/crossref_test.xml') as f:
+            crossref_xml = f.read()
+
+        normalized = pid_resolver_lib.normalize_doi_record_crossref('10.2196/38754', crossref_xml)
+
+        # ORCIDs not contained in the DOI metadata are not assigned
+        assert len(normalized.authors) == 6
+        assert normalized.authors[0].orcid == '0000-0002-5726-7633'
+        assert all(map(lambda auth: auth.orcid is None or auth.origin_orcid == 'doi', normalized.authors))
+
+        # the normalized record survives the JSON round trip of the side store
+        assert pid_resolver_lib.pid_analyzer._publication_info_from_json(json.loads(json.dumps(normalized))) == normalized
+
+    def test_normalize_doi_record_rest(self):
+        with open('tests/testdata/crossref_test.xml') as f:
+            crossref_xml = f.read()
+
+        with open('tests/testdata/crossref_rest_test.json') as f:
+            crossref_item = json.dumps(json.load(f)['message']['items'][0])
+
+        # authors without given or family name are skipped like in the RDF/XML representation
+        expected = pid_resolver_lib.normalize_doi_record_crossref('10.2196/38754', crossref_xml)
+        assert pid_resolver_lib.normalize_doi_record_crossref_rest('10.2196/38754', crossref_item) == expected
+        assert pid_resolver_lib.normalize_doi_record_crossref('10.2196/38754', crossref_item) == expected
+
+        with open('tests/testdata/datacite_rest_test.json') as f:
+            datacite_items = list(map(json.dumps, json.load(f)['data']))
+
+        for datacite_item, (doi, file) in zip(datacite_items, [('10.5281/zenodo.7908081', 'datacite_test.json'),
+                                                               ('10.5281/zenodo.10124944', 'datacite_test_ror.json')]):
+            with open(f'tests/testdata/{file}') as f:
+                expected = pid_resolver_lib.normalize_doi_record_datacite(doi, f.read())
+
+            assert pid_resolver_lib.normalize_doi_record_datacite_rest(doi, datacite_item) == expected
+            assert pid_resolver_lib.normalize_doi_record_datacite(doi, datacite_item) == expected
+
+    def test_match_orcid_profiles(self):
+        pub_info = PublicationInfo(doi='10.5281/zenodo.7908081', title='Initial FAIR assessment in the HeartMed Project', authors=[
+            AuthorInfo(given_name='Irina', family_name='Balaur', orcid=None, origin_orcid=None, ror=None),
+            AuthorInfo(given_name='Soumyabrata', family_name='Ghosh', orcid='0000-0003-0659-6733', origin_orcid='doi', ror=None)
+        ])
+
+        matched = pid_resolver_lib.match_orcid_profiles(pub_info, {'10.5281/zenodo.7908081': [
+            OrcidProfile(id='https://orcid.org/0000-0002-3671-895X', given_name='Irina', family_name='Balaur')]})
+
+        assert matched.authors[0].orcid == '0000-0002-3671-895X'
+        assert matched.authors[0].origin_orcid == 'orcid'
+        assert matched.authors[1] == pub_info.authors[1]
+
+    def test_write_normalized_records(self):
+        with open('tests/testdata/datacite_test.json') as f:
+            datacite_json = f.read()
+
+        with mock.patch('pid_resolver_lib.pid_analyzer.write_records_to_cache') as mock_write_records_to_cache:
+            pid_resolver_lib.write_normalized_records([pid_resolver_lib.ResolvedRecord('10.5281/zenodo.7908081', datacite_json),
+                                                       pid_resolver_lib.ResolvedRecord('10.1/invalid', 'no json')],
+                                                      Path('DataCite'), pid_resolver_lib.normalize_doi_record_datacite)
+
+            args = mock_write_records_to_cache.mock_calls[0].args
+
+            assert args[3] == Path('DataCite_normalized')
+            assert args[0][0][0] == '10.5281/zenodo.7908081'
+            assert json.loads(args[0][0][1])[1] == 'Initial FAIR assessment in the HeartMed Project'
+            # invalid records are stored as null
+            assert args[0][1] == ('10.1/invalid', 'null')
+
     def test_group_dois_per_orcid(self):
         dois_per_orcid = [
             {'id': 'https://orcid.org/0000-0002-3671-895X', 'givenName': 'Irina', 'familyName': 'Balaur', 'dois': ['10.52825/cordi.v1i.415', '10.1515/jib-2022-0030', '10.1101/2022.12.17.520865', '10.20944/preprints202212.0209.v1', '10.1038/s41598-021-01618-3', '10.1016/j.jaci.2020.11.032', '10.1038/s41585-020-0355-3', '10.1038/s41585-020-0324-x', '10.1093/bioinformatics/btz969', '10.1515/jib-2019-0022', '10.1093/bib/bby099', '10.1038/s41540-018-0059-y', '10.1186/s12918-018-0556-z', '10.1093/bioinformatics/btw731', '10.1186/s12859-016-1394-x', '10.1089/cmb.2016.0095', '10.1186/s13040-016-0102-8', '10.1007/978-1-4939-3283-2_3', '10.1049/iet-syb.2015.0078', '10.1049/iet-syb.2015.0048', '10.1109/bibm.2014.6999255', '10.1109/bibm.2014.6999256', '10.1109/bibm.2014.6999254', '10.1109/ems.2013.27', '10.1007/s12539-013-0172-y', '10.1007/978-3-319-00395-5_126']},
@@ -172,6 +323,24 @@ class TestPidAnalyzer(unittest.IsolatedAsyncioTestCase):
         assert len(grouped['10.52825/cordi.v1i.415']) == 2
         assert set(grouped['10.52825/cordi.v1i.415']) == set([OrcidProfile(id='https://orcid.org/0000-0002-3671-895X', given_name='Irina', family_name='Balaur'), OrcidProfile(id='https://orcid.org/0000-0000-0000-0000', given_name='Fictious', family_name='Person')])
 
+    def test_group_dois_per_orcid_canonical(self):
+        dois_per_orcid = [
+            {'id': 'https://orcid.org/0000-0002-3671-895X', 'givenName': 'Irina', 'familyName': 'Balaur', 'dois': ['10.1000/ABC', 'https://doi.org/10.1000/abc']},
+            {'id': 'https://orcid.org/0000-0000-0000-0000', 'givenName': 'Fictious', 'familyName': 'Person', 'dois': ['10.1000/abc', None]}
+        ]
+
+        grouped = pid_resolver_lib.group_orcids_per_doi(dois_per_orcid)
+
+        # spellings of a DOI are grouped under the canonical DOI, each profile is listed once
+        assert list(grouped) == ['10.1000/abc']
+        assert list(map(lambda profile: profile.family_name, grouped['10.1000/abc'])) == ['Balaur', 'Person']
+
+        # publications are matched in any spelling
+        pub_info = PublicationInfo(doi='10.1000/Abc', title=None, authors=[
+            AuthorInfo(given_name='Irina', family_name='Balaur', orcid=None, origin_orcid=None, ror=None)])
+
+        assert pid_resolver_lib.match_orcid_profiles(pub_info, grouped).authors[0].orcid == '0000-0002-3671-895X'
+
     def test_names_match1(self):
         res = names_match('Marc',  'Veldhoen', OrcidProfile(id='https://orcid.org/0000-0002-1478-9562', given_name='Marc', family_name='Veldhoen'))
 
@@ -204,4 +373,62 @@ class TestPidAnalyzer(unittest.IsolatedAsyncioTestCase):
 
         res = names_match('Gianluca', 'Ruggieri', OrcidProfile(id='https://orcid.org/0000-0003-2343-8016', given_name='GIANLUCA', family_name='RUGGIERI'))
 
-        self.assertTrue(res)
\ No newline at end of file
+        self.assertTrue(res)
+
+    def test_names_match_diacritics(self):
+
+        res = names_match('M. Teresa', 'Ortuno', OrcidProfile(id='https://orcid.org/0000-0002-5568-9496', given_name='M. Teresa', family_name='Ortuño'))
+
+        self.assertTrue(res)
+
+    def test_names_match_unicode_forms(self):
+        # NFD (decomposed) vs NFC (composed) form of "Begoña"
+        res = names_match('Bego\u006e\u0303a', 'Vitoriano', OrcidProfile(id='https://orcid.org/0000-0002-3356-6049', given_name='Bego\u00f1a', family_name='Vitoriano'))
+
+        self.assertTrue(res)
+
+    def test_names_match_hyphen(self):
+
+        res = names_match('Irina', 'Balaur', OrcidProfile(id='https://orcid.org/0000-0002-3671-895X', given_name='Irina-Afrodita', family_name='Balaur'))
+
+        self.assertTrue(res)
+
+    def test_names_match_particles(self):
+
+        res = names_match('Maria', 'Di Maio', OrcidProfile(id='https://orcid.org/0000-0002-0833-8247', given_name='Maria Rosaria', family_name='Di Nucci'))
+
+        self.assertFalse(res)
+
+    def test_normalize_name(self):
+        assert pid_resolver_lib.normalize_name(' Jean-Pierre  MÜLLER ') == 'jean pierre muller'
+        assert pid_resolver_lib.normalize_name(None) is None
+
+    def test_make_name_key(self):
+        assert pid_resolver_lib.make_name_key('Maria Rosaria', 'Di Nucci') == NameKey('maria rosaria', 'di nucci', 'nucci', 'maria')
+        assert pid_resolver_lib.make_name_key('Maria', '') is None
+
+    def test_match_name_with_orcid_index(self):
+        profiles = [
+            OrcidProfile(id='https://orcid.org/0000-0002-0833-8247', given_name='Maria Rosaria', family_name='Di Nucci'),
+            OrcidProfile(id='https://orcid.org/0000-0001-8728-7961', given_name='Matteo', family_name='Caldera'),
+            OrcidProfile(id='https://orcid.org/0000-0002-1478-9562', given_name='Marc', family_name='Veldhoen'),
+            OrcidProfile(id='https://orcid.org/0000-0000-0000-0000', given_name='', family_name='Veldhoen')
+        ]
+
+        index = pid_resolver_lib.index_orcid_profiles(profiles)
+
+        # profiles with missing name parts are not indexed
+        assert len(index.by_first_surname['veldhoen']) == 1
+
+        names = [('M.', 'Caldera'), ('Maria', 'Di Nucci'), ('Marc', 'Veldhoen'), ('Marc', 'Veldhoe'), ('M', 'Di'), ('', 'Caldera')]
+
+        for given_name, family_name in names:
+            # the index yields the same result as comparing the author to every profile
+            expected = list(filter(lambda profile: names_match(given_name, family_name, profile), profiles))
+            orcid, origin_orcid = pid_resolver_lib.pid_analyzer._match_name_with_orcid_index(index, given_name, family_name)
+
+            if len(expected) == 1:
+                assert orcid == expected[0].id.rsplit('/', 1)[-1]
+                assert origin_orcid == 'orcid'
+            else:
+                assert orcid is None and origin_orcid is None
\ No newline at end of file
@@ -13,6 +13,7 @@
 #  limitations under the License.
 #
 
+import threading
 import unittest
 from pathlib import Path
 from unittest import mock
@@ -21,6 +22,7 @@ from unittest.mock import AsyncMock, call
 from aioresponses import aioresponses
 import aiohttp
 from pid_resolver_lib import pid_resolver, cache_handler
+from pid_resolver_lib.pid_resolver import ResolvedRecord, RefreshReport
 
 
 class TestPidResolver(unittest.IsolatedAsyncioTestCase):
@@ -37,26 +39,46 @@ class TestPidResolver(unittest.IsolatedAsyncioTestCase):
             assert resp.rec_id == 'one'
             assert resp.content == 'data'
 
+    async def test__make_record_request_not_modified(self):
+        with aioresponses() as mocked:
+            mocked.get('http://example.com/one', status=304, headers={'ETag': '"abc"'})
+            session = aiohttp.ClientSession()
+
+            resp = await pid_resolver._make_record_request(session, 'one', 'http://example.com', 'application/ld+json', {'If-None-Match': '"abc"'})
+
+            await session.close()
+
+            assert resp is not None
+            assert resp.status == 304
+            assert resp.etag == '"abc"'
+
+            # the conditional header has been sent
+            request = list(mocked.requests.values())[0][0]
+            assert request.kwargs['headers']['If-None-Match'] == '"abc"'
+
 
     def test_records_not_in_cache(self):
-        with mock.patch('pid_resolver_lib.pid_resolver.get_keys') as mock_get_keys:
-            mock_get_keys.return_value = ['1', '3', '5']
+        with mock.patch('pid_resolver_lib.pid_resolver.get_contained_keys') as mock_get_contained_keys:
+            mock_get_contained_keys.return_value = {'1', '3'}
 
             not_cached = pid_resolver.records_not_in_cache(['1', '2', '3', '4'], Path('.'))
 
             assert set(not_cached) == set(['2', '4'])
 
-            args = mock_get_keys.mock_calls[0].args
+            args = mock_get_contained_keys.mock_calls[0].args
 
-            assert Path('.') == args[0]
+            # the requested keys are looked up instead of scanning the cache
+            assert ['1', '2', '3', '4'] == args[0]
+            assert Path('.') == args[1]
 
     async def test_fetch_records(self):
 
         # https://medium.com/@durgaswaroop/writing-better-tests-in-python-with-pytest-mock-part-2-92b828e1453c
-        with mock.patch('pid_resolver_lib.pid_resolver.get_keys') as mock_get_keys:
-            mock_get_keys.return_value = ['1']
+        with mock.patch('pid_resolver_lib.pid_resolver.get_contained_keys') as mock_get_contained_keys, \
+                mock.patch('pid_resolver_lib.pid_resolver.write_records_to_cache'), \
+                mock.patch('pid_resolver_lib.pid_resolver._fetch_record_batch', AsyncMock(name='_fetch_record_batch')):
+            mock_get_contained_keys.return_value = {'1'}
 
-            pid_resolver._fetch_record_batch = AsyncMock(name='_fetch_record_batch')
             res = await pid_resolver.fetch_records(['1', '2'], Path(), 'http://example.com/one', '')
 
             assert res is None
@@ -73,3 +95,66 @@ class TestPidResolver(unittest.IsolatedAsyncioTestCase):
             assert args[1] == expected_args[1]
             assert args[2] == expected_args[2]
 
+
+    async def test_fetch_records_write_in_thread(self):
+        fetched_batches = []
+        second_batch_fetched = threading.Event()
+        written = []
+
+        async def mock_fetch_record_batch_def(record_ids, *args, **kwargs):
+            fetched_batches.append(record_ids)
+            if len(fetched_batches) == 2:
+                second_batch_fetched.set()
+            return list(map(lambda rec_id: ResolvedRecord(rec_id, 'content'), record_ids))
+
+        def mock_write_records_to_cache_def(records, key, value, cache_dir):
+            if cache_dir == Path('DataCite') and len(records) > 0:
+                # the next batch is fetched while the first one is written
+                written.append((threading.current_thread().name, second_batch_fetched.wait(5)))
+
+        with mock.patch('pid_resolver_lib.pid_resolver.get_contained_keys') as mock_get_contained_keys, \
+                mock.patch('pid_resolver_lib.pid_resolver.write_records_to_cache', side_effect=mock_write_records_to_cache_def), \
+                mock.patch('pid_resolver_lib.pid_resolver._fetch_record_batch', side_effect=mock_fetch_record_batch_def):
+            mock_get_contained_keys.return_value = set()
+
+            post_fetch = mock.Mock()
+
+            await pid_resolver.fetch_records(['1', '2'], Path('DataCite'), 'http://example.com', '', post_fetch=post_fetch, batch_size=1)
+
+        # all batches have been written when fetch_records returns
+        assert len(written) == 2
+        assert all(map(lambda write: write[0].startswith('cache_writer') and write[1], written))
+        assert post_fetch.call_count == 2
+
+    async def test_refresh_records(self):
+        metadata = {
+            '1': pid_resolver._record_metadata(ResolvedRecord('1', 'one', '"e1"')),
+            '2': pid_resolver._record_metadata(ResolvedRecord('2', 'two', '"e2"')),
+            '3': pid_resolver._record_metadata(ResolvedRecord('3', 'three', '"e3"'))
+        }
+
+        refreshed = [ResolvedRecord('1', '', '"e1"', None, 304), ResolvedRecord('2', 'two', '"e2b"'), ResolvedRecord('3', 'three (updated)', '"e3b"')]
+
+        with mock.patch('pid_resolver_lib.pid_resolver.get_contained_keys') as mock_get_contained_keys, \
+                mock.patch('pid_resolver_lib.pid_resolver.read_records_from_cache') as mock_read_records_from_cache, \
+                mock.patch('pid_resolver_lib.pid_resolver.write_records_to_cache') as mock_write_records_to_cache, \
+                mock.patch('pid_resolver_lib.pid_resolver._fetch_record_batch', AsyncMock(return_value=refreshed)) as mock_fetch_record_batch:
+            mock_get_contained_keys.return_value = {'1', '2', '3'}
+            mock_read_records_from_cache.return_value = metadata
+
+            post_fetch = mock.Mock()
+
+            report = await pid_resolver.refresh_records(['1', '2', '3', '4', '5'], Path('DataCite'), 'http://example.com', '', post_fetch=post_fetch)
+
+            # uncached records are not refreshed
+            assert report == RefreshReport(requested=3, not_modified=1, unchanged=1, changed=1, failed=0)
+
+            # stored metadata are used for conditional requests
+            assert mock_fetch_record_batch.mock_calls[0].args[3]['1']['etag'] == '"e1"'
+
+            # only the changed record is rewritten
+            assert mock_write_records_to_cache.mock_calls[0].args[0] == [refreshed[2]]
+            assert mock_write_records_to_cache.mock_calls[0].args[3] == Path('DataCite')
+            assert mock_write_records_to_cache.mock_calls[1].args[3] == Path('DataCite_meta')
+
+            post_fetch.assert_called_once_with([refreshed[2]], Path('DataCite'))
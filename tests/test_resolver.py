@@ -0,0 +1,145 @@
+#  Copyright 2024 Switch
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from aioresponses import aioresponses
+
+from pid_resolver_lib import cache_handler
+from pid_resolver_lib.cache_handler import get_keys, get_normalized_cache_dir, write_records_to_cache
+from pid_resolver_lib.pid_analyzer import RECORD_NORMALIZERS, write_normalized_records
+from pid_resolver_lib.pid_resolver import ResolvedRecord
+from pid_resolver_lib.resolver import Resolver
+
+
+class TestResolver(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+        with open('tests/testdata/datacite_test.json') as f:
+            self.datacite_json = f.read()
+
+        with open('tests/testdata/orcid_test.json') as f:
+            self.orcid_json = f.read()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    async def test_resolve(self):
+        resolver = Resolver(cache_root=Path(self.tmp_dir.name), concurrency=2)
+
+        with aioresponses() as mocked:
+            mocked.get('https://doi.org/ra/10.5281', status=200, body=json.dumps([{'DOI': '10.5281', 'RA': 'DataCite'}]))
+            mocked.get('https://doi.org/10.5281/zenodo.7908081', status=200, body=self.datacite_json)
+
+            pubs = [pub async for pub in resolver.resolve(['10.5281/zenodo.7908081'])]
+
+        assert len(pubs) == 1
+        assert pubs[0].title == 'Initial FAIR assessment in the HeartMed Project'
+        assert pubs[0].authors[0].orcid == '0000-0002-3671-895X'
+
+        # all caches are created below the cache root
+        assert (Path(self.tmp_dir.name) / 'DataCite').is_dir()
+        assert (Path(self.tmp_dir.name) / 'DataCite_normalized').is_dir()
+
+        assert resolver.dois_not_in_cache(['10.5281/zenodo.7908081', '10.1/unknown']) == ['10.1/unknown']
+
+    async def test_pinned_concurrent_requests(self):
+        resolver = Resolver(cache_root=Path(self.tmp_dir.name))
+        cache_dir = resolver.get_cache_dir('DataCite')
+
+        with resolver.pinned(['10.1/a', '10.1/b'], ['DataCite']):
+            with resolver.pinned(['10.1/a'], ['DataCite']):
+                pass
+
+            # the completed request does not remove the pin of the pending one
+            assert '10.1/a' in cache_handler._pinned_records[str(cache_dir)]
+            assert '10.1/a' in cache_handler._pinned_records[str(get_normalized_cache_dir(cache_dir))]
+
+        assert cache_handler._pinned_records[str(cache_dir)] == {}
+
+    async def test_resolve_canonical_dois(self):
+        resolver = Resolver(cache_root=Path(self.tmp_dir.name))
+
+        with aioresponses() as mocked:
+            mocked.get('https://doi.org/ra/10.5281', status=200, body=json.dumps([{'DOI': '10.5281', 'RA': 'DataCite'}]))
+            mocked.get('https://doi.org/10.5281/zenodo.7908081', status=200, body=self.datacite_json)
+
+            # spellings of the same DOI are fetched once
+            pubs = [pub async for pub in resolver.resolve(['10.5281/ZENODO.7908081', 'https://doi.org/10.5281/zenodo.7908081'])]
+
+            # the RA of the prefix may be memoized
+            record_requests = [calls for (method, url), calls in mocked.requests.items() if not url.path.startswith('/ra/')]
+            assert list(map(len, record_requests)) == [1]
+
+        assert list(map(lambda pub: pub.doi, pubs)) == ['10.5281/zenodo.7908081']
+        assert get_keys(resolver.get_cache_dir('DataCite')) == ['10.5281/zenodo.7908081']
+        assert resolver.dois_not_in_cache(['10.5281/Zenodo.7908081']) == []
+
+    async def test_migrate_doi_caches(self):
+        resolver = Resolver(cache_root=Path(self.tmp_dir.name))
+        cache_dir = resolver.get_cache_dir('DataCite')
+
+        # a cache written before DOIs were canonicalized
+        records = [ResolvedRecord('10.5281/ZENODO.7908081', self.datacite_json), ResolvedRecord('10.5281/Zenodo.7908081', self.datacite_json)]
+        write_records_to_cache(records, 0, 1, cache_dir)
+        write_normalized_records(records, cache_dir, RECORD_NORMALIZERS['DataCite'])
+
+        assert resolver.migrate_doi_caches() == {'DataCite': 2, 'Crossref': 0, 'mEDRA': 0}
+
+        assert get_keys(cache_dir) == ['10.5281/zenodo.7908081']
+        assert get_keys(get_normalized_cache_dir(cache_dir)) == []
+
+        # records are normalized again with the canonical DOI
+        pubs = resolver.analyze()
+        assert list(pubs) == ['10.5281/zenodo.7908081']
+        assert pubs['10.5281/zenodo.7908081'].doi == '10.5281/zenodo.7908081'
+
+    async def test_expand_orcids(self):
+        resolver = Resolver(cache_root=Path(self.tmp_dir.name))
+
+        with aioresponses() as mocked:
+            mocked.get('https://orcid.org/0000-0002-3671-895X', status=200, body=self.orcid_json)
+
+            dois = await resolver.expand_orcids(['0000-0002-3671-895X'])
+
+        assert '10.1093/bib/bby099' in dois
+        assert len(dois) == len(set(dois))
+
+        # the profile is cached, no further request is made
+        with aioresponses() as mocked:
+            assert await resolver.expand_orcids(['0000-0002-3671-895X']) == dois
+            assert len(mocked.requests) == 0
+
+        profile_dois = resolver.get_profile_dois(['0000-0002-3671-895X', '0000-0000-0000-0000'])
+        assert list(profile_dois) == ['0000-0002-3671-895X']
+        assert set(profile_dois['0000-0002-3671-895X']) == set(dois)
+
+    async def test_get_ras(self):
+        resolver = Resolver(cache_root=Path(self.tmp_dir.name))
+
+        with aioresponses() as mocked:
+            mocked.get('https://doi.org/ra/10.5281', status=200, body=json.dumps([{'DOI': '10.5281', 'RA': 'DataCite'}]))
+            mocked.get('https://doi.org/10.5281/zenodo.7908081', status=200, body=self.datacite_json)
+            mocked.get('https://doi.org/ra/10.1093', status=200, body=json.dumps([{'DOI': '10.1093', 'RA': 'Crossref'}]))
+
+            await resolver.fetch_dois(['10.5281/zenodo.7908081'])
+
+            # cached DOIs are not requested again
+            assert await resolver.get_ras(['10.5281/zenodo.7908081', '10.1093/bib/bby099']) == {'10.1093/bib/bby099': 'Crossref'}
@@ -0,0 +1,133 @@
+#  Copyright 2024 Switch
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import asyncio
+import json
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from aiohttp.test_utils import TestClient, TestServer
+from aioresponses import aioresponses
+from yarl import URL
+
+from pid_resolver_lib.memo import clear_memos
+from pid_resolver_lib.resolver import Resolver
+from pid_resolver_lib.service import ResolverService, ServiceStats
+
+
+class TestResolverService(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        clear_memos()
+
+        with open('tests/testdata/datacite_test.json') as f:
+            self.datacite_json = f.read()
+
+        with open('tests/testdata/orcid_test.json') as f:
+            self.orcid_json = f.read()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    async def test_coalesce_concurrent_requests(self):
+        service = ResolverService(Resolver(cache_root=Path(self.tmp_dir.name)))
+
+        with aioresponses() as mocked:
+            mocked.get('https://doi.org/ra/10.5281', status=200, body=json.dumps([{'DOI': '10.5281', 'RA': 'DataCite'}]))
+            mocked.get('https://doi.org/10.5281/zenodo.7908081', status=200, body=self.datacite_json)
+
+            first, second = await asyncio.gather(service.resolve_dois(['10.5281/zenodo.7908081']),
+                                                 service.resolve_dois(['10.5281/zenodo.7908081', '10.5281/zenodo.7908081']))
+
+            # a single upstream request was made
+            assert len(mocked.requests[('GET', URL('https://doi.org/10.5281/zenodo.7908081'))]) == 1
+
+        assert first == second
+        assert first['10.5281/zenodo.7908081'].title == 'Initial FAIR assessment in the HeartMed Project'
+        assert service.stats == ServiceStats(requests=2, coalesced=1, fetches=1)
+
+        # the fetch is no longer in flight, the next request is served from the cache
+        with aioresponses() as mocked:
+            assert await service.resolve_dois(['10.5281/zenodo.7908081']) == first
+            assert len(mocked.requests) == 0
+
+    async def test_analyze_in_thread(self):
+        resolver = Resolver(cache_root=Path(self.tmp_dir.name))
+        service = ResolverService(resolver)
+
+        threads = []
+
+        def analyze(dois, orcids_grouped_by_doi):
+            threads.append(threading.current_thread())
+            return {}
+
+        with mock.patch.object(resolver, 'fetch_dois', mock.AsyncMock()), mock.patch.object(resolver, 'analyze', side_effect=analyze):
+            assert await service.resolve_dois(['10.5281/zenodo.7908081']) == {}
+
+        # the event loop keeps serving other requests while a fetch is analyzed
+        assert threads != [threading.current_thread()]
+        assert len(threads) == 1
+
+    async def test_orcid_index_is_extended(self):
+        service = ResolverService(Resolver(cache_root=Path(self.tmp_dir.name)))
+
+        # the index is read from the (empty) cache
+        assert service._get_orcid_index() == {}
+
+        with aioresponses() as mocked:
+            mocked.get('https://orcid.org/0000-0002-3671-895X', status=200, body=self.orcid_json)
+
+            profiles = await service.resolve_orcids(['0000-0002-3671-895X'])
+
+        assert '10.1093/bib/bby099' in profiles['0000-0002-3671-895X']['dois']
+        assert service._get_orcid_index()['10.1093/bib/bby099'][0].id == 'https://orcid.org/0000-0002-3671-895X'
+
+    async def test_http_routes(self):
+        service = ResolverService(Resolver(cache_root=Path(self.tmp_dir.name)))
+
+        async with TestClient(TestServer(service.make_app())) as client:
+            assert service.resolver.session is not None
+
+            with aioresponses(passthrough=[str(client.make_url(''))]) as mocked:
+                mocked.get('https://doi.org/ra/10.5281', status=200, body=json.dumps([{'DOI': '10.5281', 'RA': 'DataCite'}]))
+                mocked.get('https://doi.org/10.5281/zenodo.7908081', status=200, body=self.datacite_json)
+
+                response = await client.get('/doi/10.5281/zenodo.7908081')
+                assert response.status == 200
+                pub = await response.json()
+                assert pub[0] == '10.5281/zenodo.7908081'
+
+                response = await client.post('/dois', json=['10.5281/zenodo.7908081', '10.5281/unknown'])
+                assert list((await response.json()).keys()) == ['10.5281/zenodo.7908081']
+
+                response = await client.get('/doi/10.5281/unknown')
+                assert response.status == 404
+
+                response = await client.post('/dois', json={'doi': '10.5281/zenodo.7908081'})
+                assert response.status == 400
+
+                response = await client.get('/stats')
+                assert (await response.json())['service']['requests'] == 4
+
+        # the session is closed on cleanup
+        assert service.resolver.session is None
+
+
+if __name__ == '__main__':
+    unittest.main()
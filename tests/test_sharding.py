@@ -0,0 +1,152 @@
+#  Copyright 2024 Switch
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import asyncio
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from aioresponses import aioresponses
+
+from pid_resolver_lib.cache_handler import get_keys, write_record_to_cache
+from pid_resolver_lib.resolver import Resolver
+from pid_resolver_lib.sharding import WorkQueue, QueueConfig, shard_of, get_shard_dir, run_worker, merge_shards, DOI, ORCID
+
+
+class TestWorkQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.queue = WorkQueue(Path(self.tmp_dir.name) / 'queue.db')
+        self.queue.initialize(QueueConfig(number_of_shards=2, number_of_iterations=1))
+
+    def tearDown(self):
+        self.queue.close()
+        self.tmp_dir.cleanup()
+
+    def test_shard_of(self):
+        assert shard_of('10.5281/zenodo.7908081', 4) == shard_of('10.5281/zenodo.7908081', 4)
+        assert set(map(lambda idx: shard_of(f'10.1/{idx}', 4), range(100))) == {0, 1, 2, 3}
+
+    def test_initialize_twice(self):
+        with self.assertRaises(ValueError):
+            self.queue.initialize(QueueConfig(number_of_shards=3, number_of_iterations=1))
+
+        assert self.queue.get_config() == QueueConfig(number_of_shards=2, number_of_iterations=1)
+
+    def test_claim_and_complete(self):
+        dois = list(map(lambda idx: f'10.1/{idx}', range(10)))
+
+        assert self.queue.enqueue(DOI, dois, 1) == 10
+        # PIDs are queued once over the whole crawl
+        assert self.queue.enqueue(DOI, dois, 2) == 0
+
+        claimed = self.queue.claim(DOI, 0, 1, 100)
+        assert set(claimed) == set(filter(lambda doi: shard_of(doi, 2) == 0, dois))
+        assert self.queue.claim(DOI, 0, 1, 100) == []
+
+        self.queue.complete(DOI, claimed, claimed[:1])
+        assert self.queue.count_unfinished(DOI, 1) == 10 - len(claimed)
+        assert self.queue.count_by_status()['failed'] == 1
+
+    def test_release_claims(self):
+        self.queue.enqueue(ORCID, ['0000-0002-3671-895X'], 1)
+        shard = shard_of('0000-0002-3671-895X', 2)
+
+        assert self.queue.claim(ORCID, shard, 1, 10) == ['0000-0002-3671-895X']
+        assert self.queue.release_claims(shard) == 1
+        assert self.queue.claim(ORCID, shard, 1, 10) == ['0000-0002-3671-895X']
+
+
+class TestShardedCrawl(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_root = Path(self.tmp_dir.name)
+
+        with open('tests/testdata/datacite_test.json') as f:
+            self.datacite_json = f.read()
+
+        with open('tests/testdata/orcid_test.json') as f:
+            self.orcid_json = f.read()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    async def test_run_workers_and_merge(self):
+        queue = WorkQueue(self.cache_root / 'queue.db')
+        queue.initialize(QueueConfig(number_of_shards=2, number_of_iterations=1))
+        queue.enqueue(DOI, ['10.5281/zenodo.7908081'], 1)
+
+        with aioresponses() as mocked:
+            mocked.get('https://doi.org/ra/10.5281', status=200, body=json.dumps([{'DOI': '10.5281', 'RA': 'DataCite'}]))
+            mocked.get('https://doi.org/10.5281/zenodo.7908081', status=200, body=self.datacite_json)
+            mocked.get('https://orcid.org/0000-0002-3671-895X', status=200, body=self.orcid_json)
+
+            await asyncio.gather(run_worker(queue, 0, self.cache_root, poll_interval=0.01),
+                                 run_worker(queue, 1, self.cache_root, poll_interval=0.01))
+
+        # each shard wrote to its own caches
+        doi_shard = shard_of('10.5281/zenodo.7908081', 2)
+        orcid_shard = shard_of('0000-0002-3671-895X', 2)
+        assert (get_shard_dir(self.cache_root, doi_shard) / 'DataCite').is_dir()
+        assert (get_shard_dir(self.cache_root, orcid_shard) / 'orcid').is_dir()
+
+        # the DOIs listed in the ORCID profile are queued for the next iteration
+        assert queue.count_unfinished(DOI, 2) > 0
+        assert queue.count_unfinished(DOI, 1) == 0
+        assert queue.count_unfinished(ORCID, 1) == 0
+
+        resolved_dois = merge_shards(self.cache_root, 2)
+
+        assert list(resolved_dois.keys()) == ['10.5281/zenodo.7908081']
+        assert resolved_dois['10.5281/zenodo.7908081'].authors[0].orcid == '0000-0002-3671-895X'
+
+        queue.close()
+
+    async def test_run_worker_scans_caches_once(self):
+        queue = WorkQueue(self.cache_root / 'queue.db')
+        queue.initialize(QueueConfig(number_of_shards=1, number_of_iterations=1))
+        queue.enqueue(DOI, ['10.5281/zenodo.7908081', '10.1/unknown'], 1)
+
+        resolver = Resolver(cache_root=get_shard_dir(self.cache_root, 0))
+
+        # the DOI has been cached before the worker was restarted
+        write_record_to_cache('10.5281/zenodo.7908081', self.datacite_json, resolver.get_cache_dir('DataCite'))
+
+        with aioresponses() as mocked, \
+                mock.patch('pid_resolver_lib.sharding.get_keys', side_effect=get_keys) as mock_get_keys, \
+                mock.patch.object(resolver, 'dois_not_in_cache', wraps=resolver.dois_not_in_cache) as mock_dois_not_in_cache:
+            mocked.get('https://doi.org/ra/10.1', status=200, body=json.dumps([{'DOI': '10.1', 'status': 'Invalid DOI'}]))
+            mocked.get('https://orcid.org/0000-0002-3671-895X', status=200, body=self.orcid_json)
+
+            await run_worker(queue, 0, self.cache_root, batch_size=1, poll_interval=0.01, resolver=resolver)
+
+        # once per cache of the shard, not per batch
+        assert mock_get_keys.call_count == 4
+
+        # only the DOI not cached before is looked up
+        assert sorted(map(lambda call: call.args[0], mock_dois_not_in_cache.call_args_list)) == [[], ['10.1/unknown']]
+
+        assert queue.count_unfinished(DOI, 1) == 0
+        assert queue.count_unfinished(ORCID, 1) == 0
+
+        queue.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
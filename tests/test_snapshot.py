@@ -0,0 +1,96 @@
+#  Copyright 2024 Switch
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import json
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from pid_resolver_lib.pid_analyzer import PublicationInfo, AuthorInfo
+from pid_resolver_lib.snapshot import write_snapshot, open_snapshot, load_resolved_dois, get_snapshot_file
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.results_json = Path(self.tmp_dir.name) / 'results.json'
+
+        self.resolved_dois = {
+            '10.3390/math8040648': PublicationInfo('10.3390/math8040648', 'Supported Evacuation for Disaster Relief', [
+                AuthorInfo('Begoña', 'Vitoriano', '0000-0002-3356-6049', 'doi', None),
+                AuthorInfo('M. Teresa', 'Ortuño', None, None, ['https://ror.org/02p0gd045', 'https://ror.org/00s6t1f81']),
+                AuthorInfo('Gregorio', 'Tirado', '0000-0002-1871-7822', 'orcid', [])
+            ]),
+            '10.1/untitled': PublicationInfo('10.1/untitled', None, []),
+            '10.1/other': PublicationInfo('10.1/other', 'Other', [AuthorInfo('M. Teresa', 'Ortuño', None, None, None)])
+        }
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_write_and_open_snapshot(self):
+        snapshot_file = get_snapshot_file(self.results_json)
+        assert snapshot_file.name == 'results.snapshot'
+
+        write_snapshot(self.resolved_dois, snapshot_file)
+
+        with open_snapshot(snapshot_file) as snapshot:
+            assert len(snapshot) == 3
+            assert list(snapshot) == list(self.resolved_dois)
+            assert snapshot['10.3390/math8040648'] == self.resolved_dois['10.3390/math8040648']
+            assert snapshot['10.1/untitled'].title is None
+            assert '10.1/unknown' not in snapshot
+
+            with self.assertRaises(KeyError):
+                snapshot['10.1/unknown']
+
+            assert snapshot.to_dict() == self.resolved_dois
+
+    def test_snapshot_equals_json(self):
+        with open(self.results_json, 'w') as f:
+            f.write(json.dumps(self.resolved_dois))
+
+        # no snapshot has been written
+        from_json = load_resolved_dois(self.results_json)
+        assert from_json == self.resolved_dois
+
+        write_snapshot(from_json, get_snapshot_file(self.results_json))
+
+        assert load_resolved_dois(self.results_json) == from_json
+
+    def test_outdated_snapshot_is_ignored(self):
+        write_snapshot({'10.1/other': self.resolved_dois['10.1/other']}, get_snapshot_file(self.results_json))
+
+        with open(self.results_json, 'w') as f:
+            f.write(json.dumps(self.resolved_dois))
+
+        # results.json has been written after the snapshot
+        snapshot_stat = get_snapshot_file(self.results_json).stat()
+        os.utime(self.results_json, (snapshot_stat.st_atime + 10, snapshot_stat.st_mtime + 10))
+
+        assert load_resolved_dois(self.results_json) == self.resolved_dois
+
+    def test_not_a_snapshot(self):
+        with open(self.results_json, 'w') as f:
+            f.write(json.dumps(self.resolved_dois))
+
+        with self.assertRaises(ValueError):
+            open_snapshot(self.results_json)
+
+
+if __name__ == '__main__':
+    unittest.main()